@@ -2,7 +2,22 @@
 from flask import Flask
 from flask_migrate import Migrate
 from config import Config
-from app.extensions import db, login_manager, mail
+from app.extensions import db, login_manager, mail, fragment_cache, user_cache
+from app.template_cache import init_template_cache
+from app.session_store import init_session_store
+from app.assets import init_assets
+from app.compression import init_compression
+from app.mail_dispatch import mail_dispatcher
+from app.product_search import product_index
+from app.analytics import return_analytics
+from app.utils import currency_filter
+from app import (  # noqa: F401 (registers ORM events)
+    change_tracking,
+    outbox,
+    search_index,
+    stock_ledger,
+    return_matching,
+)
 from app.routes import (
     auth_bp,
     main_bp,
@@ -10,7 +25,10 @@ from app.routes import (
     return_bp,
     product_bp,
     supermarket_bp,
-    report_bp
+    report_bp,
+    outbox_bp,
+    search_bp,
+    stock_bp
 )
 from flask_wtf.csrf import CSRFProtect
 
@@ -19,14 +37,24 @@ def create_app(config_class=Config):
     """Create and configure the Flask application."""
     app = Flask(__name__)
     app.config.from_object(config_class)
+    init_template_cache(app)
+    init_session_store(app)
 
     # Initialize Flask extensions
     db.init_app(app)
     login_manager.init_app(app)
+    user_cache.init_app(app)
     mail.init_app(app)
+    fragment_cache.init_app(app)
+    mail_dispatcher.init_app(app)
+    product_index.init_app(app)
+    return_analytics.init_app(app)
     Migrate(app, db)
     csrf = CSRFProtect()
     csrf.init_app(app)
+    app.add_template_filter(currency_filter, 'currency')
+    init_assets(app)
+    init_compression(app)
 
     # Register blueprints
     app.register_blueprint(auth_bp)
@@ -36,6 +64,9 @@ def create_app(config_class=Config):
     app.register_blueprint(product_bp)
     app.register_blueprint(supermarket_bp)
     app.register_blueprint(report_bp)
+    app.register_blueprint(outbox_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(stock_bp)
 
     return app
 
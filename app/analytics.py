@@ -0,0 +1,511 @@
+"""Return-rate analytics per product, location and delivery month.
+
+Delivery and return rows are fetched with plain Core queries and read
+from the cursor straight into NumPy arrays, never as ORM objects. Headers
+are fetched once and joined to their items with a sorted id lookup in
+NumPy, so the large item queries return only integers. The figures are
+summed with pandas group-bys into one row per (product, supermarket, subchain, month):
+- delivered and returned quantities and values
+- the return rate
+- the average days between delivery and return
+- the value at risk, i.e. the value of the goods that came back
+
+Months moved to the archive files count too: a full build reads them
+through ``archive.attached()``. Archiving moves whole delivery/return
+groups, so the figures do not change when a month is archived.
+
+The aggregate frame is cached per process. The outbox event id serves as
+the data version. When only new deliveries and returns arrived since the
+last build, just their items are fetched and added to the frame. Any
+edit or delete triggers a full rebuild in the background. So does the
+first build, and empty figures are served until it is done.
+
+A full build covers exactly the outbox events up to the id it read
+first: rows created by later events are left out of its queries and
+added afterwards like any other new rows, so writes during a build need
+no second build. This relies on outbox ids growing in commit order,
+which holds for SQLite's single writer.
+"""
+import logging
+from threading import Lock, Thread
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import String, cast, func, select
+
+from app import archive
+from app.extensions import db
+from app.models import (
+    Delivery,
+    DeliveryItem,
+    OutboxEvent,
+    Product,
+    Return,
+    ReturnItem,
+    Subchain,
+    Supermarket,
+)
+
+KEY = ['product_id', 'supermarket_id', 'subchain_id', 'month']
+
+SUMS = ['delivered', 'delivered_value', 'returned', 'returned_value', 'lag_total']
+
+FETCH_SIZE = 100000
+
+SORT_COLUMNS = ('value_at_risk', 'return_rate', 'returned', 'delivered', 'avg_lag_days')
+
+
+def fetch_columns(connection, statement, dtypes):
+    """
+    Run a query and return its columns as NumPy arrays
+
+    Rows are read straight from the DBAPI cursor into a structured array,
+    skipping SQLAlchemy's per-row result processing, so casts in the query
+    must already produce the plain values the dtypes expect.
+    """
+    dtype = np.dtype([(f'f{index}', kind) for index, kind in enumerate(dtypes)])
+    cursor = connection.execute(statement).cursor
+    parts = []
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        parts.append(np.fromiter(rows, dtype=dtype, count=len(rows)))
+    data = np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+    return [data[name] for name in dtype.names]
+
+
+def _days(values):
+    """ISO date strings to datetime64[D]; parses each distinct date once"""
+    unique, inverse = np.unique(values, return_inverse=True)
+    return unique.astype('datetime64[D]')[inverse]
+
+
+def _lookup(header_ids, parent_ids):
+    """Position of each item's parent in the sorted header id array"""
+    positions = np.searchsorted(header_ids, parent_ids)
+    positions[positions >= len(header_ids)] = 0
+    return positions
+
+
+def _created_after(entity, event_id):
+    """Ids of the rows the outbox saw created after an event"""
+    outbox = OutboxEvent.__table__
+    return select(outbox.c.entity_id).where(
+        outbox.c.id > event_id, outbox.c.entity == entity, outbox.c.action == 'created'
+    )
+
+
+def _delivery_frame(connection, ids=None, delivery=Delivery.__table__,
+                    item=DeliveryItem.__table__, until=None):
+
+    headers = select(
+        delivery.c.id,
+        delivery.c.supermarket_id,
+        func.coalesce(delivery.c.subchain_id, 0),
+        cast(delivery.c.delivery_date, String),
+    ).order_by(delivery.c.id)
+    items = select(
+        item.c.delivery_id, item.c.product_id, item.c.quantity, item.c.price_cents
+    )
+    if ids is not None:
+        headers = headers.where(delivery.c.id.in_(ids))
+        items = items.where(item.c.delivery_id.in_(ids))
+    if until is not None:
+        newer = _created_after(Delivery.__tablename__, until)
+        headers = headers.where(delivery.c.id.not_in(newer))
+        items = items.where(item.c.delivery_id.not_in(newer))
+
+    header_id, supermarket_id, subchain_id, day = fetch_columns(
+        connection, headers, ['int64', 'int64', 'int64', 'U10']
+    )
+    parent, product_id, quantity, price_cents = fetch_columns(
+        connection, items, ['int64', 'int64', 'int64', 'int64']
+    )
+    at = _lookup(header_id, parent)
+    return pd.DataFrame({
+        'product_id': product_id,
+        'supermarket_id': supermarket_id[at],
+        'subchain_id': subchain_id[at],
+        'month': _days(day).astype('datetime64[M]')[at],
+        'delivered': quantity,
+        'delivered_value': quantity * price_cents / 100,
+    })
+
+
+def _return_frame(connection, ids=None, return_=Return.__table__, item=ReturnItem.__table__,
+                  until=None):
+
+    headers = select(
+        return_.c.id,
+        return_.c.supermarket_id,
+        func.coalesce(return_.c.subchain_id, 0),
+        cast(return_.c.delivery_date, String),
+        cast(return_.c.return_date, String),
+    ).order_by(return_.c.id)
+    items = select(
+        item.c.return_id, item.c.product_id, item.c.quantity, item.c.price_cents
+    )
+    if ids is not None:
+        headers = headers.where(return_.c.id.in_(ids))
+        items = items.where(item.c.return_id.in_(ids))
+    if until is not None:
+        newer = _created_after(Return.__tablename__, until)
+        headers = headers.where(return_.c.id.not_in(newer))
+        items = items.where(item.c.return_id.not_in(newer))
+
+    header_id, supermarket_id, subchain_id, delivery_day, return_day = fetch_columns(
+        connection, headers, ['int64', 'int64', 'int64', 'U10', 'U10']
+    )
+    parent, product_id, quantity, price_cents = fetch_columns(
+        connection, items, ['int64', 'int64', 'int64', 'int64']
+    )
+    at = _lookup(header_id, parent)
+    delivered_on = _days(delivery_day)
+    lag = (_days(return_day) - delivered_on).astype('int64')
+    return pd.DataFrame({
+        'product_id': product_id,
+        'supermarket_id': supermarket_id[at],
+        'subchain_id': subchain_id[at],
+        # Returns count against the month their goods were delivered in
+        'month': delivered_on.astype('datetime64[M]')[at],
+        'returned': quantity,
+        'returned_value': quantity * price_cents / 100,
+        'lag_total': lag[at] * quantity,
+    })
+
+
+def _archived_frames(engine, directory):
+    """Delivery and return frames of every archived month"""
+    frames = []
+    for months in archive.month_batches(archive.archived_months(directory)):
+        with engine.connect() as connection, \
+                archive.attached(connection, directory, months) as views:
+            frames.append(_delivery_frame(
+                connection, None, views[Delivery.__tablename__], views[DeliveryItem.__tablename__]
+            ))
+            frames.append(_return_frame(
+                connection, None, views[Return.__tablename__], views[ReturnItem.__tablename__]
+            ))
+    return frames
+
+
+def aggregate(connection, delivery_ids=None, return_ids=None, archive_dir=None, until=None):
+    """
+    Sum delivery and return items per product, location and month
+
+    Args:
+        connection: SQLAlchemy connection
+        delivery_ids: Only these deliveries, or all when None
+        return_ids: Only these returns, or all when None
+        archive_dir (str): Archive directory whose months are included
+            when aggregating everything
+        until (int): Leave out rows created by outbox events after this id
+
+    Returns:
+        DataFrame: Indexed by KEY with the SUMS columns
+    """
+    frames = []
+    if delivery_ids is None or delivery_ids:
+        frames.append(_delivery_frame(connection, delivery_ids, until=until))
+    if return_ids is None or return_ids:
+        frames.append(_return_frame(connection, return_ids, until=until))
+    if delivery_ids is None and return_ids is None and archive_dir:
+        frames += _archived_frames(connection.engine, archive_dir)
+    if not frames:
+        return _empty()
+    combined = pd.concat(frames, ignore_index=True).reindex(columns=KEY + SUMS).fillna(0)
+    return combined.groupby(KEY, sort=False)[SUMS].sum()
+
+
+def _empty():
+    return pd.DataFrame(
+        columns=SUMS, dtype='float64',
+        index=pd.MultiIndex.from_arrays([[] for _ in KEY], names=KEY),
+    )
+
+
+class ReturnAnalytics:
+    """
+    Cached return-rate aggregates
+
+    The cache remembers the last outbox event id it has seen. New
+    deliveries and returns are added to the cached frame incrementally.
+    Edits and deletes need a full rebuild, which runs in a background
+    thread while the previous figures keep being served. The first build
+    runs in the background too, and empty figures are served until it ends.
+    """
+
+    def __init__(self, app=None, max_incremental_events=2000):
+        self.max_incremental_events = max_incremental_events
+        self.async_rebuild = True
+        self.archive_dir = None
+        self._app = None
+        self._frame = None
+        self._rows = None
+        self._event_id = None
+        self._rebuilding = False
+        self._lock = Lock()
+        self._logger = logging.getLogger(__name__)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read analytics settings from the app config"""
+        self.max_incremental_events = app.config.get(
+            'ANALYTICS_MAX_INCREMENTAL_EVENTS', self.max_incremental_events
+        )
+        self.async_rebuild = app.config.get('ANALYTICS_ASYNC_REBUILD', self.async_rebuild)
+        self.archive_dir = app.config.get('ARCHIVE_DIR')
+        self._app = app
+        app.extensions['return_analytics'] = self
+
+    @property
+    def stale(self):
+        """True while a rebuild runs and older figures are being served"""
+        return self._rebuilding
+
+    def _last_event_id(self, connection):
+        outbox = OutboxEvent.__table__
+        return connection.execute(select(func.coalesce(func.max(outbox.c.id), 0))).scalar()
+
+    def _created_since(self, connection, after, until):
+        """
+        Deliveries and returns created between two event ids
+
+        Returns:
+            tuple: (delivery ids, return ids), or None when a rebuild is needed
+        """
+        outbox = OutboxEvent.__table__
+        events = connection.execute(
+            select(outbox.c.entity, outbox.c.entity_id, outbox.c.action)
+            .where(
+                outbox.c.id > after,
+                outbox.c.id <= until,
+                outbox.c.entity.in_(['delivery', 'return']),
+            )
+            .limit(self.max_incremental_events + 1)
+        ).all()
+        if len(events) > self.max_incremental_events:
+            return None
+        created = {'delivery': set(), 'return': set()}
+        for entity, entity_id, action in events:
+            if action != 'created':
+                return None
+            created[entity].add(entity_id)
+        return created['delivery'], created['return']
+
+    def _build(self, connection):
+        """
+        Aggregate the whole history
+
+        Returns:
+            tuple: (frame, event id it covers)
+        """
+        event_id = self._last_event_id(connection)
+        return aggregate(connection, archive_dir=self.archive_dir, until=event_id), event_id
+
+    def _fold(self, connection, frame, after, until):
+        """
+        Add the rows created between two event ids to a frame
+
+        Returns:
+            tuple: (frame, until), or None when a rebuild is needed
+        """
+        if until == after:
+            return frame, after
+        created = self._created_since(connection, after, until)
+        if created is None:
+            return None
+        if any(created):
+            added = aggregate(connection, *created)
+            frame = pd.concat([frame, added]).groupby(level=KEY, sort=False).sum()
+        return frame, until
+
+    def _store(self, frame, event_id):
+        """Keep a frame unless a newer one was stored meanwhile; returns the cached pair"""
+        with self._lock:
+            if self._event_id is None or event_id >= self._event_id:
+                self._frame = frame
+                self._rows = _with_rates(frame.reset_index())
+                self._event_id = event_id
+            return self._frame, self._rows
+
+    def _rebuild(self, app):
+        with app.app_context():
+            try:
+                connection = db.session.connection()
+                frame, event_id = self._build(connection)
+                # Rows created while the build ran
+                folded = self._fold(connection, frame, event_id, self._last_event_id(connection))
+                self._store(*(folded or (frame, event_id)))
+            except Exception:
+                self._logger.exception('Rebuilding return analytics failed')
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._rebuilding = False
+
+    def _start_rebuild(self):
+        """Start a full build in a background thread unless one is running"""
+        with self._lock:
+            if not self._rebuilding:
+                self._rebuilding = True
+                Thread(target=self._rebuild, args=(self._app,),
+                       name='return-analytics', daemon=True).start()
+
+    def frame(self):
+        """
+        Get the aggregate frame, bringing it up to date first
+
+        Returns:
+            DataFrame: Indexed by KEY with the SUMS columns, empty while
+                the first build runs in the background
+        """
+        return self._refresh()[0]
+
+    def _refresh(self):
+        """Bring the cache up to date; returns (aggregates, flat rows with rates)"""
+        background = self.async_rebuild and self._app is not None
+        # Queries run outside the lock, so requests never wait on each other
+        with self._lock:
+            frame, rows, event_id = self._frame, self._rows, self._event_id
+        if frame is None and background:
+            self._start_rebuild()
+            empty = _empty()
+            return empty, _with_rates(empty.reset_index())
+
+        connection = db.session.connection()
+        if frame is None:
+            return self._store(*self._build(connection))
+
+        latest = self._last_event_id(connection)
+        if latest == event_id:
+            return frame, rows
+        folded = self._fold(connection, frame, event_id, latest)
+        if folded is not None:
+            return self._store(*folded)
+        if background:
+            self._start_rebuild()
+            return frame, rows
+        return self._store(*self._build(connection))
+
+    def clear(self):
+        """Drop the cached frame so the next query rebuilds it"""
+        with self._lock:
+            self._frame = None
+            self._rows = None
+            self._event_id = None
+
+    def query(self, supermarket_id=None, subchain_id=None, product_id=None,
+              month_from=None, month_to=None, sort='value_at_risk', limit=100):
+        """
+        Return-rate rows matching some filters, with names
+
+        Args:
+            supermarket_id (int): Optional supermarket filter
+            subchain_id (int): Optional subchain filter
+            product_id (int): Optional product filter
+            month_from (str): First delivery month, 'YYYY-MM'
+            month_to (str): Last delivery month, 'YYYY-MM'
+            sort (str): One of SORT_COLUMNS, largest first
+            limit (int): Maximum number of rows
+
+        Returns:
+            dict: 'rows' (list of dicts), 'matched' (rows before the limit),
+                'totals' over every matched row and 'stale'
+        """
+        rows = self._refresh()[1]
+        mask = np.ones(len(rows), dtype=bool)
+        if supermarket_id:
+            mask &= rows['supermarket_id'].to_numpy() == supermarket_id
+        if subchain_id:
+            mask &= rows['subchain_id'].to_numpy() == subchain_id
+        if product_id:
+            mask &= rows['product_id'].to_numpy() == product_id
+        if month_from:
+            mask &= rows['month'].to_numpy() >= np.datetime64(month_from, 'M')
+        if month_to:
+            mask &= rows['month'].to_numpy() <= np.datetime64(month_to, 'M')
+        selected = rows if mask.all() else rows[mask]
+
+        totals = _with_rates(pd.DataFrame([selected[SUMS].sum()]))
+        if sort not in SORT_COLUMNS:
+            sort = 'value_at_risk'
+        return {
+            'rows': _named_rows(_top(selected, sort, limit)),
+            'matched': len(selected),
+            'totals': _plain(totals.iloc[0], ['delivered', 'returned', 'delivered_value',
+                                              'value_at_risk', 'return_rate', 'avg_lag_days']),
+            'stale': self.stale,
+        }
+
+
+def _top(frame, column, limit):
+    """Largest rows by a column, NaN last, without sorting the whole frame"""
+    values = frame[column].to_numpy(dtype='float64')
+    values = np.where(np.isnan(values), -np.inf, values)
+    if len(values) > limit:
+        positions = np.argpartition(-values, limit)[:limit]
+    else:
+        positions = np.arange(len(values))
+    positions = positions[np.argsort(-values[positions], kind='stable')]
+    return frame.iloc[positions]
+
+
+def _with_rates(frame):
+    """Add the derived ratio columns to a frame of sums"""
+    delivered = frame['delivered'].to_numpy(dtype='float64')
+    returned = frame['returned'].to_numpy(dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = np.where(delivered > 0, returned / delivered, np.nan)
+        lag = np.where(returned > 0, frame['lag_total'].to_numpy(dtype='float64') / returned, np.nan)
+    return frame.assign(
+        return_rate=rate,
+        avg_lag_days=lag,
+        value_at_risk=frame['returned_value'],
+    )
+
+
+def _plain(row, columns):
+    """Turn NumPy scalars into JSON-friendly values, NaN into None"""
+    values = {}
+    for column in columns:
+        value = row[column]
+        if pd.isna(value):
+            values[column] = None
+        elif column in ('delivered', 'returned'):
+            values[column] = int(value)
+        else:
+            values[column] = round(float(value), 4)
+    return values
+
+
+def _named_rows(frame):
+    """Attach product, supermarket and subchain names to the result rows"""
+    if frame.empty:
+        return []
+    names = {}
+    for model, column in ((Product, 'product_id'), (Supermarket, 'supermarket_id'),
+                          (Subchain, 'subchain_id')):
+        ids = [int(value) for value in frame[column].unique() if value]
+        names[column] = dict(
+            db.session.query(model.id, model.name).filter(model.id.in_(ids)).all()
+        ) if ids else {}
+
+    rows = []
+    for record in frame.to_dict('records'):
+        row = _plain(record, ['delivered', 'returned', 'delivered_value', 'value_at_risk',
+                              'return_rate', 'avg_lag_days'])
+        row.update(
+            month=str(record['month'])[:7],
+            product_id=int(record['product_id']),
+            product=names['product_id'].get(record['product_id']),
+            supermarket=names['supermarket_id'].get(record['supermarket_id']),
+            subchain=names['subchain_id'].get(record['subchain_id']),
+        )
+        rows.append(row)
+    return rows
+
+
+return_analytics = ReturnAnalytics()
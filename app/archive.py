@@ -0,0 +1,527 @@
+"""Cold deliveries and returns moved out to monthly archive databases.
+
+``manage.py archive_cold_data`` moves every month older than
+ARCHIVE_KEEP_MONTHS out of the main database. Deliveries go by delivery
+date and returns by return date. Each month becomes one SQLite file with
+its own ``delivery``, ``delivery_item``, ``return``, ``return_item`` and
+``return_match`` tables. The file is vacuumed and stored gzip-compressed
+as ``instance/archive/YYYY-MM.db.gz``. The main database keeps only recent
+months, so its indexes and backups stay small.
+
+Deliveries and returns with the same supermarket and delivery date (the
+return matcher's key) are archived together or not at all. A group
+stays hot while any of its returns is in a recent month, so a hot return
+never draws on archived deliveries. Return matching, the shortfall
+report and ``match_all`` then give the same answers before and after
+archiving. The allocations of archived return items move with them.
+
+To read old data, ``attached()`` decompresses the needed months into
+``instance/archive/cache/`` once and ATTACHes them to a connection. The
+temporary views ``archived_delivery``, ``archived_delivery_item``,
+``archived_return`` and ``archived_return_item`` then cover all attached
+months. If the main database still holds a row, it wins over the archive,
+so a month caught between writing its archive and deleting the hot rows
+is never counted twice.
+
+SQLite refuses to DETACH while a statement is reading, so archives are
+attached on a dedicated connection rather than the request session.
+
+An archive run holds the main database's write lock (``BEGIN IMMEDIATE``)
+from choosing the rows until they are deleted, so no write can slip in
+between copying a row and deleting it. Other writers wait for the run,
+so schedule it for a quiet hour. The archive files are written through
+their own connections while the lock is held.
+"""
+import gzip
+import heapq
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+from operator import attrgetter
+
+from sqlalchemy import (
+    Column, MetaData, Table, Index, create_engine, exists, func, or_, select, text,
+)
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.extensions import db
+from app.models import Delivery, DeliveryItem, Return, ReturnItem, ReturnMatch
+from app.search_index import remove_documents
+
+# SQLite's default limit on attached databases
+MAX_ATTACHED = 10
+
+MONTH_FILE = re.compile(r'^(\d{4}-\d{2})\.db\.gz$')
+
+# kind -> (header model, item model, item foreign key, month column)
+SOURCES = {
+    'delivery': (Delivery, DeliveryItem, 'delivery_id', 'delivery_date'),
+    'return': (Return, ReturnItem, 'return_id', 'return_date'),
+}
+
+TABLES = []
+# table name -> (column naming the header, header table name)
+PARENT_KEYS = {}
+for _header_model, _item_model, _fk, _ in SOURCES.values():
+    TABLES += [_header_model.__table__, _item_model.__table__]
+    PARENT_KEYS[_header_model.__tablename__] = ('id', _header_model.__tablename__)
+    PARENT_KEYS[_item_model.__tablename__] = (_fk, _header_model.__tablename__)
+
+# Allocations of return items are archived along with them
+TABLES.append(ReturnMatch.__table__)
+PARENT_KEYS[ReturnMatch.__tablename__] = ('return_item_id', ReturnItem.__tablename__)
+
+
+def _plain_copy(table, metadata, schema=None, name=None):
+    """Same columns as a hot table, without foreign keys or defaults"""
+    return Table(
+        name or table.name, metadata,
+        *[Column(column.name, column.type, primary_key=column.primary_key)
+          for column in table.columns],
+        schema=schema,
+    )
+
+
+_view_metadata = MetaData()
+
+# Temporary views over the attached months, queryable like the hot tables
+VIEWS = {
+    table.name: _plain_copy(table, _view_metadata, name=f'archived_{table.name}')
+    for table in TABLES
+}
+
+
+def _month_bounds(month):
+    year, number = (int(part) for part in month.split('-'))
+    start = date(year, number, 1)
+    end = date(year + 1, 1, 1) if number == 12 else date(year, number + 1, 1)
+    return start, end
+
+
+def cutoff_date(today, keep_months):
+    """First day of the oldest month that stays in the main database"""
+    index = today.year * 12 + today.month - 1 - (keep_months - 1)
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archived_months(directory, start=None, end=None):
+    """
+    Months with an archive file, oldest first
+
+    Args:
+        directory (str): Archive directory
+        start (date): Only months ending on or after this day
+        end (date): Only months starting on or before this day
+
+    Returns:
+        list: Months as 'YYYY-MM'
+    """
+    if not os.path.isdir(directory):
+        return []
+    months = []
+    for name in sorted(os.listdir(directory)):
+        match = MONTH_FILE.match(name)
+        if not match:
+            continue
+        first, following = _month_bounds(match.group(1))
+        if (start and following <= start) or (end and first > end):
+            continue
+        months.append(match.group(1))
+    return months
+
+
+def month_batches(months):
+    """Split months into groups small enough to attach at once"""
+    for start in range(0, len(months), MAX_ATTACHED):
+        yield months[start:start + MAX_ATTACHED]
+
+
+def _cached_copy(directory, month):
+    """Decompress an archive month unless an up-to-date copy exists"""
+    source = os.path.join(directory, f'{month}.db.gz')
+    cache_dir = os.path.join(directory, 'cache')
+    path = os.path.join(cache_dir, f'{month}.db')
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source):
+        return path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as out, gzip.open(source, 'rb') as f:
+        shutil.copyfileobj(f, out)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _quote(connection, name):
+    return connection.dialect.identifier_preparer.quote(name)
+
+
+# Columns added after an archive was written: (old column, SQL deriving the new one)
+DERIVED_COLUMNS = {
+    'price_cents': ('price', 'CAST(ROUND(price * 100) AS INTEGER)'),
+}
+
+
+def _column_sql(connection, column, present):
+    """Select one hot column from an archive that may predate it"""
+    name = _quote(connection, column.name)
+    if column.name in present:
+        return name
+    old_name, expression = DERIVED_COLUMNS.get(column.name, (None, None))
+    if old_name in present:
+        return f"{expression} AS {name}"
+    return f"NULL AS {name}"
+
+
+def _archive_columns(connection, schema, table_name):
+    rows = connection.exec_driver_sql(
+        f"PRAGMA {schema}.table_info({_quote(connection, table_name)})"
+    ).all()
+    return {row[1] for row in rows}
+
+
+@contextmanager
+def attached(connection, directory, months):
+    """
+    Attach archive months and create the ``archived_*`` views over them
+
+    Args:
+        connection: Dedicated SQLAlchemy connection to a SQLite database,
+            with no statement in progress
+        directory (str): Archive directory
+        months (list): Up to MAX_ATTACHED months as 'YYYY-MM'
+
+    Yields:
+        dict: Hot table name -> Table for its view
+    """
+    if len(months) > MAX_ATTACHED:
+        raise ValueError(f"At most {MAX_ATTACHED} archive months can be attached at once")
+
+    schemas = []
+    try:
+        for month in months:
+            schema = f"archive_{month.replace('-', '_')}"
+            connection.exec_driver_sql(
+                f"ATTACH DATABASE ? AS {schema}", (_cached_copy(directory, month),)
+            )
+            schemas.append(schema)
+
+        for table in TABLES:
+            key, header_name = PARENT_KEYS[table.name]
+            parts = []
+            for schema in schemas:
+                present = _archive_columns(connection, schema, table.name)
+                if not present:
+                    # Written before this table was archived
+                    continue
+                columns = ', '.join(
+                    _column_sql(connection, column, present) for column in table.columns
+                )
+                parts.append(
+                    f"SELECT {columns} FROM {schema}.{_quote(connection, table.name)} "
+                    f"WHERE {key} NOT IN (SELECT id FROM main.{_quote(connection, header_name)})"
+                )
+            if not parts:
+                parts.append(
+                    f"SELECT * FROM main.{_quote(connection, table.name)} WHERE 0"
+                )
+            connection.exec_driver_sql(
+                f"CREATE TEMP VIEW {VIEWS[table.name].name} AS {' UNION ALL '.join(parts)}"
+            )
+        yield VIEWS
+    finally:
+        for view in VIEWS.values():
+            connection.exec_driver_sql(f"DROP VIEW IF EXISTS temp.{view.name}")
+        for schema in schemas:
+            connection.exec_driver_sql(f"DETACH DATABASE {schema}")
+
+
+def _archived_rows(engine, directory, kind, start, end):
+    header_model, item_model, fk, date_name = SOURCES[kind]
+    header = header_model.__table__
+    item = item_model.__table__
+    view = VIEWS[header.name]
+    item_view = VIEWS[item.name]
+
+    connection = engine.connect()
+    session = Session(bind=connection)
+    try:
+        for month in reversed(archived_months(directory, start, end)):
+            with attached(connection, directory, [month]):
+                where = []
+                params = {}
+                if start:
+                    where.append(f"{date_name} >= :start")
+                    params['start'] = start.isoformat()
+                if end:
+                    where.append(f"{date_name} <= :end")
+                    params['end'] = end.isoformat()
+                headers = session.scalars(
+                    select(header_model).from_statement(
+                        text(
+                            f"SELECT * FROM {view.name} "
+                            f"{'WHERE ' + ' AND '.join(where) if where else ''} "
+                            f"ORDER BY {date_name} DESC, id DESC"
+                        ).bindparams(**params).columns(*header.columns)
+                    )
+                ).all()
+                lines = session.scalars(
+                    select(item_model).from_statement(
+                        text(f"SELECT * FROM {item_view.name} ORDER BY id")
+                        .columns(*item.columns)
+                    )
+                ).all()
+
+            by_parent = {}
+            for line in lines:
+                by_parent.setdefault(getattr(line, fk), []).append(line)
+            for row in headers:
+                # Lazy loading would read the (empty) hot item table
+                set_committed_value(row, 'items', by_parent.get(row.id, []))
+            yield from headers
+    finally:
+        session.close()
+        connection.close()
+
+
+def with_archived(rows, kind, directory, start=None, end=None):
+    """
+    Extend hot deliveries or returns, newest first, with archived ones
+
+    Args:
+        rows: Iterable of hot Delivery or Return objects sorted by date,
+            then id, both descending
+        kind (str): 'delivery' or 'return'
+        directory (str): Archive directory
+        start (date): Earliest date wanted, if limited
+        end (date): Latest date wanted, if limited
+
+    Returns:
+        iterable: The rows when no archive covers the range, otherwise
+            hot and archived rows merged in the same order
+    """
+    if not archived_months(directory, start, end):
+        return rows
+    date_name = SOURCES[kind][3]
+    archived = _archived_rows(db.engine, directory, kind, start, end)
+    return heapq.merge(rows, archived, key=attrgetter(date_name, 'id'), reverse=True)
+
+
+def closed_months(connection, cutoff):
+    """Months before the cutoff that still have hot deliveries or returns"""
+    months = set()
+    for header_model, _, _, date_name in SOURCES.values():
+        column = header_model.__table__.c[date_name]
+        months.update(connection.execute(
+            select(func.strftime('%Y-%m', column)).where(column < cutoff).distinct()
+        ).scalars())
+    return sorted(months)
+
+
+def _create_work_tables(connection):
+    """Create the archive tables in a new archive file"""
+    metadata = MetaData()
+    targets = {}
+    for table in TABLES:
+        targets[table.name] = copy = _plain_copy(table, metadata)
+        key, _ = PARENT_KEYS[table.name]
+        if key != 'id':
+            Index(f'ix_{table.name}_{key}', copy.c[key])
+    metadata.create_all(connection)
+    return targets
+
+
+def _held_back(header, cutoff, max_ids):
+    """Rows whose match key group still has a row that stays hot"""
+    hot_return = Return.__table__.alias('hot_return')
+    last_delivery = Delivery.__table__.alias('last_delivery')
+    return or_(
+        exists().where(
+            hot_return.c.supermarket_id == header.c.supermarket_id,
+            hot_return.c.delivery_date == header.c.delivery_date,
+            (hot_return.c.return_date >= cutoff) | (hot_return.c.id >= max_ids['return']),
+        ),
+        exists().where(
+            last_delivery.c.supermarket_id == header.c.supermarket_id,
+            last_delivery.c.delivery_date == header.c.delivery_date,
+            last_delivery.c.id >= max_ids['delivery'],
+        ),
+    )
+
+
+def _moved_tables(kind, selected):
+    """(table, condition) pairs for the rows of some headers, children first"""
+    header_model, item_model, fk, _ = SOURCES[kind]
+    header = header_model.__table__
+    item = item_model.__table__
+    tables = []
+    if kind == 'return':
+        match = ReturnMatch.__table__
+        tables.append((match, match.c.return_item_id.in_(
+            select(item.c.id).where(item.c[fk].in_(selected))
+        )))
+    tables.append((item, item.c[fk].in_(selected)))
+    tables.append((header, header.c.id.in_(selected)))
+    return tables
+
+
+def _archived_ids(connection, month, cutoff):
+    """Ids of the deliveries and returns of a month that can be archived"""
+    first, following = _month_bounds(month)
+    max_ids = {
+        kind: connection.execute(select(func.max(model.__table__.c.id))).scalar() or 0
+        for kind, (model, _, _, _) in SOURCES.items()
+    }
+    ids = {}
+    for kind, (header_model, _, _, date_name) in SOURCES.items():
+        header = header_model.__table__
+        ids[kind] = connection.execute(
+            select(header.c.id).where(
+                header.c[date_name] >= first,
+                header.c[date_name] < following,
+                header.c.id < max_ids[kind],
+                ~_held_back(header, cutoff, max_ids),
+            )
+        ).scalars().all()
+    return ids
+
+
+def archive_month(connection, directory, month, cutoff):
+    """
+    Write one month of deliveries and returns to its archive file
+
+    The hot rows are left in place; delete_archived() removes them in the
+    same transaction. A month archived before is extended, so deliveries
+    entered late for an old date can be archived too. The row with the
+    highest id of each table stays hot, so SQLite never hands out an
+    archived id again, and so does every row of its match key group.
+
+    Args:
+        connection: Dedicated SQLAlchemy connection to the main SQLite
+            database, holding the write lock (``BEGIN IMMEDIATE``) until
+            the archived rows are deleted
+        directory (str): Archive directory
+        month (str): 'YYYY-MM'
+        cutoff (date): First day that stays in the main database
+
+    Returns:
+        dict: Ids of the deliveries and returns archived per kind
+    """
+    ids = _archived_ids(connection, month, cutoff)
+    if not any(ids.values()):
+        return ids
+
+    os.makedirs(directory, exist_ok=True)
+    archive_path = os.path.join(directory, f'{month}.db.gz')
+    cache_dir = os.path.join(directory, 'cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, work_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    os.close(fd)
+
+    # ATTACH and VACUUM are refused inside the main transaction, so the
+    # archive file gets a connection of its own
+    work_engine = create_engine(f"sqlite:///{work_path}", poolclass=NullPool)
+    try:
+        with work_engine.connect() as work:
+            targets = _create_work_tables(work)
+            if os.path.exists(archive_path):
+                # Copied through the views, so an archive in an older layout
+                # is rewritten in the current one. The views hide rows whose
+                # parent is in this connection's main tables, so children go first.
+                with attached(work, directory, [month]) as views:
+                    for table in reversed(TABLES):
+                        work.execute(targets[table.name].insert().from_select(
+                            [column.name for column in table.columns],
+                            select(*views[table.name].c),
+                        ))
+                    work.commit()
+
+            # Copied by the ids chosen above, the same ones delete_archived() removes
+            for kind, kind_ids in ids.items():
+                for start in range(0, len(kind_ids), 500):
+                    for table, where in _moved_tables(kind, kind_ids[start:start + 500]):
+                        rows = connection.execute(select(*table.columns).where(where)).mappings().all()
+                        if rows:
+                            work.execute(targets[table.name].insert().prefix_with('OR REPLACE'), rows)
+            work.commit()
+            work.exec_driver_sql('VACUUM')
+    except Exception:
+        os.remove(work_path)
+        raise
+    finally:
+        work_engine.dispose()
+
+    fd, gzip_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as out, \
+            open(work_path, 'rb') as f:
+        shutil.copyfileobj(f, out)
+    os.replace(gzip_path, archive_path)
+    # The work file is the decompressed copy of the new archive
+    os.replace(work_path, os.path.join(cache_dir, f'{month}.db'))
+    return ids
+
+
+def delete_archived(connection, ids):
+    """
+    Delete archived deliveries and returns from the main database
+
+    Items, return allocations and search documents go in the same
+    transaction as their headers; the caller commits.
+
+    Args:
+        connection: SQLAlchemy connection to the main database
+        ids (dict): Delivery and return ids per kind, as from archive_month()
+    """
+    for kind in SOURCES:
+        kind_ids = ids.get(kind, [])
+        for start in range(0, len(kind_ids), 500):
+            for table, where in _moved_tables(kind, kind_ids[start:start + 500]):
+                connection.execute(table.delete().where(where))
+        remove_documents(connection, kind, kind_ids)
+
+
+def archive_cold_months(engine, directory, keep_months, today=None, keep_days=0):
+    """
+    Archive every month older than the last keep_months months
+
+    The write lock is taken before the rows are chosen. All months are
+    written first; the hot rows are then deleted in the same transaction,
+    so readers never see a match key group half moved, and a row written
+    meanwhile cannot be deleted without reaching the archive.
+
+    Args:
+        engine: SQLAlchemy engine of the main SQLite database
+        directory (str): Archive directory
+        keep_months (int): Months kept in the main database, current included
+        today (date): Reference day, today by default
+        keep_days (int): Days before today that stay hot as well, e.g. the
+            demand history window
+
+    Returns:
+        list: (month, counts per kind) for each month archived
+    """
+    today = today or date.today()
+    cutoff = min(cutoff_date(today, keep_months),
+                 cutoff_date(today - timedelta(days=keep_days), 1))
+    results = []
+    archived = {kind: [] for kind in SOURCES}
+    with engine.connect() as connection:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+        try:
+            for month in closed_months(connection, cutoff):
+                ids = archive_month(connection, directory, month, cutoff)
+                if any(ids.values()):
+                    results.append((month, {kind: len(kind_ids) for kind, kind_ids in ids.items()}))
+                    for kind, kind_ids in ids.items():
+                        archived[kind] += kind_ids
+            delete_archived(connection, archived)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    return results
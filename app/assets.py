@@ -0,0 +1,179 @@
+"""Static asset build: bundling, minification, fingerprinting, precompression.
+
+``manage.py build_assets`` writes content-hashed bundles plus ``.gz`` and
+``.br`` variants to ``app/static/dist`` together with a manifest. Templates
+call ``asset_url('css/styles.css')``, which points at the hashed bundle
+when a manifest exists and at the plain static file otherwise, so a
+development checkout works without building.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # .br variants are skipped without the brotli package
+    brotli = None
+
+# Logical bundle name -> source files under app/static, concatenated in order
+BUNDLES = {
+    'css/styles.css': ['css/styles.css'],
+    'js/app.js': ['js/app.js'],
+    'js/line_items.js': ['js/line_items.js'],
+}
+
+IMMUTABLE_MAX_AGE = 31536000  # one year
+
+assets_bp = Blueprint('assets', __name__, url_prefix='/assets')
+
+
+# A quoted string with its escapes, captured so split() keeps it
+CSS_STRING = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')""")
+
+# Strings are matched too, so '/*' inside one does not start a comment
+CSS_STRING_OR_COMMENT = re.compile(CSS_STRING.pattern + r'|/\*.*?\*/', re.S)
+
+
+def _minify_css_code(code):
+    code = re.sub(r'\s+', ' ', code)
+    code = re.sub(r'\s*([{};,>])\s*', r'\1', code)
+    # A space before ':' is a descendant combinator in selectors, e.g. '.x :hover'
+    code = re.sub(r':\s+', ':', code)
+    return code.replace(';}', '}')
+
+
+def minify_css(source):
+    """Strip comments and redundant whitespace from CSS, leaving strings alone"""
+    source = CSS_STRING_OR_COMMENT.sub(lambda match: match.group(1) or '', source)
+    # The capturing group makes split() return strings at the odd positions
+    parts = CSS_STRING.split(source)
+    return ''.join(
+        part if index % 2 else _minify_css_code(part) for index, part in enumerate(parts)
+    ).strip()
+
+
+def minify_js(source):
+    """
+    Conservatively shrink JavaScript
+
+    Only indentation, blank lines and whole-line ``//`` comments are
+    removed, which is safe without a real JavaScript parser.
+    """
+    lines = []
+    for line in source.splitlines():
+        line = line.strip()
+        if line and not line.startswith('//'):
+            lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def _dist_dir(app):
+    return os.path.join(app.static_folder, 'dist')
+
+
+def build_assets(app):
+    """
+    Build every bundle and write the manifest
+
+    Args:
+        app: Flask application instance
+
+    Returns:
+        dict: Logical name -> fingerprinted file name
+    """
+    dist_dir = _dist_dir(app)
+    os.makedirs(dist_dir, exist_ok=True)
+    manifest = {}
+
+    for name, sources in BUNDLES.items():
+        parts = []
+        for source in sources:
+            with open(os.path.join(app.static_folder, source), encoding='utf-8') as f:
+                parts.append(f.read())
+        content = '\n'.join(parts)
+        content = minify_css(content) if name.endswith('.css') else minify_js(content)
+        data = content.encode('utf-8')
+
+        stem, ext = os.path.splitext(name)
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        hashed_name = f"{stem}.{digest}{ext}"
+        path = os.path.join(dist_dir, hashed_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'wb') as f:
+            f.write(data)
+        with open(f"{path}.gz", 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(f"{path}.br", 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+
+        manifest[name] = hashed_name
+
+    with open(os.path.join(dist_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    _load_manifest(app)
+    return manifest
+
+
+def _load_manifest(app):
+    path = os.path.join(_dist_dir(app), 'manifest.json')
+    manifest = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    app.extensions['asset_manifest'] = manifest
+
+
+def asset_url(filename):
+    """
+    url_for('static', ...) replacement that returns fingerprinted URLs
+
+    Args:
+        filename (str): Path relative to app/static
+
+    Returns:
+        str: URL of the hashed bundle, or of the plain file if not built
+    """
+    hashed_name = current_app.extensions.get('asset_manifest', {}).get(filename)
+    if hashed_name is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.serve', filename=hashed_name)
+
+
+@assets_bp.route('/<path:filename>')
+def serve(filename):
+    """Serve a built asset, precompressed when the client accepts it."""
+    dist_dir = _dist_dir(current_app)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    accepted = request.accept_encodings
+
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[candidate] and os.path.exists(os.path.join(dist_dir, filename + suffix)):
+            encoding = candidate
+            filename += suffix
+            break
+
+    response = send_from_directory(
+        dist_dir, filename, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    """Load the asset manifest and expose asset_url to templates"""
+    _load_manifest(app)
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.register_blueprint(assets_bp)
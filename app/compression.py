@@ -0,0 +1,142 @@
+"""Response compression negotiated from Accept-Encoding.
+
+Bodies of an allowlisted content type are compressed with brotli (when
+the brotli package is installed) or gzip. Buffered responses below
+COMPRESS_MIN_SIZE are left alone. Streamed responses, such as the
+listing pages, are compressed chunk by chunk and flushed after every
+chunk, so the browser still renders rows as they arrive.
+
+A compressed page that holds a secret and echoes attacker-chosen text
+leaks the secret through its size (BREACH). Pages that carry a CSRF
+token are therefore sent uncompressed when the request brought a query
+string or form data, the input such a page could echo back.
+"""
+import zlib
+
+from flask import current_app, g, request
+
+try:
+    import brotli
+except ImportError:  # Only gzip is offered without the brotli package
+    brotli = None
+
+
+class _GzipStream:
+    def __init__(self, level):
+        # wbits 31 = gzip container
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+    def compress_once(self, data):
+        return self._compressor.compress(data) + self.finish()
+
+
+class _BrotliStream:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+    def compress_once(self, data):
+        return self._compressor.process(data) + self.finish()
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _may_leak_csrf_token():
+    """Whether this response holds a CSRF token next to request input"""
+    field_name = current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token')
+    return field_name in g and bool(request.args or request.form)
+
+
+def _compressor(encoding, config):
+    if encoding == 'br':
+        return _BrotliStream(config.get('COMPRESS_BROTLI_QUALITY', 4))
+    return _GzipStream(config.get('COMPRESS_GZIP_LEVEL', 6))
+
+
+def _compress_stream(chunks, compressor):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield compressor.compress(chunk)
+        yield compressor.finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response, config):
+    """
+    Compress a response in place if the client and content type allow it
+
+    Args:
+        response: Flask response object
+        config: Application config
+
+    Returns:
+        Response: The same response object
+    """
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or request.method == 'HEAD'
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in config['COMPRESS_MIMETYPES']
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None or _may_leak_csrf_token():
+        return response
+
+    compressor = _compressor(encoding, config)
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, compressor)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compressor.compress_once(data))
+
+    response.headers['Content-Encoding'] = encoding
+    if response.get_etag()[0]:
+        # A compressed body is a different representation
+        response.headers.pop('ETag')
+    return response
+
+
+def init_compression(app):
+    """
+    Register the compression after_request hook
+
+    Args:
+        app: Flask application instance
+    """
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, app.config)
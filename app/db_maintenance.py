@@ -0,0 +1,229 @@
+"""Routine maintenance of the SQLite database files.
+
+Bulk deletes (archiving, session cleanup) leave free pages behind and
+make the planner statistics stale. ``maintain_database`` runs these
+steps on one file, on its own connection:
+
+1. ``PRAGMA quick_check``. When it reports problems, the steps that
+   write are skipped.
+2. ``ANALYZE``, with ``analysis_limit`` keeping it to a sample of each
+   index. From SQLite 3.46 on, ``PRAGMA optimize`` is used instead once
+   statistics exist, so only tables that changed are analyzed.
+3. ``PRAGMA incremental_vacuum`` in small batches, one transaction each,
+   so writers wait for a batch at most. This only works when the file
+   uses ``auto_vacuum=INCREMENTAL``. ``full_vacuum=True`` switches a file
+   to it with a single full ``VACUUM``, which locks the file until done.
+4. ``PRAGMA wal_checkpoint(TRUNCATE)`` for files in WAL mode.
+
+Every file has a time budget. A progress handler interrupts a statement
+that runs past it, and the remaining steps are skipped. The busy timeout
+is short, so maintenance gives up rather than queue behind the app.
+
+Run it with ``manage.py maintain_databases`` or keep
+``manage.py run_maintenance_scheduler`` running for a nightly pass.
+"""
+import logging
+import os
+import sqlite3
+import time as time_module
+
+from app.extensions import db
+from app.scheduling import run_daily
+
+logger = logging.getLogger(__name__)
+
+# SQLite virtual machine steps between time budget checks
+PROGRESS_STEPS = 10000
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class _Budget:
+    """Deadline for one file, enforced through a progress handler"""
+
+    def __init__(self, seconds):
+        self.deadline = time_module.monotonic() + seconds
+
+    @property
+    def expired(self):
+        return time_module.monotonic() >= self.deadline
+
+    def __call__(self):
+        # A non-zero return value interrupts the running statement
+        return 1 if self.expired else 0
+
+
+def database_paths(app):
+    """
+    SQLite files used by the application
+
+    Needs an application context for the SQLAlchemy engine.
+
+    Returns:
+        list: Absolute paths of the existing database files
+    """
+    candidates = []
+    url = db.engine.url
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        candidates.append(url.database)
+    if app.config.get('SESSION_BACKEND') == 'sqlite':
+        candidates.append(app.config['SESSION_SQLITE_PATH'])
+    candidates.extend(app.config.get('MAINTENANCE_EXTRA_DATABASES', []))
+
+    paths = []
+    for path in candidates:
+        path = os.path.abspath(path)
+        if path not in paths and os.path.exists(path):
+            paths.append(path)
+    return paths
+
+
+def _file_sizes(path):
+    wal = f"{path}-wal"
+    return os.path.getsize(path), os.path.getsize(wal) if os.path.exists(wal) else 0
+
+
+def _quick_check(conn, budget, config):
+    rows = conn.execute('PRAGMA quick_check').fetchall()
+    problems = [row[0] for row in rows if row[0] != 'ok']
+    return problems or 'ok'
+
+
+def _optimize(conn, budget, config):
+    conn.execute(f"PRAGMA analysis_limit={int(config['MAINTENANCE_ANALYSIS_LIMIT'])}")
+    has_stats = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+    ).fetchone()
+    if has_stats and sqlite3.sqlite_version_info >= (3, 46, 0):
+        # 0x10000 checks every table, not just the ones this connection queried
+        conn.execute('PRAGMA optimize=0x10002')
+        return 'optimize'
+    conn.execute('ANALYZE')
+    return 'analyze'
+
+
+def _incremental_vacuum(conn, budget, config):
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return f"not enabled, {free} free pages"
+
+    pages = int(config['MAINTENANCE_VACUUM_PAGES'])
+    free_before = free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    # Each batch is its own transaction, so writers get in between batches
+    while free and not budget.expired:
+        conn.execute(f"PRAGMA incremental_vacuum({pages})").fetchall()
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    return f"{free_before - free} pages released, {free} left"
+
+
+def _full_vacuum(conn, budget, config):
+    conn.execute(f"PRAGMA auto_vacuum={AUTO_VACUUM_INCREMENTAL}")
+    # Requested explicitly, so it runs to the end instead of being interrupted
+    conn.set_progress_handler(None, 0)
+    conn.execute('VACUUM')
+    return 'auto_vacuum=incremental'
+
+
+def _checkpoint(conn, budget, config):
+    if conn.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+        return 'not in WAL mode'
+    busy, log_pages, checkpointed = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+    if busy:
+        return f"busy, {checkpointed} of {log_pages} pages checkpointed"
+    return 'truncated'
+
+
+def maintain_database(path, config, full_vacuum=False):
+    """
+    Run the maintenance steps on one SQLite file
+
+    Args:
+        path (str): Database file
+        config: Application config with the MAINTENANCE_* settings
+        full_vacuum (bool): Switch to incremental auto-vacuum with a full VACUUM
+
+    Returns:
+        dict: 'path', sizes before and after (file and WAL, bytes) and
+            'steps', a list of (step, seconds, result) tuples
+    """
+    steps = [('quick_check', _quick_check), ('optimize', _optimize)]
+    if full_vacuum:
+        steps.append(('vacuum', _full_vacuum))
+    else:
+        steps.append(('incremental_vacuum', _incremental_vacuum))
+    steps.append(('wal_checkpoint', _checkpoint))
+
+    report = {'path': path, 'before': _file_sizes(path), 'steps': []}
+    budget = _Budget(config['MAINTENANCE_TIME_BUDGET'])
+    # Autocommit, so VACUUM and the pragmas run outside an implicit transaction
+    conn = sqlite3.connect(
+        path, timeout=config['MAINTENANCE_BUSY_TIMEOUT'], isolation_level=None
+    )
+    conn.set_progress_handler(budget, PROGRESS_STEPS)
+    try:
+        for name, step in steps:
+            if budget.expired:
+                report['steps'].append((name, 0.0, 'skipped, time budget spent'))
+                continue
+            started = time_module.monotonic()
+            try:
+                result = step(conn, budget, config)
+            except sqlite3.OperationalError as e:
+                result = 'skipped, time budget spent' if budget.expired else f"failed: {e}"
+            report['steps'].append((name, time_module.monotonic() - started, result))
+
+            if name == 'quick_check' and isinstance(result, list):
+                logger.error(f"{path} failed quick_check: {result}")
+                break
+    finally:
+        conn.close()
+
+    report['after'] = _file_sizes(path)
+    return report
+
+
+def _log_report(report):
+    (size_before, wal_before), (size_after, wal_after) = report['before'], report['after']
+    for name, seconds, result in report['steps']:
+        logger.info(f"{report['path']}: {name} {result} ({seconds:.2f} s)")
+    logger.info(
+        f"{report['path']}: {size_before} -> {size_after} bytes, "
+        f"WAL {wal_before} -> {wal_after} bytes"
+    )
+
+
+def maintain_databases(app, full_vacuum=False):
+    """
+    Run maintenance on every database file of the application
+
+    Args:
+        app: Flask application instance
+        full_vacuum (bool): Switch the files to incremental auto-vacuum first
+
+    Returns:
+        list: One report per file, see maintain_database
+    """
+    with app.app_context():
+        paths = database_paths(app)
+
+    reports = []
+    for path in paths:
+        report = maintain_database(path, app.config, full_vacuum)
+        _log_report(report)
+        reports.append(report)
+    return reports
+
+
+def run_scheduler(app):
+    """
+    Maintain the databases forever, once a day at the configured hour
+
+    Args:
+        app: Flask application instance
+    """
+    config = app.config
+    run_daily(
+        app, config['MAINTENANCE_STATE_FILE'], config['MAINTENANCE_HOUR'],
+        lambda today: maintain_databases(app), 'Database maintenance',
+        config.get('MAINTENANCE_CHECK_INTERVAL', 60),
+    )
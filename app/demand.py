@@ -0,0 +1,235 @@
+"""Suggested order quantities from delivery and return history.
+
+Every delivery day of a location (a supermarket plus an optional
+subchain) is one visit. A product's net demand at a visit is what was
+delivered minus what came back from that delivery. The estimate per
+location and product is an exponentially smoothed average of the net
+demand over the location's recent visits, newest weighted most. Visits
+without the product count as zero demand.
+
+All of it is computed with NumPy over the whole history window at once:
+- each visit gets a weight from its rank, newest first;
+- every delivery and return line adds its weighted quantity with a
+  single ``bincount``.
+The estimates are stored in ``demand_estimate`` nightly
+(``manage.py refresh_demand_estimates`` or ``run_demand_scheduler``), so
+the delivery form only needs one indexed lookup.
+"""
+import logging
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import String, cast, func, select
+
+from app.analytics import fetch_columns
+from app.extensions import db
+from app.models import DemandEstimate, Delivery, DeliveryItem, Product, Return, ReturnItem
+from app.scheduling import run_daily
+
+logger = logging.getLogger(__name__)
+
+INSERT_BATCH = 5000
+
+
+def _headers(connection, table, since):
+    """Ids, location keys and delivery day numbers of headers since a date"""
+    header_id, supermarket_id, subchain_id, day = fetch_columns(
+        connection,
+        select(
+            table.c.id,
+            table.c.supermarket_id,
+            func.coalesce(table.c.subchain_id, 0),
+            cast(table.c.delivery_date, String),
+        )
+        .where(table.c.delivery_date >= since)
+        .order_by(table.c.id),
+        ['int64', 'int64', 'int64', 'U10'],
+    )
+    location = (supermarket_id << 32) | subchain_id
+    return header_id, location, day.astype('datetime64[D]').astype('int64')
+
+
+def _lines(connection, header, item, fk, since):
+    """Parent id, product id and quantity of the lines of headers since a date"""
+    return fetch_columns(
+        connection,
+        select(item.c[fk], item.c.product_id, item.c.quantity)
+        .select_from(item.join(header, header.c.id == item.c[fk]))
+        .where(header.c.delivery_date >= since),
+        ['int64', 'int64', 'int64'],
+    )
+
+
+def compute_estimates(connection, since, alpha):
+    """
+    Smooth net demand per location and product over visits since a date
+
+    Args:
+        connection: SQLAlchemy connection
+        since (date): First delivery date taken into account
+        alpha (float): Smoothing factor; higher follows recent visits closer
+
+    Returns:
+        dict: Arrays 'supermarket_id', 'subchain_id' (0 for none),
+            'product_id' and 'level' (net units per visit)
+    """
+    delivery = Delivery.__table__
+    return_ = Return.__table__
+    empty = {name: np.empty(0, dtype='int64')
+             for name in ('supermarket_id', 'subchain_id', 'product_id')}
+    empty['level'] = np.empty(0)
+
+    header_id, location, day = _headers(connection, delivery, since)
+    if not len(header_id):
+        return empty
+
+    # Visits are (location, day) pairs, numbered in location then day order
+    locations, location_index = np.unique(location, return_inverse=True)
+    first_day = day.min()
+    span = day.max() - first_day + 1
+    visit_codes, header_visit = np.unique(
+        location_index * span + (day - first_day), return_inverse=True
+    )
+    visit_location = visit_codes // span
+
+    # Rank 0 is a location's newest visit
+    last = np.cumsum(np.bincount(visit_location, minlength=len(locations))) - 1
+    rank = last[visit_location] - np.arange(len(visit_codes))
+    weight = alpha * (1 - alpha) ** rank
+    norm = np.bincount(visit_location, weights=weight, minlength=len(locations))
+
+    parent, product_id, quantity = _lines(
+        connection, delivery, DeliveryItem.__table__, 'delivery_id', since
+    )
+    line_visit = header_visit[np.searchsorted(header_id, parent)]
+
+    # Returns count against the visit that delivered their goods
+    return_id, return_location, return_day = _headers(connection, return_, since)
+    return_loc_index = np.searchsorted(locations, return_location).clip(max=len(locations) - 1)
+    return_code = return_loc_index * span + (return_day - first_day)
+    return_visit = np.searchsorted(visit_codes, return_code).clip(max=len(visit_codes) - 1)
+    known = (
+        (locations[return_loc_index] == return_location)
+        & (return_day >= first_day)
+        & (return_day <= day.max())
+        & (visit_codes[return_visit] == return_code)
+    )
+
+    return_parent, return_product, return_quantity = _lines(
+        connection, return_, ReturnItem.__table__, 'return_id', since
+    )
+    if len(return_id):
+        position = np.searchsorted(return_id, return_parent)
+        keep = known[position]
+        line_visit = np.concatenate([line_visit, return_visit[position][keep]])
+        product_id = np.concatenate([product_id, return_product[keep]])
+        quantity = np.concatenate([quantity, -return_quantity[keep]])
+
+    if not len(product_id):
+        return empty
+
+    products = product_id.max() + 1
+    pairs, pair_index = np.unique(
+        visit_location[line_visit] * products + product_id, return_inverse=True
+    )
+    total = np.bincount(pair_index, weights=weight[line_visit] * quantity)
+    pair_location = pairs // products
+    location_key = locations[pair_location]
+    return {
+        'supermarket_id': location_key >> 32,
+        'subchain_id': location_key & 0xFFFFFFFF,
+        'product_id': pairs % products,
+        'level': total / norm[pair_location],
+    }
+
+
+def refresh_estimates(connection, today=None, alpha=0.3, history_days=180):
+    """
+    Replace the stored demand estimates with fresh ones
+
+    Args:
+        connection: SQLAlchemy connection; the caller commits
+        today (date): Day the history window ends, today by default
+        alpha (float): Smoothing factor
+        history_days (int): Length of the history window
+
+    Returns:
+        int: Number of estimates stored (those suggesting at least one unit)
+    """
+    since = (today or date.today()) - timedelta(days=history_days)
+    estimates = compute_estimates(connection, since, alpha)
+    suggested = np.floor(estimates['level'] + 0.5).astype('int64')
+    keep = np.flatnonzero(suggested >= 1)
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            'supermarket_id': int(estimates['supermarket_id'][i]),
+            'subchain_id': int(estimates['subchain_id'][i]) or None,
+            'product_id': int(estimates['product_id'][i]),
+            'level': float(estimates['level'][i]),
+            'quantity': int(suggested[i]),
+            'computed_at': now,
+        }
+        for i in keep
+    ]
+
+    table = DemandEstimate.__table__
+    connection.execute(table.delete())
+    for start in range(0, len(rows), INSERT_BATCH):
+        connection.execute(table.insert(), rows[start:start + INSERT_BATCH])
+    return len(rows)
+
+
+def suggestions(supermarket_id, subchain_id=None):
+    """
+    Suggested products and quantities for a location
+
+    Returns:
+        list: Dicts with 'product_id', 'name', 'price' and 'quantity',
+            largest quantity first
+    """
+    rows = (
+        db.session.query(DemandEstimate.quantity, Product.id, Product.name, Product.price_cents)
+        .join(Product, Product.id == DemandEstimate.product_id)
+        .filter(
+            DemandEstimate.supermarket_id == supermarket_id,
+            DemandEstimate.subchain_id.is_not_distinct_from(subchain_id),
+        )
+        .order_by(DemandEstimate.quantity.desc(), Product.name)
+        .all()
+    )
+    return [
+        {
+            'product_id': product_id,
+            'name': name,
+            'price': (price_cents or 0) / 100,
+            'quantity': quantity,
+        }
+        for quantity, product_id, name, price_cents in rows
+    ]
+
+
+def run_scheduler(app):
+    """
+    Refresh the demand estimates forever, once a day at the configured hour
+
+    Args:
+        app: Flask application instance
+    """
+    config = app.config
+
+    def refresh(today):
+        count = refresh_estimates(
+            db.session.connection(),
+            today,
+            config['DEMAND_SMOOTHING_ALPHA'],
+            config['DEMAND_HISTORY_DAYS'],
+        )
+        db.session.commit()
+        logger.info(f"Stored {count} demand estimates")
+
+    run_daily(
+        app, config['DEMAND_STATE_FILE'], config['DEMAND_REFRESH_HOUR'], refresh,
+        'Demand refresh', config.get('DEMAND_CHECK_INTERVAL', 60),
+    )
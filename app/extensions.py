@@ -1,11 +1,15 @@
 from flask_login import LoginManager
 from flask_mail import Mail
 from flask_sqlalchemy import SQLAlchemy
+from app.fragment_cache import FragmentCache
+from app.user_cache import UserCache
 
 # Initialize extensions
 db = SQLAlchemy()
 login_manager = LoginManager()
 mail = Mail()
+fragment_cache = FragmentCache()
+user_cache = UserCache()
 
 # Configure login manager
 login_manager.login_view = 'auth.login' 
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""In-process LRU cache for rendered template fragments."""
+from collections import OrderedDict
+from threading import Lock
+
+from flask import g
+from markupsafe import Markup
+from sqlalchemy import func, select
+
+
+class CatalogGeneration:
+    """
+    Id of the newest outbox event for a row rendered inside other objects' fragments
+
+    Delivery and return rows show product, supermarket and subchain names,
+    and every insert, update and delete of these rows appends an outbox
+    event, whichever process made it. A call reads the newest event id,
+    a primary key lookup, and only when it moved looks at the events added
+    since the previous call. The first call scans the outbox once.
+    """
+
+    TABLES = ('product', 'subchain', 'supermarket')
+
+    def __init__(self):
+        self._seen = 0
+        self._generation = None
+        self._lock = Lock()
+
+    def __call__(self):
+        # app.extensions imports this module, so the models are imported here
+        from app.extensions import db
+        from app.models import OutboxEvent
+
+        newest = db.session.scalar(select(func.max(OutboxEvent.id))) or 0
+        with self._lock:
+            if newest < self._seen:
+                # The outbox was emptied, e.g. by restoring a backup
+                self._seen, self._generation = 0, None
+            if newest == self._seen:
+                return self._generation
+            seen = self._seen
+
+        changed = db.session.scalar(
+            select(func.max(OutboxEvent.id))
+            .where(OutboxEvent.id > seen, OutboxEvent.id <= newest)
+            .where(OutboxEvent.entity.in_(self.TABLES))
+        )
+        with self._lock:
+            if self._seen == seen:
+                self._seen = newest
+                self._generation = changed or self._generation
+            return self._generation
+
+
+class FragmentCache:
+    """
+    Bounded LRU cache of rendered HTML fragments
+
+    Entries are keyed by (kind, object id, fragment name) and remember the
+    version they were rendered for, so a changed version is a cache miss.
+
+    Fragments also show the names of related rows. Once per request the
+    cache reads ``generation()`` from the database and drops every entry
+    when it changed, so a rename in any worker reaches all of them.
+
+    Usage in templates:
+        {% call cached_fragment('delivery', delivery.id, delivery.updated_at) %}
+          <td>...</td>
+        {% endcall %}
+    """
+
+    def __init__(self, app=None, max_size=10000, generation=None):
+        self.max_size = max_size
+        self.generation = generation or CatalogGeneration()
+        self._generation = None
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the cache and expose it to templates"""
+        self.max_size = app.config.get('FRAGMENT_CACHE_SIZE', self.max_size)
+        app.jinja_env.globals['cached_fragment'] = self.render
+        app.extensions['fragment_cache'] = self
+
+    def check_generation(self):
+        """
+        Read the generation once per request, dropping all fragments when it changed
+
+        Returns:
+            The generation the current request renders for
+        """
+        if 'fragment_generation' not in g:
+            g.fragment_generation = current = self.generation()
+            with self._lock:
+                if current != self._generation:
+                    self._entries.clear()
+                    self._generation = current
+        return g.fragment_generation
+
+    def get(self, kind, obj_id, version, name='row'):
+        """
+        Get a cached fragment
+
+        Returns:
+            str|None: Rendered HTML, or None if missing or stale
+        """
+        key = (kind, obj_id, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, kind, obj_id, version, html, name='row'):
+        """Store a rendered fragment, evicting the least recently used"""
+        key = (kind, obj_id, name)
+        with self._lock:
+            self._entries[key] = (version, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def render(self, kind, obj_id, version, name='row', caller=None):
+        """
+        Return a cached fragment, rendering it through ``caller`` on a miss
+
+        Args:
+            kind (str): Object type, e.g. 'delivery' or 'return'
+            obj_id (int): Primary key of the object
+            version: Value that changes whenever the fragment must be re-rendered
+            name (str): Fragment name, for objects shown in several templates
+            caller: Jinja call block producing the fragment
+
+        Returns:
+            Markup: Rendered HTML
+        """
+        # A request that read an older generation must not store its fragments for newer ones
+        version = (version, self.check_generation())
+        html = self.get(kind, obj_id, version, name)
+        if html is None:
+            html = str(caller())
+            self.set(kind, obj_id, version, html, name)
+        return Markup(html)
+
+    def invalidate(self, kind, *obj_ids):
+        """Drop every fragment of the given objects"""
+        ids = set(obj_ids)
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == kind and key[1] in ids]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        """Drop all fragments"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -25,7 +25,7 @@ class CustomJSONEncoder(BaseJSONEncoder):
                             'name': item.product.name
                         },
                         'quantity': item.quantity,
-                        'price': item.price
+                        'price': str(item.price)
                     }
                     for item in obj.items
                 ]
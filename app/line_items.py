@@ -0,0 +1,146 @@
+"""Validation of JSON line-item submissions for deliveries and returns.
+
+The whole payload is checked in a few passes instead of one nested form
+per row: field types and ranges are checked row by row in plain Python,
+then every referenced product is resolved with a single query. The cost
+stays flat apart from that loop, however many lines a delivery has.
+"""
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from app.extensions import db
+from app.models import Product, Subchain, Supermarket
+
+# Largest price accepted, in tögrög
+MAX_PRICE = Decimal('99999999.99')
+CENT = Decimal('0.01')
+
+# Largest integer a database column holds (SQLite, MySQL BIGINT)
+MAX_INT = 2 ** 63 - 1
+
+
+def _int(value):
+    """Whole number within the database's range, or None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float) and not value.is_integer():
+        # 2.5 is refused rather than truncated; also catches NaN and infinity
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return number if -MAX_INT <= number <= MAX_INT else None
+
+
+def _price(value):
+    try:
+        price = Decimal(str(value))
+        return price.quantize(CENT) if price.is_finite() else None
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _date(value, field, errors):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        errors[field] = 'A date in YYYY-MM-DD format is required'
+        return None
+
+
+def validate_items(items, max_items):
+    """
+    Validate line items and resolve their products
+
+    Args:
+        items (list): Dicts with 'product_id', 'quantity' and 'price'
+        max_items (int): Largest number of lines accepted
+
+    Returns:
+        tuple: (rows, errors) where rows is a list of
+            (product_id, quantity, price) tuples and errors maps the item
+            index to a dict of field errors
+    """
+    if not isinstance(items, list) or not items:
+        return [], {'_all': 'Please add at least one product'}
+    if len(items) > max_items:
+        return [], {'_all': f'At most {max_items} lines can be submitted at once'}
+
+    rows = []
+    errors = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = {'_all': 'Invalid line'}
+            rows.append((None, None, None))
+            continue
+
+        item_errors = {}
+        product_id = _int(item.get('product_id'))
+        if not product_id:
+            item_errors['product_id'] = 'Select a product'
+
+        quantity = _int(item.get('quantity'))
+        if quantity is None or quantity < 1:
+            item_errors['quantity'] = 'Quantity must be greater than 0'
+
+        price = _price(item.get('price'))
+        if price is None or not CENT <= price <= MAX_PRICE:
+            item_errors['price'] = 'Price must be greater than 0'
+
+        if item_errors:
+            errors[index] = item_errors
+        rows.append((product_id, quantity, price))
+
+    # One lookup for every product referenced by the payload
+    wanted = {row[0] for row in rows if row[0]}
+    known = {
+        product_id for (product_id,) in
+        Product.query.with_entities(Product.id).filter(Product.id.in_(wanted))
+    } if wanted else set()
+    for index, (product_id, _, _) in enumerate(rows):
+        if product_id and product_id not in known:
+            errors.setdefault(index, {})['product_id'] = 'Unknown product'
+
+    return rows, errors
+
+
+def validate_delivery_payload(payload, max_items):
+    """
+    Validate a JSON delivery submission
+
+    Args:
+        payload (dict): Decoded request body with 'delivery_date',
+            'supermarket_id', optional 'subchain_id' and 'items'
+        max_items (int): Largest number of lines accepted
+
+    Returns:
+        tuple: (data, errors); data holds the cleaned header fields and
+            'items', errors is empty when the payload is valid
+    """
+    errors = {}
+    if not isinstance(payload, dict):
+        return None, {'_all': 'Expected a JSON object'}
+
+    delivery_date = _date(payload.get('delivery_date'), 'delivery_date', errors)
+
+    supermarket_id = _int(payload.get('supermarket_id'))
+    if not supermarket_id or db.session.get(Supermarket, supermarket_id) is None:
+        errors['supermarket_id'] = 'Select a supermarket'
+
+    subchain_id = _int(payload.get('subchain_id')) or None
+    if subchain_id and 'supermarket_id' not in errors:
+        subchain = db.session.get(Subchain, subchain_id)
+        if subchain is None or subchain.supermarket_id != supermarket_id:
+            errors['subchain_id'] = 'Subchain does not belong to the supermarket'
+
+    rows, item_errors = validate_items(payload.get('items'), max_items)
+    if item_errors:
+        errors['items'] = item_errors
+
+    return {
+        'delivery_date': delivery_date,
+        'supermarket_id': supermarket_id,
+        'subchain_id': subchain_id,
+        'items': rows,
+    }, errors
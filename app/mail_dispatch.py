@@ -0,0 +1,261 @@
+"""Queued email delivery through a bounded pool of worker threads.
+
+Messages are stored in the queued_email table and sent in batches, one
+SMTP connection per batch, with exponential backoff between retries.
+Several processes can share the queue: rows are claimed with a token
+before sending, so no message goes out twice.
+
+Workers are only started by an entry point that serves the app: wsgi.py
+starts them when MAIL_DISPATCH_ASYNC is on, and ``manage.py
+run_mail_workers`` runs one in the foreground. Importing the app, e.g.
+for ``manage.py`` commands or migrations, only queues mail;
+``manage.py send_queued_mail`` sends what is due once.
+
+For local testing, run a debugging SMTP server and point the app at it:
+
+    python -m aiosmtpd -n -l localhost:1025
+    MAIL_SERVER=localhost MAIL_PORT=1025 python manage.py send_queued_mail
+"""
+import base64
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+
+from flask import current_app
+from flask_mail import Message
+
+from app.extensions import db, mail
+from app.models import QueuedEmail
+
+
+class MailDispatcher:
+    """Persistent mail queue with a bounded worker pool"""
+
+    def __init__(self, app=None):
+        self._threads = []
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._stopping = Event()
+        self._logger = logging.getLogger(__name__)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the dispatcher; workers are started with start() or run()"""
+        app.extensions['mail_dispatcher'] = self
+
+    def enqueue(self, message, commit=True):
+        """
+        Store a message for delivery
+
+        Args:
+            message (Message): Flask-Mail message
+            commit (bool): Commit the current session so workers can see it
+
+        Returns:
+            QueuedEmail: The queued row
+        """
+        queued = QueuedEmail(
+            subject=message.subject,
+            sender=json.dumps(message.sender) if message.sender else None,
+            recipients=json.dumps(message.recipients),
+            body=message.body,
+            html=message.html,
+            attachments=json.dumps([
+                {
+                    'filename': a.filename,
+                    'content_type': a.content_type,
+                    'data': base64.b64encode(
+                        a.data.encode('utf-8') if isinstance(a.data, str) else a.data
+                    ).decode('ascii'),
+                }
+                for a in message.attachments
+            ]) if message.attachments else None,
+        )
+        db.session.add(queued)
+        if commit:
+            db.session.commit()
+            self.wake()
+        return queued
+
+    def wake(self):
+        """Tell idle workers that new messages were committed"""
+        self._wakeup.set()
+
+    def start(self, app):
+        """Start the worker threads if they are not running yet"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(app.config.get('MAIL_WORKERS', 2)):
+                thread = Thread(
+                    target=self._run_worker,
+                    args=(app,),
+                    name=f"mail-worker-{i}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Ask the workers to finish their current batch and exit"""
+        self._stopping.set()
+        self._wakeup.set()
+        with self._lock:
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def run(self, app):
+        """Send mail in the calling thread until stop() is called"""
+        self._stopping.clear()
+        self._run_worker(app)
+
+    def _run_worker(self, app):
+        """Worker loop: send batches until the queue is empty, then wait"""
+        claims_released = False
+        while not self._stopping.is_set():
+            try:
+                with app.app_context():
+                    # Retried with the batches, e.g. until the table is migrated
+                    if not claims_released:
+                        self.release_stale_claims()
+                        claims_released = True
+                    sent = self.process_batch()
+            except Exception as e:
+                self._logger.error(f"Mail worker error: {str(e)}", exc_info=True)
+                sent = 0
+
+            if not sent:
+                self._wakeup.wait(app.config.get('MAIL_POLL_INTERVAL', 15))
+                self._wakeup.clear()
+
+    def release_stale_claims(self):
+        """Return messages claimed by a crashed worker to the queue"""
+        timeout = current_app.config.get('MAIL_CLAIM_TIMEOUT', 600)
+        cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+        QueuedEmail.query.filter(
+            QueuedEmail.status == 'sending', QueuedEmail.claimed_at < cutoff
+        ).update({'status': 'pending', 'claim_token': None}, synchronize_session=False)
+        db.session.commit()
+
+    def _claim_batch(self, batch_size):
+        """Atomically claim up to batch_size due messages"""
+        now = datetime.utcnow()
+        due_ids = [
+            row.id
+            for row in db.session.query(QueuedEmail.id)
+            .filter(QueuedEmail.status == 'pending', QueuedEmail.next_attempt_at <= now)
+            .order_by(QueuedEmail.next_attempt_at)
+            .limit(batch_size)
+        ]
+        if not due_ids:
+            db.session.rollback()
+            return []
+
+        token = uuid.uuid4().hex
+        QueuedEmail.query.filter(
+            QueuedEmail.id.in_(due_ids), QueuedEmail.status == 'pending'
+        ).update(
+            {'status': 'sending', 'claim_token': token, 'claimed_at': now},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        return QueuedEmail.query.filter_by(claim_token=token).all()
+
+    def process_batch(self):
+        """
+        Send one batch of due messages over a single SMTP connection
+
+        Returns:
+            int: Number of messages claimed
+        """
+        batch = self._claim_batch(current_app.config.get('MAIL_BATCH_SIZE', 20))
+        if not batch:
+            return 0
+
+        try:
+            with mail.connect() as conn:
+                for queued in batch:
+                    try:
+                        conn.send(self._to_message(queued))
+                        queued.status = 'sent'
+                        queued.sent_at = datetime.utcnow()
+                        queued.last_error = None
+                    except Exception as e:
+                        self._schedule_retry(queued, e)
+        except Exception as e:
+            # Connecting or closing failed: retry whatever did not go out
+            for queued in batch:
+                if queued.status == 'sending':
+                    self._schedule_retry(queued, e)
+
+        db.session.commit()
+        return len(batch)
+
+    def drain(self):
+        """
+        Send every due message synchronously
+
+        Returns:
+            int: Number of messages processed
+        """
+        self.release_stale_claims()
+        total = 0
+        while True:
+            processed = self.process_batch()
+            if not processed:
+                return total
+            total += processed
+
+    def _schedule_retry(self, queued, error):
+        """Back off exponentially, giving up after MAIL_MAX_RETRIES attempts"""
+        config = current_app.config
+        queued.attempts += 1
+        queued.last_error = str(error)
+        queued.claim_token = None
+
+        if queued.attempts >= config.get('MAIL_MAX_RETRIES', 5):
+            queued.status = 'failed'
+            self._logger.error(
+                f"Giving up on email {queued.id} after {queued.attempts} attempts: {error}"
+            )
+            return
+
+        delay = min(
+            config.get('MAIL_RETRY_BASE_DELAY', 30) * 2 ** (queued.attempts - 1),
+            config.get('MAIL_RETRY_MAX_DELAY', 3600),
+        )
+        queued.status = 'pending'
+        queued.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        self._logger.warning(
+            f"Email {queued.id} failed (attempt {queued.attempts}), retrying in {delay}s: {error}"
+        )
+
+    @staticmethod
+    def _to_message(queued):
+        """Rebuild a Flask-Mail message from a queued row"""
+
+        def address(value):
+            return tuple(value) if isinstance(value, list) else value
+
+        message = Message(
+            subject=queued.subject,
+            sender=address(json.loads(queued.sender)) if queued.sender else None,
+            recipients=[address(r) for r in json.loads(queued.recipients)],
+            body=queued.body,
+            html=queued.html,
+        )
+        for attachment in json.loads(queued.attachments or '[]'):
+            message.attach(
+                attachment['filename'],
+                attachment['content_type'],
+                base64.b64decode(attachment['data']),
+            )
+        return message
+
+
+mail_dispatcher = MailDispatcher()
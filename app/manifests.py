@@ -0,0 +1,155 @@
+"""Daily truck load manifests.
+
+The weight of every delivery on a day is summed in one SQL query
+(quantity times ``Product.weight``). The deliveries are then packed into
+trucks with best-fit decreasing: heaviest first, each into the truck
+whose remaining capacity is the smallest that still fits. Remaining
+capacities are kept in a sorted list, so each placement is a binary
+search, and a day with thousands of deliveries plans in milliseconds.
+
+A delivery heavier than a whole truck gets a truck of its own and is
+flagged as overweight instead of being split.
+"""
+import csv
+from bisect import bisect_left, insort
+from io import StringIO
+
+from sqlalchemy import func, select
+
+from app.models import Delivery, DeliveryItem, Product, Subchain, Supermarket
+
+
+def delivery_weights(connection, day):
+    """
+    Total weight and line count of each delivery on a day
+
+    Args:
+        connection: SQLAlchemy connection
+        day (date): Delivery date
+
+    Returns:
+        list: Dicts with 'id', 'supermarket', 'subchain', 'lines' and 'weight' (kg)
+    """
+    delivery = Delivery.__table__
+    item = DeliveryItem.__table__
+    product = Product.__table__
+    supermarket = Supermarket.__table__
+    subchain = Subchain.__table__
+
+    rows = connection.execute(
+        select(
+            delivery.c.id,
+            supermarket.c.name,
+            subchain.c.name,
+            func.count(item.c.id),
+            func.coalesce(func.sum(item.c.quantity * product.c.weight), 0),
+        )
+        .select_from(
+            delivery.join(supermarket, supermarket.c.id == delivery.c.supermarket_id)
+            .outerjoin(subchain, subchain.c.id == delivery.c.subchain_id)
+            .outerjoin(item, item.c.delivery_id == delivery.c.id)
+            .outerjoin(product, product.c.id == item.c.product_id)
+        )
+        .where(delivery.c.delivery_date == day)
+        .group_by(delivery.c.id, supermarket.c.name, subchain.c.name)
+    )
+    return [
+        {
+            'id': delivery_id,
+            'supermarket': supermarket_name,
+            'subchain': subchain_name,
+            'lines': lines,
+            'weight': round(float(weight), 3),
+        }
+        for delivery_id, supermarket_name, subchain_name, lines, weight in rows
+    ]
+
+
+def pack(loads, capacity):
+    """
+    Pack loads into as few trucks as the best-fit decreasing heuristic finds
+
+    Args:
+        loads (list): Dicts with at least a 'weight' key
+        capacity (float): Truck capacity in kg
+
+    Returns:
+        list: Trucks as dicts with 'number', 'loads', 'weight',
+            'utilization' (percent) and 'overweight'
+    """
+    trucks = []
+    # (remaining capacity, truck index), smallest remaining first
+    free = []
+    ordered = sorted(loads, key=lambda load: -load['weight'])
+
+    for load in ordered:
+        weight = load['weight']
+        if weight > capacity:
+            trucks.append({'loads': [load], 'weight': weight, 'overweight': True})
+            continue
+
+        slot = bisect_left(free, (weight, -1))
+        if slot < len(free):
+            remaining, index = free.pop(slot)
+        else:
+            index = len(trucks)
+            trucks.append({'loads': [], 'weight': 0, 'overweight': False})
+            remaining = capacity
+        trucks[index]['loads'].append(load)
+        trucks[index]['weight'] += weight
+        insort(free, (remaining - weight, index))
+
+    for number, truck in enumerate(trucks, start=1):
+        truck['number'] = number
+        truck['weight'] = round(truck['weight'], 3)
+        truck['utilization'] = round(truck['weight'] / capacity * 100, 1) if capacity else 0
+        # Stops in route order: by supermarket, then subchain
+        truck['loads'].sort(
+            key=lambda load: (load.get('supermarket') or '', load.get('subchain') or '')
+        )
+    return trucks
+
+
+def plan_day(connection, day, capacity):
+    """
+    Plan the trucks for one day of deliveries
+
+    Args:
+        connection: SQLAlchemy connection
+        day (date): Delivery date
+        capacity (float): Truck capacity in kg
+
+    Returns:
+        dict: 'date', 'capacity', 'trucks', 'deliveries' and 'total_weight'
+    """
+    loads = delivery_weights(connection, day)
+    return {
+        'date': day,
+        'capacity': capacity,
+        'trucks': pack(loads, capacity),
+        'deliveries': len(loads),
+        'total_weight': round(sum(load['weight'] for load in loads), 3),
+    }
+
+
+def manifest_csv(plan):
+    """Render a day's plan as CSV, one row per stop"""
+    si = StringIO()
+    writer = csv.writer(si)
+    writer.writerow(['Date', 'Truck', 'Stop', 'Delivery', 'Supermarket', 'Subchain',
+                     'Lines', 'Weight (kg)', 'Truck Weight (kg)', 'Overweight'])
+    for truck in plan['trucks']:
+        for stop, load in enumerate(truck['loads'], start=1):
+            writer.writerow([
+                plan['date'].strftime('%Y-%m-%d'),
+                truck['number'],
+                stop,
+                load['id'],
+                load['supermarket'],
+                load['subchain'] or 'N/A',
+                load['lines'],
+                f"{load['weight']:.3f}",
+                f"{truck['weight']:.3f}",
+                'yes' if truck['overweight'] else '',
+            ])
+    return si.getvalue()
@@ -1,32 +1,61 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
-from app.extensions import db, login_manager
+from app.extensions import db, login_manager, user_cache
+from app.utils.passwords import hash_password, verify_password, needs_rehash
 from datetime import datetime
-from decimal import Decimal
+import json
+from app.money import Money, to_cents
 
 
 @login_manager.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    return user_cache.get(
+        int(id),
+        lambda user_id: db.session.get(User, user_id),
+        lambda user_id: db.session.scalar(db.select(User.version).where(User.id == user_id)),
+    )
 
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(255))
+    # Bumped on every change, so other processes can tell a cached user is stale
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    @property
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f'<User {self.username}>'
 
 
-class Supermarket(db.Model):
+@db.event.listens_for(User, 'before_update')
+def _bump_user_version(mapper, connection, target):
+    target.version = (target.version or 0) + 1
+
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def _invalidate_cached_user(mapper, connection, target):
+    """Password changes and deactivation must not be served from the cache"""
+    user_cache.invalidate(target.id)
+
+
+class ChangeTrackingMixin:
+    """Columns kept up to date by app.change_tracking for incremental sync."""
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+
+class Supermarket(ChangeTrackingMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     address = db.Column(db.String(200))
@@ -42,31 +71,54 @@ class Supermarket(db.Model):
     returns = db.relationship('Return', backref='supermarket', lazy=True,
                             cascade='all, delete-orphan')
 
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'address': self.address,
+            'contact_person': self.contact_person,
+            'phone': self.phone,
+            'email': self.email,
+            'version': self.version,
+        }
+
     def __repr__(self):
         return f'<Supermarket {self.name}>'
 
 
-class Subchain(db.Model):
+class Subchain(ChangeTrackingMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     address = db.Column(db.String(200))
     contact_person = db.Column(db.String(100))
     phone = db.Column(db.String(20))
     email = db.Column(db.String(120))
-    supermarket_id = db.Column(db.Integer, db.ForeignKey('supermarket.id'), nullable=False)
+    supermarket_id = db.Column(db.Integer, db.ForeignKey('supermarket.id'), nullable=False, index=True)
     
     # Relationships
     deliveries = db.relationship('Delivery', backref='subchain', lazy=True)
     returns = db.relationship('Return', backref='subchain', lazy=True)
 
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'supermarket_id': self.supermarket_id,
+            'name': self.name,
+            'address': self.address,
+            'contact_person': self.contact_person,
+            'phone': self.phone,
+            'email': self.email,
+            'version': self.version,
+        }
+
     def __repr__(self):
         return f'<Subchain {self.name}>'
 
 
-class Product(db.Model):
+class Product(ChangeTrackingMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    price = db.Column(db.Numeric(10, 2), nullable=False)
+    price_cents = db.Column(db.Integer, nullable=False)
     weight = db.Column(db.Numeric(10, 3), nullable=False)  # Weight in kg
     
     # Relationships with cascade delete
@@ -83,17 +135,38 @@ class Product(db.Model):
         cascade='all, delete-orphan'
     )
 
+    @property
+    def price(self):
+        return Money(self.price_cents) if self.price_cents is not None else None
+
+    @price.setter
+    def price(self, value):
+        self.price_cents = to_cents(value)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'price': str(self.price),
+            'weight': str(self.weight),
+            'version': self.version,
+        }
+
     def __repr__(self):
         return f'<Product {self.name}>'
 
 
-class Delivery(db.Model):
+class Delivery(ChangeTrackingMixin, db.Model):
     __tablename__ = 'delivery'
+    __table_args__ = (
+        # Lookup key of the return matcher; also serves supermarket_id alone
+        db.Index('ix_delivery_match_key', 'supermarket_id', 'delivery_date', 'subchain_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    delivery_date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
+    delivery_date = db.Column(db.Date, nullable=False, default=datetime.utcnow, index=True)
     supermarket_id = db.Column(db.Integer, db.ForeignKey('supermarket.id'), nullable=False)
-    subchain_id = db.Column(db.Integer, db.ForeignKey('subchain.id'))
+    subchain_id = db.Column(db.Integer, db.ForeignKey('subchain.id'), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -106,33 +179,85 @@ class Delivery(db.Model):
 
     @property
     def total_value(self):
-        return sum(item.total_price for item in self.items)
+        # Items already in memory may have unflushed changes; otherwise
+        # the SQL-side total loaded with the row is used
+        if 'items' in self.__dict__:
+            return Money(sum(item.price_cents * item.quantity for item in self.items))
+        return Money(self.total_cents or 0)
+
+    def to_dict(self, include_items=True):
+        data = {
+            'id': self.id,
+            'delivery_date': self.delivery_date.isoformat() if self.delivery_date else None,
+            'supermarket_id': self.supermarket_id,
+            'subchain_id': self.subchain_id,
+            'version': self.version,
+        }
+        if include_items:
+            data['items'] = [item.to_dict() for item in self.items]
+        return data
 
     def __repr__(self):
         return f'<Delivery {self.id} to {self.supermarket.name if self.supermarket else "Unknown"}>'
 
 
 class DeliveryItem(db.Model):
+    __table_args__ = (
+        # Loads a delivery's items and serves the return matcher's join
+        db.Index('ix_delivery_item_delivery_product', 'delivery_id', 'product_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     delivery_id = db.Column(db.Integer, db.ForeignKey('delivery.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Numeric(10, 2), nullable=False)
+    price_cents = db.Column(db.Integer, nullable=False)
+
+    @property
+    def price(self):
+        return Money(self.price_cents) if self.price_cents is not None else None
+
+    @price.setter
+    def price(self, value):
+        self.price_cents = to_cents(value)
 
     @property
     def total_price(self):
-        return Decimal(str(self.price)) * self.quantity
+        return Money(self.price_cents * self.quantity)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'product_id': self.product_id,
+            'quantity': self.quantity,
+            'price': str(self.price),
+        }
 
     def __repr__(self):
         return f'<DeliveryItem {self.product.name} x{self.quantity}>'
 
 
-class Return(db.Model):
+# SUM(quantity * price_cents) of the items, loaded on first use. Exports
+# that need every total undefer it to get them in the same query.
+Delivery.total_cents = db.column_property(
+    db.select(db.func.coalesce(db.func.sum(DeliveryItem.quantity * DeliveryItem.price_cents), 0))
+    .where(DeliveryItem.delivery_id == Delivery.id)
+    .correlate_except(DeliveryItem)
+    .scalar_subquery(),
+    deferred=True,
+)
+
+
+class Return(ChangeTrackingMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_return_match_key', 'supermarket_id', 'delivery_date', 'subchain_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    delivery_date = db.Column(db.Date, nullable=False)
-    return_date = db.Column(db.Date, nullable=False)
+    delivery_date = db.Column(db.Date, nullable=False, index=True)
+    return_date = db.Column(db.Date, nullable=False, index=True)
     supermarket_id = db.Column(db.Integer, db.ForeignKey('supermarket.id'), nullable=False)
-    subchain_id = db.Column(db.Integer, db.ForeignKey('subchain.id'))
+    subchain_id = db.Column(db.Integer, db.ForeignKey('subchain.id'), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -145,22 +270,178 @@ class Return(db.Model):
 
     @property
     def total_value(self):
-        return sum(item.total_price for item in self.items)
+        # Items already in memory may have unflushed changes; otherwise
+        # the SQL-side total loaded with the row is used
+        if 'items' in self.__dict__:
+            return Money(sum(item.price_cents * item.quantity for item in self.items))
+        return Money(self.total_cents or 0)
+
+    def to_dict(self, include_items=True):
+        data = {
+            'id': self.id,
+            'delivery_date': self.delivery_date.isoformat() if self.delivery_date else None,
+            'return_date': self.return_date.isoformat() if self.return_date else None,
+            'supermarket_id': self.supermarket_id,
+            'subchain_id': self.subchain_id,
+            'version': self.version,
+        }
+        if include_items:
+            data['items'] = [item.to_dict() for item in self.items]
+        return data
 
     def __repr__(self):
         return f'<Return {self.id} from {self.supermarket.name if self.supermarket else "Unknown"}>'
 
 
 class ReturnItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_return_item_return_product', 'return_id', 'product_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     return_id = db.Column(db.Integer, db.ForeignKey('return.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Numeric(10, 2), nullable=False)
+    price_cents = db.Column(db.Integer, nullable=False)
+
+    @property
+    def price(self):
+        return Money(self.price_cents) if self.price_cents is not None else None
+
+    @price.setter
+    def price(self, value):
+        self.price_cents = to_cents(value)
 
     @property
     def total_price(self):
-        return Decimal(str(self.price)) * self.quantity
+        return Money(self.price_cents * self.quantity)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'product_id': self.product_id,
+            'quantity': self.quantity,
+            'price': str(self.price),
+        }
 
     def __repr__(self):
         return f'<ReturnItem {self.product.name} x{self.quantity}>'
+
+
+Return.total_cents = db.column_property(
+    db.select(db.func.coalesce(db.func.sum(ReturnItem.quantity * ReturnItem.price_cents), 0))
+    .where(ReturnItem.return_id == Return.id)
+    .correlate_except(ReturnItem)
+    .scalar_subquery(),
+    deferred=True,
+)
+
+
+class OutboxEvent(db.Model):
+    """Append-only change feed read by downstream consumers."""
+    __tablename__ = 'outbox_event'
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    entity = db.Column(db.String(32), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(16), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'created_at': self.created_at.isoformat(),
+            'entity': self.entity,
+            'entity_id': self.entity_id,
+            'action': self.action,
+            'payload': json.loads(self.payload),
+        }
+
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.action} {self.entity} {self.entity_id}>'
+
+
+class QueuedEmail(db.Model):
+    """Outgoing email waiting to be sent by the mail dispatcher."""
+    __tablename__ = 'queued_email'
+    __table_args__ = (
+        db.Index('ix_queued_email_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255))
+    recipients = db.Column(db.Text, nullable=False)  # JSON list
+    body = db.Column(db.Text)
+    html = db.Column(db.Text)
+    attachments = db.Column(db.Text)  # JSON list, data base64 encoded
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime)
+    sent_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<QueuedEmail {self.id} {self.status}>'
+
+
+class StockLedger(db.Model):
+    """Consignment stock per location and product, kept by app.stock_ledger."""
+    __tablename__ = 'stock_ledger'
+    __table_args__ = (
+        # NULLs never collide in a unique index, so rows without a subchain are keyed by 0
+        db.Index('ix_stock_ledger_location_product',
+                 'supermarket_id', db.text('coalesce(subchain_id, 0)'), 'product_id', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    supermarket_id = db.Column(db.Integer, db.ForeignKey('supermarket.id'), nullable=False)
+    subchain_id = db.Column(db.Integer, db.ForeignKey('subchain.id'), index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    delivered = db.Column(db.Integer, nullable=False, default=0)
+    returned = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @property
+    def on_hand(self):
+        return self.delivered - self.returned
+
+    def __repr__(self):
+        return f'<StockLedger {self.subchain_id or self.supermarket_id}/{self.product_id} {self.on_hand}>'
+
+
+class DemandEstimate(db.Model):
+    """Smoothed net demand per location and product, refreshed by app.demand."""
+    __tablename__ = 'demand_estimate'
+    __table_args__ = (
+        db.Index('ix_demand_estimate_location_product',
+                 'supermarket_id', 'subchain_id', 'product_id', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    supermarket_id = db.Column(db.Integer, db.ForeignKey('supermarket.id'), nullable=False)
+    subchain_id = db.Column(db.Integer, db.ForeignKey('subchain.id'))
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    level = db.Column(db.Float, nullable=False)  # delivered minus returned per visit
+    quantity = db.Column(db.Integer, nullable=False)  # suggested order quantity
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DemandEstimate {self.subchain_id or self.supermarket_id}/{self.product_id} {self.quantity}>'
+
+
+class ReturnMatch(db.Model):
+    """Part of a returned item's quantity traced back to a delivery item."""
+    __tablename__ = 'return_match'
+
+    id = db.Column(db.Integer, primary_key=True)
+    return_item_id = db.Column(db.Integer, db.ForeignKey('return_item.id'), nullable=False, index=True)
+    delivery_item_id = db.Column(db.Integer, db.ForeignKey('delivery_item.id'), nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<ReturnMatch {self.return_item_id} -> {self.delivery_item_id} x{self.quantity}>'
@@ -0,0 +1,114 @@
+"""Money amounts stored as whole tögrög cents.
+
+Prices are kept in integer ``*_cents`` columns, so SQLite sums them
+exactly with ``SUM(quantity * price_cents)``. Python totals are integer
+additions too, with no Decimal-through-string round trips. ``Money``
+wraps a cent count for display. It formats like the Decimal it replaces:
+``str()`` gives '12.50', and ``'%.2f'`` and ``f'{m:.2f}'`` work as before.
+It compares with int, Decimal and float amounts; a float matches when it
+is the nearest float to the amount, so ``Money(1234) == 12.34``.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from functools import total_ordering
+
+CENT = Decimal('0.01')
+
+
+def to_cents(value):
+    """
+    Convert a price to cents, rounding half up to the nearest cent
+
+    Args:
+        value: Money, Decimal, int, float or numeric string
+
+    Returns:
+        int: Amount in cents
+    """
+    if isinstance(value, Money):
+        return value.cents
+    if isinstance(value, int):
+        return value * 100
+    # float goes through str so 0.1 means 10 cents, not 0.1000000000000000055...
+    amount = value if isinstance(value, Decimal) else Decimal(str(value))
+    return int((amount / CENT).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+@total_ordering
+class Money:
+    """An amount of tögrög held as integer cents"""
+
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        self.cents = int(cents)
+
+    @classmethod
+    def parse(cls, value):
+        """Money from a Decimal, number or string price"""
+        return cls(to_cents(value))
+
+    @property
+    def decimal(self):
+        return Decimal(self.cents).scaleb(-2)
+
+    def __str__(self):
+        return str(self.decimal)
+
+    def __repr__(self):
+        return f'Money({self.decimal})'
+
+    def __format__(self, spec):
+        return format(self.decimal, spec)
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __hash__(self):
+        # Equal to the hash of the int, Decimal or float it compares equal to
+        return hash(self.decimal)
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        if isinstance(other, (int, Decimal)):
+            return self.decimal == other
+        if isinstance(other, float):
+            return float(self) == other
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        if isinstance(other, (int, Decimal)):
+            return self.decimal < other
+        if isinstance(other, float):
+            return float(self) < other
+        return NotImplemented
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        # sum() starts from 0
+        if other == 0 and isinstance(other, int):
+            return self
+        return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __mul__(self, other):
+        if isinstance(other, int) and not isinstance(other, bool):
+            return Money(self.cents * other)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money(-self.cents)
@@ -0,0 +1,151 @@
+"""Transactional outbox feeding downstream consumers such as the ERP.
+
+Every insert, update and delete of a tracked row appends an OutboxEvent in
+the same transaction, so consumers can follow the event ids instead of
+re-downloading the full history.
+
+Consumers page by event id, which assumes ids are handed out in commit
+order. SQLite has a single writer, so that holds. With concurrent writers,
+as on MySQL or PostgreSQL, a transaction can commit an id below one a
+consumer already moved past, and that event would be skipped.
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import ChangeTrackingMixin, OutboxEvent
+
+
+def _event_row(obj, action, now):
+    """Build the outbox row describing one change"""
+    if action == 'deleted' and hasattr(obj, 'items'):
+        payload = obj.to_dict(include_items=False)
+    else:
+        payload = obj.to_dict()
+
+    return {
+        'created_at': now,
+        'entity': obj.__tablename__,
+        'entity_id': obj.id,
+        'action': action,
+        'payload': json.dumps(payload, default=str),
+    }
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_changes(session, flush_context):
+    """Append outbox events for the rows written by this flush"""
+    now = datetime.utcnow()
+    rows = []
+
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, ChangeTrackingMixin):
+                rows.append(_event_row(obj, 'created', now))
+        for obj in session.dirty:
+            if isinstance(obj, ChangeTrackingMixin) and session.is_modified(obj):
+                rows.append(_event_row(obj, 'updated', now))
+        for obj in session.deleted:
+            if isinstance(obj, ChangeTrackingMixin):
+                rows.append(_event_row(obj, 'deleted', now))
+
+    if rows:
+        session.connection().execute(OutboxEvent.__table__.insert(), rows)
+
+
+def fetch_events(after=0, limit=500):
+    """
+    Get outbox events newer than a cursor
+
+    Args:
+        after (int): Last event id already processed
+        limit (int): Maximum number of events to return
+
+    Returns:
+        list: OutboxEvent rows in id order
+    """
+    return (
+        OutboxEvent.query.filter(OutboxEvent.id > after)
+        .order_by(OutboxEvent.id)
+        .limit(limit)
+        .all()
+    )
+
+
+def wait_for_events(after=0, limit=500, timeout=25, poll_interval=0.5):
+    """
+    Long-poll for outbox events newer than a cursor
+
+    Args:
+        after (int): Last event id already processed
+        limit (int): Maximum number of events to return
+        timeout (float): Seconds to wait before returning an empty list
+        poll_interval (float): Seconds between polls
+
+    Returns:
+        list: OutboxEvent rows in id order
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        events = fetch_events(after, limit)
+        if events or time.monotonic() >= deadline:
+            return events
+
+        # End the read transaction so SQLite does not hold a lock while we wait
+        db.session.rollback()
+        time.sleep(poll_interval)
+
+
+def _write_atomic(path, text):
+    """Write a file so readers never see it half written"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def export_ndjson(directory, batch_size=1000):
+    """
+    Write outbox events not exported yet as NDJSON batch files
+
+    The last exported event id is kept in a ``cursor`` file inside the
+    directory, so every run only writes what changed since the previous one.
+
+    Args:
+        directory (str): Output directory
+        batch_size (int): Maximum number of events per file
+
+    Returns:
+        list: Paths of the files written
+    """
+    os.makedirs(directory, exist_ok=True)
+    cursor_path = os.path.join(directory, 'cursor')
+
+    after = 0
+    if os.path.exists(cursor_path):
+        with open(cursor_path, encoding='utf-8') as f:
+            after = int(f.read().strip() or 0)
+
+    written = []
+    while True:
+        events = fetch_events(after, batch_size)
+        if not events:
+            break
+
+        path = os.path.join(
+            directory, f"outbox-{events[0].id:012d}-{events[-1].id:012d}.ndjson"
+        )
+        _write_atomic(
+            path,
+            ''.join(json.dumps(e.to_dict(), ensure_ascii=False) + '\n' for e in events),
+        )
+        after = events[-1].id
+        _write_atomic(cursor_path, str(after))
+        written.append(path)
+
+    return written
@@ -0,0 +1,177 @@
+"""In-memory typeahead index over product names.
+
+Every word of every product name is kept in one sorted list, so a prefix
+lookup is two binary searches, which works like walking a trie. The
+catalogue is small enough to hold per process, so a keystroke costs no
+database query. The SQLite FTS5 table of ``search_index`` is not used:
+it exists on SQLite only, and its prefix queries have no equivalent of
+the fuzzy fallback below.
+
+The index is rebuilt when the product table changes. Changes are
+detected by comparing the row count and the newest ``updated_at``, at
+most every PRODUCT_SEARCH_CHECK_INTERVAL seconds, so other processes'
+edits are picked up as well. Edits made by this process are checked for
+on the next search.
+"""
+import difflib
+import heapq
+import time
+import unicodedata
+from bisect import bisect_left
+from threading import Lock
+
+from sqlalchemy import event, func
+
+from app.extensions import db
+from app.models import Product
+
+
+def normalize(text):
+    """Casefold and strip accents so 'Cafe' finds 'Café'"""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class ProductIndex:
+    """
+    Prefix index of product name words with a fuzzy fallback
+
+    Queries match products where every query word is the prefix of a word
+    in the name. A query word that prefixes nothing is replaced by its
+    closest indexed words, which tolerates small typos.
+    """
+
+    def __init__(self, app=None, limit=20, check_interval=2):
+        self.limit = limit
+        self.check_interval = check_interval
+        self._checked_at = None
+        self._signature = None
+        self._keys = []
+        self._ids = []
+        self._vocabulary = []
+        self._products = {}
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read search settings from the app config"""
+        self.limit = app.config.get('PRODUCT_SEARCH_LIMIT', self.limit)
+        self.check_interval = app.config.get('PRODUCT_SEARCH_CHECK_INTERVAL', self.check_interval)
+        app.extensions['product_index'] = self
+
+    def _current_signature(self):
+        return db.session.query(func.count(Product.id), func.max(Product.updated_at)).one()
+
+    def expire(self):
+        """Check for product changes on the next search"""
+        self._checked_at = None
+
+    def refresh(self):
+        """Rebuild the index if products changed since the last build"""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        signature = tuple(self._current_signature())
+        if signature == self._signature:
+            return
+
+        rows = db.session.query(Product.id, Product.name, Product.price_cents).all()
+        products = {}
+        pairs = []
+        for product_id, name, price_cents in rows:
+            normalized = normalize(name)
+            products[product_id] = (name, (price_cents or 0) / 100, normalized)
+            pairs.extend((word, product_id) for word in set(normalized.split()))
+        pairs.sort()
+
+        with self._lock:
+            self._products = products
+            self._keys = [word for word, _ in pairs]
+            self._ids = [product_id for _, product_id in pairs]
+            self._vocabulary = sorted(set(self._keys))
+            self._signature = signature
+
+    def _prefix(self, keys, ids, term):
+        lo = bisect_left(keys, term)
+        hi = bisect_left(keys, term + '\uffff', lo)
+        return set(ids[lo:hi])
+
+    def search(self, query, limit=None):
+        """
+        Find products whose name matches a typed query
+
+        Args:
+            query (str): Text typed by the user
+            limit (int): Maximum number of results, PRODUCT_SEARCH_LIMIT by default
+
+        Returns:
+            list: Dicts with 'id', 'name' and 'price', best matches first
+        """
+        terms = normalize(query).split()
+        if not terms:
+            return []
+
+        self.refresh()
+        with self._lock:
+            keys, ids, vocabulary, products = (
+                self._keys, self._ids, self._vocabulary, self._products
+            )
+
+        matched = None
+        for term in terms:
+            found = self._prefix(keys, ids, term)
+            if not found:
+                # Typos rarely hit the first letter; comparing only words that
+                # share it keeps the fuzzy pass to a small slice of the vocabulary
+                lo = bisect_left(vocabulary, term[0])
+                hi = bisect_left(vocabulary, term[0] + '\uffff', lo)
+                for word in difflib.get_close_matches(term, vocabulary[lo:hi], n=3, cutoff=0.75):
+                    found |= self._prefix(keys, ids, word)
+            matched = found if matched is None else matched & found
+            if not matched:
+                return []
+
+        phrase = ' '.join(terms)
+        best = heapq.nsmallest(
+            limit or self.limit,
+            matched,
+            key=lambda product_id: (
+                not products[product_id][2].startswith(phrase),
+                len(products[product_id][2]),
+                products[product_id][2],
+            ),
+        )
+        return [
+            {'id': product_id, 'name': products[product_id][0], 'price': products[product_id][1]}
+            for product_id in best
+        ]
+
+
+def selected_product_choices(product_forms):
+    """
+    Build select choices for only the products a submitted form refers to
+
+    Product selects are filled by the typeahead in the browser, so the
+    server only needs the submitted products as valid choices.
+
+    Args:
+        product_forms: FieldList of product subforms
+
+    Returns:
+        list: (id, label) choices, starting with the empty choice
+    """
+    ids = {f.product_id.data for f in product_forms if f.product_id.data}
+    products = Product.query.filter(Product.id.in_(ids)).order_by(Product.name).all() if ids else []
+    return [(0, 'Select Product')] + [(p.id, f"{p.name} (₮{p.price})") for p in products]
+
+
+product_index = ProductIndex()
+
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+@event.listens_for(Product, 'after_delete')
+def _product_changed(mapper, connection, target):
+    product_index.expire()
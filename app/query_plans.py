@@ -0,0 +1,187 @@
+"""Query plan checks for the hot queries.
+
+Each check builds a query shaped like one the app runs on every page
+view, flush or report. It runs ``EXPLAIN QUERY PLAN`` on it and fails when
+SQLite reads a table from start to end. A plain ``SCAN <table>`` means a
+missing index. ``SCAN <table> USING INDEX`` walks an index in order, which
+is expected for unfiltered listings. Listings also must not need a
+temporary B-tree to sort.
+
+``manage.py check_query_plans`` runs the checks against the configured
+database. SQLite picks join order from the ``ANALYZE`` statistics, so run
+it after ``db upgrade``, which refreshes them. Without statistics a date
+range join can start from the item table even when every index exists.
+tests/test_query_plans.py runs the checks on a seeded and analyzed
+database, so a dropped index or a reshaped query fails the test suite.
+"""
+from datetime import date
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import undefer
+
+from app.models import (
+    Delivery,
+    DeliveryItem,
+    Product,
+    Return,
+    ReturnItem,
+    Subchain,
+    Supermarket,
+)
+
+DAY = date(2024, 1, 15)
+
+
+def _items_of_delivery():
+    return select(DeliveryItem).where(DeliveryItem.delivery_id == 1)
+
+
+def _items_of_return():
+    return select(ReturnItem).where(ReturnItem.return_id == 1)
+
+
+def _delivery_items_of_product():
+    return select(DeliveryItem).where(DeliveryItem.product_id == 1)
+
+
+def _return_items_of_product():
+    return select(ReturnItem).where(ReturnItem.product_id == 1)
+
+
+def _subchains_of_supermarket():
+    return select(Subchain).where(Subchain.supermarket_id == 1).order_by(Subchain.name)
+
+
+def _deliveries_of_supermarket():
+    return select(Delivery).where(Delivery.supermarket_id == 1)
+
+
+def _deliveries_of_subchain():
+    return select(Delivery).where(Delivery.subchain_id == 1)
+
+
+def _returns_of_supermarket():
+    return select(Return).where(Return.supermarket_id == 1)
+
+
+def _returns_of_subchain():
+    return select(Return).where(Return.subchain_id == 1)
+
+
+def _delivery_listing():
+    return (
+        select(Delivery).options(undefer(Delivery.total_cents))
+        .order_by(Delivery.delivery_date.desc(), Delivery.id.desc())
+    )
+
+
+def _return_listing():
+    return (
+        select(Return).options(undefer(Return.total_cents))
+        .order_by(Return.return_date.desc(), Return.id.desc())
+    )
+
+
+def _deliveries_on_day():
+    return (
+        select(Delivery.id, Supermarket.name, Subchain.name,
+               func.sum(DeliveryItem.quantity * Product.weight))
+        .select_from(Delivery)
+        .join(Supermarket, Supermarket.id == Delivery.supermarket_id)
+        .outerjoin(Subchain, Subchain.id == Delivery.subchain_id)
+        .outerjoin(DeliveryItem, DeliveryItem.delivery_id == Delivery.id)
+        .outerjoin(Product, Product.id == DeliveryItem.product_id)
+        .where(Delivery.delivery_date == DAY)
+        .group_by(Delivery.id, Supermarket.name, Subchain.name)
+    )
+
+
+def _statement_lines():
+    return (
+        select(Delivery.supermarket_id, Delivery.subchain_id, Delivery.delivery_date,
+               Product.name, func.sum(DeliveryItem.quantity * DeliveryItem.price_cents))
+        .select_from(Delivery)
+        .join(DeliveryItem, DeliveryItem.delivery_id == Delivery.id)
+        .join(Product, Product.id == DeliveryItem.product_id)
+        .where(Delivery.delivery_date >= DAY, Delivery.delivery_date <= DAY)
+        .group_by(Delivery.supermarket_id, Delivery.subchain_id,
+                  Delivery.delivery_date, Product.name)
+    )
+
+
+def _returns_in_period():
+    return select(Return).where(Return.return_date >= DAY, Return.return_date <= DAY)
+
+
+def _return_match_candidates():
+    return (
+        select(DeliveryItem.id, DeliveryItem.quantity, Delivery.subchain_id)
+        .join(Delivery, Delivery.id == DeliveryItem.delivery_id)
+        .where(
+            Delivery.supermarket_id.in_([1, 2]),
+            Delivery.delivery_date.in_([DAY]),
+            DeliveryItem.product_id.in_([1, 2, 3]),
+        )
+    )
+
+
+# name -> (query builder, sorted listing)
+CHECKS = {
+    'delivery items of a delivery': (_items_of_delivery, False),
+    'return items of a return': (_items_of_return, False),
+    'delivery items of a product': (_delivery_items_of_product, False),
+    'return items of a product': (_return_items_of_product, False),
+    'subchains of a supermarket': (_subchains_of_supermarket, False),
+    'deliveries of a supermarket': (_deliveries_of_supermarket, False),
+    'deliveries of a subchain': (_deliveries_of_subchain, False),
+    'returns of a supermarket': (_returns_of_supermarket, False),
+    'returns of a subchain': (_returns_of_subchain, False),
+    'delivery listing': (_delivery_listing, True),
+    'return listing': (_return_listing, True),
+    'deliveries on a day': (_deliveries_on_day, False),
+    'statement lines': (_statement_lines, False),
+    'returns in a period': (_returns_in_period, False),
+    'return match candidates': (_return_match_candidates, False),
+}
+
+
+def explain(connection, statement):
+    """
+    EXPLAIN QUERY PLAN of a statement on SQLite
+
+    Returns:
+        list: Plan detail strings, e.g. 'SEARCH delivery USING INDEX ...'
+    """
+    compiled = statement.compile(
+        dialect=connection.dialect, compile_kwargs={'render_postcompile': True}
+    )
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled.string}", params)
+    return [row[3] for row in rows]
+
+
+def _problems(details, listing):
+    problems = []
+    for detail in details:
+        if detail.startswith('SCAN ') and ' USING ' not in detail:
+            problems.append(detail)
+        elif listing and detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            problems.append(detail)
+    return problems
+
+
+def check_plans(connection):
+    """
+    Explain every hot query and collect the full table scans
+
+    Args:
+        connection: SQLAlchemy connection to a SQLite database
+
+    Returns:
+        list: (check name, plan details, offending details) per check
+    """
+    results = []
+    for name, (build, listing) in CHECKS.items():
+        details = explain(connection, build())
+        results.append((name, details, _problems(details, listing)))
+    return results
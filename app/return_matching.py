@@ -0,0 +1,327 @@
+"""Trace returned items back to the delivery items they came from.
+
+A return item matches delivery items with the same supermarket,
+subchain, product and delivery date. Its quantity is allocated to those
+delivery items oldest first, without taking more than a delivery item has
+left after earlier returns. Allocations are stored in ``return_match``.
+Whatever cannot be allocated shows up in the shortfall report:
+- *unmatched* when no delivery with that key exists at all
+- *over-returned* when more came back than was delivered
+
+Matching runs in batches. Each batch loads its return items and every
+candidate delivery item with one query each, through the
+(supermarket, delivery_date, subchain) indexes. It then joins them in a
+dict keyed by the match key. Keys never share delivery items, so a key
+can be matched again on its own. Flush listeners re-match every key a
+flush touches in the same transaction, with the same result a full
+re-match would give. ``manage.py match_returns`` re-matches the whole
+history.
+"""
+from collections import defaultdict
+
+from sqlalchemy import case, event, exists, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import (
+    Delivery,
+    DeliveryItem,
+    Product,
+    Return,
+    ReturnItem,
+    ReturnMatch,
+    Subchain,
+    Supermarket,
+)
+
+BATCH_SIZE = 500
+
+KEY_ATTRS = ('supermarket_id', 'subchain_id', 'delivery_date')
+
+delivery = Delivery.__table__
+delivery_item = DeliveryItem.__table__
+return_ = Return.__table__
+return_item = ReturnItem.__table__
+return_match = ReturnMatch.__table__
+
+
+def _batches(ids, size=BATCH_SIZE):
+    ids = sorted(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _match_batch(connection, ids):
+    """Allocate one batch of return items; existing allocations must be gone"""
+    returned = connection.execute(
+        select(return_item.c.id, return_item.c.product_id, return_item.c.quantity,
+               return_.c.supermarket_id, return_.c.subchain_id, return_.c.delivery_date)
+        .select_from(return_item.join(return_, return_.c.id == return_item.c.return_id))
+        .where(return_item.c.id.in_(ids))
+        .order_by(return_item.c.id)
+    ).all()
+    if not returned:
+        return 0
+
+    supermarkets = {row.supermarket_id for row in returned}
+    dates = {row.delivery_date for row in returned}
+    products = {row.product_id for row in returned}
+    candidates = connection.execute(
+        select(delivery_item.c.id, delivery_item.c.product_id, delivery_item.c.quantity,
+               delivery.c.supermarket_id, delivery.c.subchain_id, delivery.c.delivery_date)
+        .select_from(delivery_item.join(delivery, delivery.c.id == delivery_item.c.delivery_id))
+        .where(
+            delivery.c.supermarket_id.in_(supermarkets),
+            delivery.c.delivery_date.in_(dates),
+            delivery_item.c.product_id.in_(products),
+        )
+        .order_by(delivery_item.c.id)
+    ).all()
+    if not candidates:
+        return 0
+
+    # Quantities already taken by returns outside this batch
+    taken = dict(connection.execute(
+        select(return_match.c.delivery_item_id, func.sum(return_match.c.quantity))
+        .where(return_match.c.delivery_item_id.in_([row.id for row in candidates]))
+        .group_by(return_match.c.delivery_item_id)
+    ).all())
+
+    available = defaultdict(list)
+    for row in candidates:
+        left = row.quantity - taken.get(row.id, 0)
+        if left > 0:
+            key = (row.supermarket_id, row.subchain_id, row.delivery_date, row.product_id)
+            available[key].append([row.id, left])
+
+    allocations = []
+    for row in returned:
+        wanted = row.quantity
+        key = (row.supermarket_id, row.subchain_id, row.delivery_date, row.product_id)
+        for slot in available.get(key, ()):
+            if not wanted:
+                break
+            if not slot[1]:
+                continue
+            quantity = min(wanted, slot[1])
+            slot[1] -= quantity
+            wanted -= quantity
+            allocations.append({
+                'return_item_id': row.id,
+                'delivery_item_id': slot[0],
+                'quantity': quantity,
+            })
+
+    if allocations:
+        connection.execute(return_match.insert(), allocations)
+    return len(allocations)
+
+
+def match_return_items(connection, ids):
+    """
+    (Re-)match some return items against deliveries
+
+    Args:
+        connection: SQLAlchemy connection inside the current transaction
+        ids: ReturnItem primary keys
+
+    Returns:
+        int: Number of allocations written
+    """
+    written = 0
+    for batch in _batches(ids):
+        connection.execute(return_match.delete().where(return_match.c.return_item_id.in_(batch)))
+        written += _match_batch(connection, batch)
+    return written
+
+
+def match_all(connection, batch_size=BATCH_SIZE):
+    """
+    Drop every allocation and match the whole return history again
+
+    Returns are processed in id order, so earlier returns take delivered
+    quantities first.
+
+    Args:
+        connection: SQLAlchemy connection; the caller commits
+        batch_size (int): Return items per batch
+
+    Returns:
+        tuple: (return items processed, allocations written)
+    """
+    connection.execute(return_match.delete())
+    ids = connection.execute(select(return_item.c.id)).scalars().all()
+    written = 0
+    for batch in _batches(ids, batch_size):
+        written += _match_batch(connection, batch)
+    return len(ids), written
+
+
+def _key_return_items(connection, keys):
+    """Ids of every return item with one of some match keys, in id order"""
+    by_location = defaultdict(set)
+    for supermarket_id, subchain_id, delivery_date, product_id in keys:
+        by_location[(supermarket_id, subchain_id, delivery_date)].add(product_id)
+
+    found = set()
+    for (supermarket_id, subchain_id, delivery_date), products in by_location.items():
+        found.update(connection.execute(
+            select(return_item.c.id)
+            .select_from(return_item.join(return_, return_.c.id == return_item.c.return_id))
+            .where(
+                return_.c.supermarket_id == supermarket_id,
+                return_.c.delivery_date == delivery_date,
+                return_.c.subchain_id.is_not_distinct_from(subchain_id),
+                return_item.c.product_id.in_(products),
+            )
+        ).scalars())
+    return sorted(found)
+
+
+def _stored_keys(connection, items, parents, parent_id, ids):
+    """Match keys some items have in the database, before a flush changes them"""
+    keys = set()
+    for batch in _batches(ids):
+        keys.update(tuple(row) for row in connection.execute(
+            select(parents.c.supermarket_id, parents.c.subchain_id, parents.c.delivery_date,
+                   items.c.product_id)
+            .select_from(items.join(parents, parents.c.id == parent_id))
+            .where(items.c.id.in_(batch))
+        ))
+    return keys
+
+
+def _current_key(item):
+    parent = item.delivery if isinstance(item, DeliveryItem) else item.return_obj
+    if parent is None:
+        return None
+    return (parent.supermarket_id, parent.subchain_id, parent.delivery_date, item.product_id)
+
+
+def _key_changed(obj, attrs):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+def _touched_items(session):
+    """
+    Delivery and return items a flush will write, and those it will delete
+
+    Items dropped from a parent's collection are deleted as orphans
+    during the flush, so they count as deleted already.
+    """
+    touched, deleted = {}, {}
+    new, dirty = session.new, session.dirty
+    for obj in list(new) + list(dirty) + list(session.deleted):
+        if isinstance(obj, (ReturnItem, DeliveryItem)):
+            (deleted if obj in session.deleted else touched)[id(obj)] = obj
+        elif isinstance(obj, (Return, Delivery)) and obj in dirty:
+            if _key_changed(obj, KEY_ATTRS):
+                touched.update((id(item), item) for item in obj.items)
+            for item in inspect(obj).attrs['items'].history.deleted:
+                # Moved to another parent, or left without one
+                orphaned = _current_key(item) is None
+                (deleted if orphaned else touched)[id(item)] = item
+    return touched, deleted
+
+
+@event.listens_for(Session, 'before_flush')
+def _release_matches(session, flush_context, instances):
+    """
+    Note the keys a flush touches and drop matches of items it deletes
+
+    The matches go before their items, so the foreign keys hold.
+    """
+    with session.no_autoflush:
+        touched, deleted = _touched_items(session)
+    stored = [obj for obj in list(touched.values()) + list(deleted.values())
+              if inspect(obj).has_identity]
+    if not stored:
+        return
+
+    connection = session.connection()
+    keys = session.info.setdefault('return_match_keys', set())
+    return_ids = [obj.id for obj in stored if isinstance(obj, ReturnItem)]
+    delivery_ids = [obj.id for obj in stored if isinstance(obj, DeliveryItem)]
+    keys |= _stored_keys(connection, return_item, return_, return_item.c.return_id, return_ids)
+    keys |= _stored_keys(connection, delivery_item, delivery, delivery_item.c.delivery_id,
+                         delivery_ids)
+
+    for batch in _batches(obj.id for obj in deleted.values() if isinstance(obj, ReturnItem)):
+        connection.execute(return_match.delete().where(return_match.c.return_item_id.in_(batch)))
+    for batch in _batches(obj.id for obj in deleted.values() if isinstance(obj, DeliveryItem)):
+        connection.execute(return_match.delete().where(return_match.c.delivery_item_id.in_(batch)))
+
+
+@event.listens_for(Session, 'after_flush')
+def _match_changes(session, flush_context):
+    """Match every key a flush touched again, before or after the change"""
+    keys = session.info.pop('return_match_keys', set())
+    with session.no_autoflush:
+        touched, _ = _touched_items(session)
+        for item in touched.values():
+            if item not in session.deleted:
+                keys.add(_current_key(item))
+    keys.discard(None)
+    if not keys:
+        return
+
+    connection = session.connection()
+    ids = _key_return_items(connection, keys)
+    # Free the whole key first, so the earliest returns take deliveries first
+    for batch in _batches(ids):
+        connection.execute(return_match.delete().where(return_match.c.return_item_id.in_(batch)))
+    for batch in _batches(ids):
+        _match_batch(connection, batch)
+
+
+def shortfalls(status=None):
+    """
+    Return items whose quantity is not fully traced to deliveries
+
+    Args:
+        status (str): Optional 'unmatched' or 'over_returned' filter
+
+    Returns:
+        list: Rows with return and item details, returned, matched and status
+    """
+    matched = (
+        select(func.coalesce(func.sum(ReturnMatch.quantity), 0))
+        .where(ReturnMatch.return_item_id == ReturnItem.id)
+        .correlate(ReturnItem)
+        .scalar_subquery()
+    )
+    has_candidate = exists(
+        select(DeliveryItem.id)
+        .join(Delivery, Delivery.id == DeliveryItem.delivery_id)
+        .where(
+            Delivery.supermarket_id == Return.supermarket_id,
+            Delivery.delivery_date == Return.delivery_date,
+            Delivery.subchain_id.is_not_distinct_from(Return.subchain_id),
+            DeliveryItem.product_id == ReturnItem.product_id,
+        )
+    )
+    status_column = case((has_candidate, 'over_returned'), else_='unmatched')
+
+    query = (
+        db.session.query(
+            Return.id.label('return_id'),
+            Return.return_date,
+            Return.delivery_date,
+            Supermarket.name.label('supermarket'),
+            Subchain.name.label('subchain'),
+            Product.name.label('product'),
+            ReturnItem.quantity.label('returned'),
+            matched.label('matched'),
+            status_column.label('status'),
+        )
+        .select_from(ReturnItem)
+        .join(Return, Return.id == ReturnItem.return_id)
+        .join(Supermarket, Supermarket.id == Return.supermarket_id)
+        .outerjoin(Subchain, Subchain.id == Return.subchain_id)
+        .join(Product, Product.id == ReturnItem.product_id)
+        .filter(matched < ReturnItem.quantity)
+    )
+    if status in ('unmatched', 'over_returned'):
+        query = query.filter(status_column == status)
+    return query.order_by(Return.return_date.desc(), Return.id).all()
@@ -6,6 +6,9 @@ from app.routes.return_routes import return_bp
 from app.routes.product_routes import product_bp
 from app.routes.supermarket_routes import supermarket_bp
 from app.routes.report_routes import report_bp
+from app.routes.outbox_routes import outbox_bp
+from app.routes.search_routes import search_bp
+from app.routes.stock_routes import stock_bp
 
 __all__ = [
     'auth_bp',
@@ -14,5 +17,8 @@ __all__ = [
     'return_bp',
     'product_bp',
     'supermarket_bp',
-    'report_bp'
+    'report_bp',
+    'outbox_bp',
+    'search_bp',
+    'stock_bp'
 ]
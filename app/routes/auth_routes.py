@@ -1,9 +1,11 @@
 """Authentication routes for the application."""
 from flask import Blueprint, render_template, redirect, url_for, flash
 from flask_login import login_user, logout_user, current_user
-from app.extensions import db
+from app.extensions import db, user_cache
 from app.forms import LoginForm, RegistrationForm
 from app.models import User
+from app.utils.passwords import PasswordHasherBusy
+from app.utils.rate_limit import rate_limit
 
 
 # Create the blueprint
@@ -11,6 +13,7 @@ auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@rate_limit('login', limit=10, period=300, methods=('POST',))
 def login():
     """Handle user login."""
     if current_user.is_authenticated:
@@ -19,7 +22,17 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user is None or not user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+            if valid and user.password_needs_rehash:
+                # Hash parameters changed since this password was set
+                user.set_password(form.password.data)
+                db.session.commit()
+        except PasswordHasherBusy:
+            flash('Too many sign-in attempts right now, please try again shortly', 'error')
+            return render_template('auth/login.html', title='Sign In', form=form), 503
+
+        if not valid:
             flash('Invalid username or password', 'error')
             return redirect(url_for('auth.login'))
             
@@ -32,6 +45,8 @@ def login():
 @auth_bp.route('/logout')
 def logout():
     """Handle user logout."""
+    if current_user.is_authenticated:
+        user_cache.invalidate(current_user.id)
     logout_user()
     return redirect(url_for('main.index'))
 
@@ -45,7 +60,11 @@ def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         user = User(username=form.username.data, email=form.email.data)
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except PasswordHasherBusy:
+            flash('The server is busy, please try again shortly', 'error')
+            return render_template('auth/register.html', title='Register', form=form), 503
         db.session.add(user)
         db.session.commit()
         flash('Congratulations, you are now a registered user!', 'success')
@@ -1,10 +1,18 @@
 """Delivery management routes."""
-from flask import Blueprint, render_template, redirect, url_for, flash, jsonify, make_response, request
+from flask import Blueprint, render_template, redirect, url_for, flash, jsonify, make_response, request, current_app
 from flask_login import login_required
-from app.extensions import db
+from sqlalchemy.orm import selectinload
+from app.extensions import db, fragment_cache
 from app.models import Delivery, DeliveryItem, Product, Supermarket, Subchain
 from app.forms import DeliveryForm
+from app.streaming import stream_page
+from app.line_items import validate_delivery_payload
+from app.product_search import selected_product_choices
+from app.manifests import plan_day, manifest_csv
+from app.demand import suggestions as demand_suggestions
 import csv
+import math
+from datetime import date
 from io import StringIO
 from flask_wtf import FlaskForm
 
@@ -16,9 +24,15 @@ delivery_bp = Blueprint('delivery', __name__, url_prefix='/delivery')
 @login_required
 def index():
     """List all deliveries."""
-    deliveries = Delivery.query.order_by(Delivery.delivery_date.desc()).all()
+    deliveries = Delivery.query.options(
+        selectinload(Delivery.supermarket),
+        selectinload(Delivery.subchain),
+        selectinload(Delivery.items).selectinload(DeliveryItem.product),
+    ).order_by(Delivery.delivery_date.desc()).yield_per(
+        current_app.config['LISTING_YIELD_PER']
+    )
     form = FlaskForm()
-    return render_template('delivery/index.html', deliveries=deliveries, form=form)
+    return stream_page('delivery/index.html', deliveries=deliveries, form=form)
 
 
 @delivery_bp.route('/create', methods=['GET', 'POST'])
@@ -39,12 +53,10 @@ def create():
             (s.id, s.name) for s in subchains
         ]
     
-    # Populate product choices for each product form
+    # Products are picked with the typeahead; only submitted ones need choices
+    product_choices = selected_product_choices(form.products)
     for product_form in form.products:
-        product_form.product_id.choices = [
-            (p.id, f"{p.name} (${p.price})") 
-            for p in Product.query.order_by('name').all()
-        ]
+        product_form.product_id.choices = product_choices
     
     if form.validate_on_submit():
         try:
@@ -79,6 +91,40 @@ def create():
     return render_template('delivery/create.html', form=form)
 
 
+@delivery_bp.route('/api', methods=['POST'])
+@login_required
+def create_api():
+    """Create a delivery with all of its lines from one JSON body (JSON endpoint)."""
+    data, errors = validate_delivery_payload(
+        request.get_json(silent=True), current_app.config['DELIVERY_MAX_ITEMS']
+    )
+    if errors:
+        return jsonify({'errors': errors}), 400
+
+    try:
+        delivery = Delivery(
+            delivery_date=data['delivery_date'],
+            supermarket_id=data['supermarket_id'],
+            subchain_id=data['subchain_id'],
+        )
+        delivery.items = [
+            DeliveryItem(product_id=product_id, quantity=quantity, price=price)
+            for product_id, quantity, price in data['items']
+        ]
+        db.session.add(delivery)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error creating delivery: {str(e)}")
+        return jsonify({'errors': {'_all': f'Error creating delivery: {str(e)}'}}), 500
+
+    flash('Delivery created successfully', 'success')
+    return jsonify({
+        'id': delivery.id,
+        'redirect': url_for('delivery.index'),
+    }), 201
+
+
 @delivery_bp.route('/<int:delivery_id>')
 @login_required
 def view(delivery_id):
@@ -97,6 +143,21 @@ def get_subchains(supermarket_id):
     ])
 
 
+@delivery_bp.route('/suggestions')
+@login_required
+def suggestions():
+    """Suggested products and quantities for a location (AJAX endpoint)."""
+    supermarket_id = request.args.get('supermarket_id', type=int)
+    if not supermarket_id:
+        return jsonify([])
+    subchain_id = request.args.get('subchain_id', type=int) or None
+    response = jsonify(demand_suggestions(supermarket_id, subchain_id))
+    # Estimates only change with the nightly refresh
+    response.cache_control.private = True
+    response.cache_control.max_age = 3600
+    return response
+
+
 @delivery_bp.route('/get_products')
 @login_required
 def get_products():
@@ -146,6 +207,32 @@ def download():
     return output 
 
 
+@delivery_bp.route('/manifest')
+@login_required
+def manifest():
+    """Truck load manifest for one day of deliveries."""
+    try:
+        day = date.fromisoformat(request.args.get('date', ''))
+    except ValueError:
+        day = date.today()
+    capacity = request.args.get('capacity', type=float)
+    # float() accepts 'nan' and 'inf', which no truck can be planned for
+    if (
+        capacity is None
+        or not math.isfinite(capacity)
+        or not 0 < capacity <= current_app.config['TRUCK_CAPACITY_MAX_KG']
+    ):
+        capacity = current_app.config['TRUCK_CAPACITY_KG']
+
+    plan = plan_day(db.session.connection(), day, capacity)
+    if request.args.get('format') == 'csv':
+        output = make_response(manifest_csv(plan))
+        output.headers["Content-Disposition"] = f"attachment; filename=manifest-{day.isoformat()}.csv"
+        output.headers["Content-type"] = "text/csv"
+        return output
+    return render_template('delivery/manifest.html', plan=plan)
+
+
 @delivery_bp.route('/<int:delivery_id>/delete', methods=['POST'])
 @login_required
 def delete_delivery(delivery_id):
@@ -154,6 +241,7 @@ def delete_delivery(delivery_id):
     try:
         db.session.delete(delivery)
         db.session.commit()
+        fragment_cache.invalidate('delivery', delivery_id)
         flash('Delivery deleted successfully', 'success')
     except Exception as e:
         db.session.rollback()
@@ -175,6 +263,7 @@ def bulk_delete_deliveries():
         for delivery in deliveries:
             db.session.delete(delivery)
         db.session.commit()
+        fragment_cache.invalidate('delivery', *[d.id for d in deliveries])
         flash(f'{len(deliveries)} deliveries deleted successfully', 'success')
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,22 @@
+"""Change feed routes for downstream consumers."""
+from flask import Blueprint, jsonify, request, current_app
+from flask_login import login_required
+from app.outbox import wait_for_events
+
+outbox_bp = Blueprint('outbox', __name__, url_prefix='/outbox')
+
+
+@outbox_bp.route('/events')
+@login_required
+def events():
+    """Long-poll for change events after the given cursor (JSON endpoint)."""
+    after = request.args.get('after', 0, type=int)
+    limit = max(1, min(request.args.get('limit', 500, type=int), 5000))
+    max_wait = current_app.config['OUTBOX_MAX_WAIT']
+    timeout = min(request.args.get('wait', max_wait, type=float), max_wait)
+
+    found = wait_for_events(after, limit, timeout)
+    return jsonify({
+        'events': [e.to_dict() for e in found],
+        'next_cursor': found[-1].id if found else after,
+    })
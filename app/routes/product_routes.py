@@ -1,9 +1,10 @@
 """Product management routes."""
-from flask import Blueprint, render_template, redirect, url_for, flash
+from flask import Blueprint, render_template, redirect, url_for, flash, jsonify, request
 from flask_login import login_required
 from app.extensions import db
 from app.models import Product
 from app.forms import ProductForm
+from app.product_search import product_index
 from flask_wtf import FlaskForm
 
 product_bp = Blueprint('product', __name__, url_prefix='/product')
@@ -18,6 +19,16 @@ def manage_products():
     return render_template('products/manage_products.html', products=products, form=form)
 
 
+@product_bp.route('/search')
+@login_required
+def search():
+    """Typeahead product search (JSON endpoint)."""
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, 100))
+    return jsonify(product_index.search(request.args.get('q', ''), limit))
+
+
 @product_bp.route('/create', methods=['GET', 'POST'])
 @login_required
 def create():
@@ -1,6 +1,11 @@
-from flask import Blueprint, render_template, make_response
+from flask import Blueprint, make_response, current_app, render_template, request, jsonify, flash
 from flask_login import login_required
-from app.models import Delivery, Return
+from sqlalchemy.orm import selectinload, undefer
+from app.models import Delivery, Return, Subchain, Supermarket
+from app.streaming import stream_page
+from app.return_matching import shortfalls
+from app.analytics import return_analytics, SORT_COLUMNS
+from app.archive import with_archived
 import csv
 from io import StringIO
 
@@ -12,9 +17,22 @@ report_bp = Blueprint('report', __name__, url_prefix='/report')
 @login_required
 def generate_report():
     """Generate delivery and return reports."""
-    deliveries = Delivery.query.order_by(Delivery.delivery_date.desc()).all()
-    returns = Return.query.order_by(Return.return_date.desc()).all()
-    return render_template(
+    yield_per = current_app.config['LISTING_YIELD_PER']
+    archive_dir = current_app.config['ARCHIVE_DIR']
+    # Archived months are merged in, so ties on a date need a fixed order
+    deliveries = with_archived(
+        Delivery.query.options(undefer(Delivery.total_cents), selectinload(Delivery.supermarket))
+        .order_by(Delivery.delivery_date.desc(), Delivery.id.desc())
+        .yield_per(yield_per),
+        'delivery', archive_dir,
+    )
+    returns = with_archived(
+        Return.query.options(undefer(Return.total_cents), selectinload(Return.supermarket))
+        .order_by(Return.return_date.desc(), Return.id.desc())
+        .yield_per(yield_per),
+        'return', archive_dir,
+    )
+    return stream_page(
         'report/generate.html',
         deliveries=deliveries,
         returns=returns
@@ -26,8 +44,21 @@ def generate_report():
 def download():
     """Download report as CSV."""
     # Get data
-    deliveries = Delivery.query.order_by(Delivery.delivery_date.desc()).all()
-    returns = Return.query.order_by(Return.return_date.desc()).all()
+    archive_dir = current_app.config['ARCHIVE_DIR']
+    deliveries = with_archived(
+        Delivery.query.options(
+            undefer(Delivery.total_cents), selectinload(Delivery.supermarket), selectinload(Delivery.subchain)
+        )
+        .order_by(Delivery.delivery_date.desc(), Delivery.id.desc()).all(),
+        'delivery', archive_dir,
+    )
+    returns = with_archived(
+        Return.query.options(
+            undefer(Return.total_cents), selectinload(Return.supermarket), selectinload(Return.subchain)
+        )
+        .order_by(Return.return_date.desc(), Return.id.desc()).all(),
+        'return', archive_dir,
+    )
     
     # Create CSV file
     si = StringIO()
@@ -62,3 +93,68 @@ def download():
     output.headers["Content-type"] = "text/csv"
     
     return output
+
+
+@report_bp.route('/return_shortfalls')
+@login_required
+def return_shortfalls():
+    """Returns that could not be fully traced to a delivery."""
+    status = request.args.get('status') or None
+    rows = shortfalls(status)
+    if request.args.get('format') == 'json':
+        return jsonify([
+            dict(row._mapping, return_date=row.return_date.isoformat(),
+                 delivery_date=row.delivery_date.isoformat())
+            for row in rows
+        ])
+    return render_template('report/return_shortfalls.html', rows=rows, status=status)
+
+
+def _return_rate_filters():
+    return {
+        'supermarket_id': request.args.get('supermarket_id', type=int),
+        'subchain_id': request.args.get('subchain_id', type=int),
+        'product_id': request.args.get('product_id', type=int),
+        'month_from': request.args.get('month_from') or None,
+        'month_to': request.args.get('month_to') or None,
+        'sort': request.args.get('sort', 'value_at_risk'),
+    }
+
+
+@report_bp.route('/return_rates')
+@login_required
+def return_rates():
+    """Return rates, lag and value at risk per product, subchain and month."""
+    filters = _return_rate_filters()
+    try:
+        result = return_analytics.query(**filters)
+    except ValueError:
+        flash('Months must be in YYYY-MM format', 'error')
+        filters.update(month_from=None, month_to=None)
+        result = return_analytics.query(**filters)
+    supermarkets = Supermarket.query.order_by(Supermarket.name).all()
+    subchains = (
+        Subchain.query.filter_by(supermarket_id=filters['supermarket_id'])
+        .order_by(Subchain.name).all()
+        if filters['supermarket_id'] else []
+    )
+    return render_template(
+        'report/return_rates.html',
+        result=result,
+        filters=filters,
+        supermarkets=supermarkets,
+        subchains=subchains,
+        sort_columns=SORT_COLUMNS,
+    )
+
+
+@report_bp.route('/return_rates/api')
+@login_required
+def return_rates_api():
+    """Return-rate rows as JSON."""
+    filters = _return_rate_filters()
+    limit = max(1, min(request.args.get('limit', 100, type=int), 10000))
+    try:
+        return jsonify(return_analytics.query(limit=limit, **filters))
+    except ValueError:
+        return jsonify({'error': 'Months must be in YYYY-MM format'}), 400
@@ -1,9 +1,12 @@
 """Return management routes."""
-from flask import Blueprint, render_template, redirect, url_for, flash, make_response, request
+from flask import Blueprint, render_template, redirect, url_for, flash, make_response, request, current_app
 from flask_login import login_required
-from app.extensions import db
-from app.models import Return, ReturnItem, Supermarket, Subchain, Product
+from sqlalchemy.orm import selectinload, undefer
+from app.extensions import db, fragment_cache
+from app.models import Return, ReturnItem, Supermarket, Subchain
 from app.forms import ReturnForm
+from app.streaming import stream_page
+from app.product_search import selected_product_choices
 import csv
 from io import StringIO
 from flask_wtf import FlaskForm
@@ -15,9 +18,17 @@ return_bp = Blueprint('return', __name__, url_prefix='/return')
 @login_required
 def index():
     """List all returns."""
-    returns = Return.query.order_by(Return.return_date.desc()).all()
+    returns = Return.query.options(
+        undefer(Return.total_cents),
+        selectinload(Return.supermarket),
+        selectinload(Return.subchain),
+    ).order_by(
+        Return.return_date.desc()
+    ).yield_per(
+        current_app.config['LISTING_YIELD_PER']
+    )
     form = FlaskForm()
-    return render_template('return/index.html', returns=returns, form=form)
+    return stream_page('return/index.html', returns=returns, form=form)
 
 
 @return_bp.route('/create', methods=['GET', 'POST'])
@@ -26,10 +37,9 @@ def create():
     """Create a new return."""
     form = ReturnForm()
     
-    # Get all products
-    products = Product.query.order_by('name').all()
-    product_choices = [(p.id, f"{p.name} (${p.price})") for p in products]
-    
+    # Products are picked with the typeahead; only submitted ones need choices
+    product_choices = selected_product_choices(form.products)
+
     # Populate select fields with actual data
     form.supermarket_id.choices = [(0, 'Select Supermarket')] + [
         (s.id, s.name) for s in Supermarket.query.order_by('name').all()
@@ -44,7 +54,7 @@ def create():
     
     # Populate product choices for each product form
     for product_form in form.products:
-        product_form.product_id.choices = [(0, 'Select Product')] + product_choices
+        product_form.product_id.choices = product_choices
     
     if form.validate_on_submit():
         try:
@@ -134,6 +144,7 @@ def delete_return(return_id):
     try:
         db.session.delete(return_obj)
         db.session.commit()
+        fragment_cache.invalidate('return', return_id)
         flash('Return deleted successfully', 'success')
     except Exception as e:
         db.session.rollback()
@@ -155,6 +166,7 @@ def bulk_delete_returns():
         for return_obj in returns:
             db.session.delete(return_obj)
         db.session.commit()
+        fragment_cache.invalidate('return', *[r.id for r in returns])
         flash(f'{len(returns)} returns deleted successfully', 'success')
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,42 @@
+"""Search routes for deliveries and returns."""
+from flask import Blueprint, render_template, request, jsonify, url_for
+from flask_login import login_required
+from app.extensions import db
+from app.search_index import search as search_documents
+
+search_bp = Blueprint('search', __name__, url_prefix='/search')
+
+PER_PAGE = 20
+
+
+def _run_search():
+    """Run the search described by the query string."""
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind') or None
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', PER_PAGE, type=int), 1), 100)
+    found = search_documents(db.session.connection(), query, kind, page, per_page)
+    for result in found['results']:
+        endpoint = 'delivery.view' if result['kind'] == 'delivery' else 'return.view'
+        id_arg = 'delivery_id' if result['kind'] == 'delivery' else 'return_id'
+        result['url'] = url_for(endpoint, **{id_arg: result['id']})
+    return query, kind, found
+
+
+@search_bp.route('/')
+@login_required
+def index():
+    """Search page for deliveries and returns."""
+    query, kind, found = _run_search()
+    pages = (found['total'] + found['per_page'] - 1) // found['per_page']
+    return render_template('search/index.html', query=query, kind=kind, found=found, pages=pages)
+
+
+@search_bp.route('/api')
+@login_required
+def api():
+    """Ranked, paginated search results (JSON endpoint)."""
+    query, kind, found = _run_search()
+    for result in found['results']:
+        result['snippet'] = str(result['snippet'])
+    return jsonify(found)
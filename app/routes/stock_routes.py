@@ -0,0 +1,40 @@
+"""Consignment stock routes."""
+from flask import Blueprint, render_template, request, jsonify
+from flask_login import login_required
+from app.models import Subchain, Supermarket
+from app.stock_ledger import stock_levels
+
+stock_bp = Blueprint('stock', __name__, url_prefix='/stock')
+
+
+@stock_bp.route('/')
+@login_required
+def index():
+    """Stock on hand per supermarket, subchain and product."""
+    supermarket_id = request.args.get('supermarket_id', type=int)
+    subchain_id = request.args.get('subchain_id', type=int)
+    rows = stock_levels(supermarket_id, subchain_id)
+    supermarkets = Supermarket.query.order_by(Supermarket.name).all()
+    subchains = (
+        Subchain.query.filter_by(supermarket_id=supermarket_id).order_by(Subchain.name).all()
+        if supermarket_id else []
+    )
+    return render_template(
+        'stock/index.html',
+        rows=rows,
+        supermarkets=supermarkets,
+        subchains=subchains,
+        supermarket_id=supermarket_id,
+        subchain_id=subchain_id,
+    )
+
+
+@stock_bp.route('/api')
+@login_required
+def api():
+    """Stock on hand as JSON."""
+    rows = stock_levels(
+        request.args.get('supermarket_id', type=int),
+        request.args.get('subchain_id', type=int),
+    )
+    return jsonify([dict(row._mapping) for row in rows])
@@ -0,0 +1,84 @@
+"""Nightly jobs for the long-running ``manage.py run_*_scheduler`` commands.
+
+A job runs once a day after its hour. The last day it completed is kept
+in a small state file, so a restart neither runs it twice in a day nor
+skips the day. A failed run is retried at the next check.
+"""
+import logging
+import os
+import time as time_module
+from datetime import datetime, time
+
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+
+def read_state(path):
+    """
+    Read what a scheduler recorded after its last run
+
+    Returns:
+        str: The recorded value, or None before the first run
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return f.read().strip() or None
+
+
+def write_state(path, value):
+    """Record a scheduler's last run, creating the directory if needed"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(value)
+
+
+def run_if_due(app, state_file, hour, job, name, now=None):
+    """
+    Run a daily job if its hour has passed and it has not run today
+
+    Args:
+        app: Flask application instance
+        state_file (str): File recording the last day the job completed
+        hour (int): Hour of the day from which the job is due
+        job: Called with today's date inside an app context
+        name (str): Job name for the log
+        now (datetime): Current local time, for tests
+
+    Returns:
+        bool: True if the job ran and completed
+    """
+    now = now or datetime.now()
+    today = now.date()
+    if now < datetime.combine(today, time(hour)) or read_state(state_file) == today.isoformat():
+        return False
+
+    with app.app_context():
+        try:
+            job(today)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"{name} failed: {str(e)}", exc_info=True)
+            return False
+    write_state(state_file, today.isoformat())
+    return True
+
+
+def run_daily(app, state_file, hour, job, name, check_interval=60):
+    """
+    Run a job forever, once a day at the given hour
+
+    Args:
+        app: Flask application instance
+        state_file (str): File recording the last day the job completed
+        hour (int): Hour of the day from which the job is due
+        job: Called with today's date inside an app context
+        name (str): Job name for the log
+        check_interval (float): Seconds between checks
+    """
+    while True:
+        run_if_due(app, state_file, hour, job, name)
+        time_module.sleep(check_interval)
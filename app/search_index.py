@@ -0,0 +1,343 @@
+"""Full-text search over deliveries and returns.
+
+Each delivery and return is one document in the ``search_document``
+SQLite FTS5 table. A document holds the supermarket and subchain names,
+product names, dates (ISO and month names) and the total amount. The
+index is kept up to date in the same transaction as the change: adding,
+editing or deleting a delivery or return, one of its items, or renaming
+a supermarket, subchain or product rewrites the affected documents on
+flush.
+
+The table is created by its migration and by ``db.create_all()``.
+Existing data is indexed with ``manage.py rebuild_search_index``. Other
+databases have no FTS5; there the index is skipped and searches find
+nothing.
+"""
+import re
+from collections import defaultdict
+
+from markupsafe import Markup, escape
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import (
+    Delivery,
+    DeliveryItem,
+    Product,
+    Return,
+    ReturnItem,
+    Subchain,
+    Supermarket,
+)
+from app.money import Money
+
+TABLE = 'search_document'
+
+SCHEMA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+    "kind UNINDEXED, doc_id UNINDEXED, doc_date UNINDEXED, "
+    "title UNINDEXED, amount UNINDEXED, body, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+# Column index of ``body``, used by snippet()
+BODY_COLUMN = 5
+
+# kind -> (header model, item model, item foreign key name, document date column)
+SOURCES = {
+    'delivery': (Delivery, DeliveryItem, 'delivery_id', 'delivery_date'),
+    'return': (Return, ReturnItem, 'return_id', 'return_date'),
+}
+
+# rowid = doc_id * 2 + offset keeps delivery and return ids apart
+ROWID_OFFSET = {'delivery': 0, 'return': 1}
+
+CHUNK_SIZE = 500
+
+# Engine -> whether it has the search table, checked once per process
+_ready_engines = {}
+
+
+def _rowid(kind, doc_id):
+    return doc_id * 2 + ROWID_OFFSET[kind]
+
+
+def _chunks(ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def _date_words(day):
+    """ISO date plus month names so 'march 2024' and '2024-03' both match"""
+    return f"{day.isoformat()} {day.strftime('%B %b')} {day.year}"
+
+
+def _documents(connection, kind, ids):
+    """Build the search documents for a chunk of deliveries or returns"""
+    header_model, item_model, fk_name, date_name = SOURCES[kind]
+    header = header_model.__table__
+    item = item_model.__table__
+    supermarket = Supermarket.__table__
+    subchain = Subchain.__table__
+    product = Product.__table__
+
+    columns = [header.c.id, header.c[date_name], supermarket.c.name, subchain.c.name]
+    if kind == 'return':
+        columns.append(header.c.delivery_date)
+    headers = connection.execute(
+        select(*columns)
+        .select_from(
+            header.join(supermarket, supermarket.c.id == header.c.supermarket_id)
+            .outerjoin(subchain, subchain.c.id == header.c.subchain_id)
+        )
+        .where(header.c.id.in_(ids))
+    ).all()
+
+    lines = defaultdict(list)
+    for doc_id, name, quantity, price in connection.execute(
+        select(item.c[fk_name], product.c.name, item.c.quantity, item.c.price_cents)
+        .select_from(item.join(product, product.c.id == item.c.product_id))
+        .where(item.c[fk_name].in_(ids))
+    ):
+        lines[doc_id].append((name, quantity, price))
+
+    for row in headers:
+        doc_id, day, supermarket_name, subchain_name = row[:4]
+        items = lines.get(doc_id, [])
+        amount = Money(sum(quantity * price_cents for _, quantity, price_cents in items))
+        title = f"{supermarket_name} / {subchain_name}" if subchain_name else supermarket_name
+
+        body = [kind, supermarket_name, subchain_name or '', _date_words(day), f"{amount:.2f}"]
+        if kind == 'return' and row[4]:
+            body.append(_date_words(row[4]))
+        body.extend(sorted({name for name, _, _ in items}))
+
+        yield {
+            'rowid': _rowid(kind, doc_id),
+            'kind': kind,
+            'doc_id': doc_id,
+            'doc_date': day.isoformat(),
+            'title': title,
+            'amount': f"{amount:.2f}",
+            'body': ' '.join(body),
+        }
+
+
+def _remove(connection, kind, ids):
+    for chunk in _chunks(ids):
+        connection.execute(
+            text(f"DELETE FROM {TABLE} WHERE rowid = :rowid"),
+            [{'rowid': _rowid(kind, doc_id)} for doc_id in chunk],
+        )
+
+
+def index_documents(connection, kind, ids):
+    """
+    Write or rewrite the documents of some deliveries or returns
+
+    Args:
+        connection: SQLAlchemy connection inside the current transaction
+        kind (str): 'delivery' or 'return'
+        ids: Primary keys to index
+    """
+    _remove(connection, kind, ids)
+    for chunk in _chunks(ids):
+        documents = list(_documents(connection, kind, chunk))
+        if documents:
+            connection.execute(
+                text(
+                    f"INSERT INTO {TABLE} (rowid, kind, doc_id, doc_date, title, amount, body) "
+                    "VALUES (:rowid, :kind, :doc_id, :doc_date, :title, :amount, :body)"
+                ),
+                documents,
+            )
+
+
+def remove_documents(connection, kind, ids):
+    """
+    Drop the documents of deliveries or returns taken out of the database
+
+    Does nothing while the search table has not been created.
+    """
+    if _index_ready(connection):
+        _remove(connection, kind, ids)
+
+
+def _index_ready(connection):
+    """
+    Check once per engine that the FTS table exists
+
+    A missing table is remembered too, so flushes do not look it up each
+    time; a table created by a later migration is seen after a restart.
+    """
+    engine = connection.engine
+    if engine not in _ready_engines:
+        _ready_engines[engine] = engine.dialect.name == 'sqlite' and connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': TABLE},
+        ).first() is not None
+    return _ready_engines[engine]
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_table(target, connection, **kw):
+    """Create the FTS table along with the model tables"""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(SCHEMA))
+        _ready_engines[connection.engine] = True
+
+
+@event.listens_for(db.metadata, 'after_drop')
+def _drop_table(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        _ready_engines[connection.engine] = False
+
+
+def _renamed(obj):
+    return inspect(obj).attrs.name.history.has_changes()
+
+
+def _documents_referencing(connection, obj):
+    """Find the deliveries and returns whose documents mention a renamed row"""
+    found = {}
+    for kind, (header_model, item_model, fk_name, _) in SOURCES.items():
+        if isinstance(obj, Product):
+            item = item_model.__table__
+            query = select(item.c[fk_name]).where(item.c.product_id == obj.id).distinct()
+        else:
+            header = header_model.__table__
+            column = header.c.supermarket_id if isinstance(obj, Supermarket) else header.c.subchain_id
+            query = select(header.c.id).where(column == obj.id)
+        found[kind] = set(connection.execute(query).scalars())
+    return found
+
+
+@event.listens_for(Session, 'after_flush')
+def _index_changes(session, flush_context):
+    """Re-index the deliveries and returns touched by this flush"""
+    connection = session.connection()
+    if not _index_ready(connection):
+        return
+
+    new, dirty, deleted = session.new, session.dirty, session.deleted
+    changed = {kind: set() for kind in SOURCES}
+    removed = {kind: set() for kind in SOURCES}
+
+    with session.no_autoflush:
+        for obj in list(new) + list(dirty) + list(deleted):
+            if isinstance(obj, Delivery):
+                (removed if obj in deleted else changed)['delivery'].add(obj.id)
+            elif isinstance(obj, Return):
+                (removed if obj in deleted else changed)['return'].add(obj.id)
+            elif isinstance(obj, DeliveryItem):
+                parent = obj.delivery_id or (obj.delivery.id if obj.delivery else None)
+                if parent:
+                    changed['delivery'].add(parent)
+            elif isinstance(obj, ReturnItem):
+                parent = obj.return_id or (obj.return_obj.id if obj.return_obj else None)
+                if parent:
+                    changed['return'].add(parent)
+            elif (
+                isinstance(obj, (Supermarket, Subchain, Product))
+                and obj in dirty and _renamed(obj)
+            ):
+                for kind, ids in _documents_referencing(connection, obj).items():
+                    changed[kind] |= ids
+
+    for kind in SOURCES:
+        if removed[kind]:
+            _remove(connection, kind, removed[kind])
+        if changed[kind] - removed[kind]:
+            index_documents(connection, kind, changed[kind] - removed[kind])
+
+
+def _match_expression(query):
+    """
+    Turn free text into an FTS5 query
+
+    Every whitespace-separated term must match. A term such as '2024-03'
+    becomes the phrase "2024 03", and its last word matches as a prefix.
+    """
+    phrases = []
+    for term in query.split():
+        words = re.findall(r'\w+', term)
+        if words:
+            phrases.append('"{}"*'.format(' '.join(words)))
+    return ' '.join(phrases)
+
+
+def search(connection, query, kind=None, page=1, per_page=20):
+    """
+    Search deliveries and returns
+
+    Args:
+        connection: SQLAlchemy connection
+        query (str): Free text, e.g. 'SC3 milk march 2024'
+        kind (str): Optional 'delivery' or 'return' filter
+        page (int): 1-based page number
+        per_page (int): Results per page
+
+    Returns:
+        dict: 'results' (best first), 'total', 'page' and 'per_page'
+    """
+    empty = {'results': [], 'total': 0, 'page': page, 'per_page': per_page}
+    match = _match_expression(query)
+    if not match or not _index_ready(connection):
+        return empty
+
+    where = f"{TABLE} MATCH :match"
+    params = {'match': match}
+    if kind in SOURCES:
+        where += " AND kind = :kind"
+        params['kind'] = kind
+
+    total = connection.execute(
+        text(f"SELECT count(*) FROM {TABLE} WHERE {where}"), params
+    ).scalar()
+    rows = connection.execute(
+        text(
+            f"SELECT kind, doc_id, doc_date, title, amount, "
+            f"snippet({TABLE}, {BODY_COLUMN}, char(2), char(3), '…', 12) "
+            f"FROM {TABLE} WHERE {where} "
+            f"ORDER BY bm25({TABLE}), doc_date DESC LIMIT :limit OFFSET :offset"
+        ),
+        dict(params, limit=per_page, offset=(page - 1) * per_page),
+    ).all()
+
+    results = []
+    for doc_kind, doc_id, doc_date, title, amount, snippet in rows:
+        highlighted = str(escape(snippet)).replace('\x02', '<mark>').replace('\x03', '</mark>')
+        results.append({
+            'kind': doc_kind,
+            'id': doc_id,
+            'date': doc_date,
+            'title': title,
+            'amount': amount,
+            'snippet': Markup(highlighted),
+        })
+    return dict(empty, results=results, total=total)
+
+
+def rebuild_index(connection):
+    """
+    Create the search table if needed and index every delivery and return
+
+    Args:
+        connection: SQLAlchemy connection; the caller commits
+
+    Returns:
+        dict: Number of documents indexed per kind
+    """
+    connection.execute(text(SCHEMA))
+    connection.execute(text(f"DELETE FROM {TABLE}"))
+    _ready_engines[connection.engine] = True
+
+    counts = {}
+    for kind, (header_model, _, _, _) in SOURCES.items():
+        ids = connection.execute(select(header_model.__table__.c.id)).scalars().all()
+        index_documents(connection, kind, ids)
+        counts[kind] = len(ids)
+    return counts
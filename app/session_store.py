@@ -0,0 +1,349 @@
+"""Server-side sessions with lazy loading and write-on-modify.
+
+The cookie only carries a signed session id. Session data is stored in a
+SQLite file, a directory or a Redis-compatible server. It is read the
+first time a request touches the session and written only when the
+request changed it, so static files and AJAX calls that never look at
+the session cost nothing. A request that reads a permanent session
+without changing it extends the session's expiry in the store, but only
+once less than half of its lifetime is left, so most page views write
+nothing.
+
+The session id is replaced on login and logout, so an id planted in a
+browser before sign-in never becomes an authenticated session.
+"""
+import os
+import random
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask import session as current_session
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from flask_login import user_logged_in, user_logged_out
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+try:
+    import redis
+except ImportError:  # Only needed for SESSION_BACKEND = 'redis'
+    redis = None
+
+# Share of writes that also purge expired sessions
+CLEANUP_PROBABILITY = 0.001
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict that fetches its data from the store on first access"""
+
+    def __init__(self, sid=None, loader=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(None, on_update)
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.previous_sid = None
+        # Expiry timestamp in the store, known once the data is loaded
+        self.stored_until = None
+        self._loader = loader
+
+    @property
+    def loaded(self):
+        return self._loader is None
+
+    def _ensure_loaded(self):
+        self.accessed = True
+        if self._loader is not None:
+            loader, self._loader = self._loader, None
+            data, self.stored_until = loader()
+            if data:
+                dict.update(self, data)
+
+    def regenerate(self):
+        """Keep the data under a new session id; the old one is deleted on save"""
+        self._ensure_loaded()
+        if self.sid is not None and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = None
+        self.new = True
+        self.modified = True
+
+
+def _lazy(name):
+    method = getattr(CallbackDict, name)
+
+    def wrapper(self, *args, **kwargs):
+        self._ensure_loaded()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in (
+    '__getitem__', '__contains__', '__iter__', '__len__', '__repr__', 'get',
+    'keys', 'values', 'items', 'copy', '__setitem__', '__delitem__', 'clear',
+    'pop', 'popitem', 'setdefault', 'update',
+):
+    setattr(ServerSideSession, _name, _lazy(_name))
+
+
+class SQLiteSessionBackend:
+    """Sessions in a dedicated SQLite file, one connection per thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS session '
+                '(sid TEXT PRIMARY KEY, expires INTEGER NOT NULL, data BLOB NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._connect().execute(
+            'SELECT data, expires FROM session WHERE sid = ? AND expires > ?',
+            (sid, int(time.time())),
+        ).fetchone()
+        return tuple(row) if row else (None, None)
+
+    def set(self, sid, data, expires):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO session (sid, expires, data) VALUES (?, ?, ?)',
+                (sid, int(expires), data),
+            )
+
+    def touch(self, sid, expires):
+        with self._connect() as conn:
+            conn.execute('UPDATE session SET expires = ? WHERE sid = ?', (int(expires), sid))
+
+    def delete(self, sid):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM session WHERE sid = ?', (sid,))
+
+    def cleanup(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM session WHERE expires <= ?', (int(time.time()),))
+
+
+class FileSystemSessionBackend:
+    """One file per session; the first line holds the expiry timestamp"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid)
+
+    def get(self, sid):
+        try:
+            with open(self._path(sid), 'rb') as f:
+                expires = int(f.readline())
+                if expires <= time.time():
+                    return None, None
+                return f.read(), expires
+        except (OSError, ValueError):
+            return None, None
+
+    def set(self, sid, data, expires):
+        path = self._path(sid)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(b'%d\n' % int(expires))
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def touch(self, sid, expires):
+        data, _ = self.get(sid)
+        if data is not None:
+            self.set(sid, data, expires)
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def cleanup(self):
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = self._path(name)
+            try:
+                with open(path, 'rb') as f:
+                    if int(f.readline()) <= now:
+                        os.remove(path)
+            except (OSError, ValueError):
+                continue
+
+
+class RedisSessionBackend:
+    """Sessions in Redis or a compatible server, expiring natively"""
+
+    def __init__(self, url, prefix='session:'):
+        if redis is None:
+            raise RuntimeError("SESSION_BACKEND = 'redis' requires the redis package")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, sid):
+        data, ttl = self.client.pipeline().get(self.prefix + sid).ttl(self.prefix + sid).execute()
+        if data is None:
+            return None, None
+        return data, time.time() + ttl if ttl > 0 else None
+
+    def set(self, sid, data, expires):
+        ttl = max(1, int(expires - time.time()))
+        self.client.setex(self.prefix + sid, ttl, data)
+
+    def touch(self, sid, expires):
+        self.client.expire(self.prefix + sid, max(1, int(expires - time.time())))
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+    def cleanup(self):
+        pass
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface backed by one of the session backends"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-side-session')
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return ServerSideSession()
+
+        try:
+            sid = self._signer(app).unsign(cookie).decode('ascii')
+        except BadSignature:
+            return ServerSideSession()
+
+        def load():
+            data, expires = self.backend.get(sid)
+            if not data:
+                return None, None
+            return session_json_serializer.loads(data.decode('utf-8')), expires
+
+        return ServerSideSession(sid, load)
+
+    def _store_until(self, app, session):
+        expires = self.get_expiration_time(app, session)
+        store_until = (
+            expires.timestamp() if expires
+            else time.time() + app.permanent_session_lifetime.total_seconds()
+        )
+        return expires, store_until
+
+    def _needs_refresh(self, app, session):
+        """Whether an unchanged session's expiry should be extended"""
+        if not (session.sid and session.accessed and session.permanent
+                and app.config['SESSION_REFRESH_EACH_REQUEST']):
+            return False
+        if session.stored_until is None:
+            return True
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        # Writing on every page view would cost a store write per request
+        return session.stored_until - time.time() < lifetime / 2
+
+    def _set_cookie(self, app, response, sid, expires):
+        response.set_cookie(
+            self.get_cookie_name(app),
+            self._signer(app).sign(sid.encode('ascii')).decode('ascii'),
+            expires=expires,
+            httponly=self.get_cookie_httponly(app),
+            domain=self.get_cookie_domain(app),
+            path=self.get_cookie_path(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.previous_sid:
+            self.backend.delete(session.previous_sid)
+
+        if not session.modified:
+            # Permanent sessions stay alive in the store as long as the
+            # browser keeps using them, like Flask's own cookie sessions
+            if self._needs_refresh(app, session):
+                expires, store_until = self._store_until(app, session)
+                self.backend.touch(session.sid, store_until)
+                self._set_cookie(app, response, session.sid, expires)
+            return
+
+        if not session:
+            if session.sid or session.previous_sid:
+                if session.sid:
+                    self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        expires, store_until = self._store_until(app, session)
+        sid = session.sid or secrets.token_urlsafe(32)
+        data = session_json_serializer.dumps(dict(session)).encode('utf-8')
+        self.backend.set(sid, data, store_until)
+
+        if random.random() < CLEANUP_PROBABILITY:
+            self.backend.cleanup()
+
+        if session.new or session.permanent:
+            self._set_cookie(app, response, sid, expires)
+
+
+def _regenerate_session(sender, **extra):
+    """Give the session a new id when the signed-in user changes"""
+    if isinstance(current_session, ServerSideSession):
+        current_session.regenerate()
+
+
+def init_session_store(app):
+    """
+    Replace Flask's cookie sessions with the configured server-side backend
+
+    Args:
+        app: Flask application instance
+    """
+    backend_name = app.config.get('SESSION_BACKEND', 'cookie')
+    if backend_name == 'cookie':
+        return
+
+    if backend_name == 'sqlite':
+        backend = SQLiteSessionBackend(app.config['SESSION_SQLITE_PATH'])
+    elif backend_name == 'filesystem':
+        backend = FileSystemSessionBackend(app.config['SESSION_FILE_DIR'])
+    elif backend_name == 'redis':
+        backend = RedisSessionBackend(app.config['SESSION_REDIS_URL'])
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend_name}")
+
+    app.session_interface = ServerSideSessionInterface(backend)
+    user_logged_in.connect(_regenerate_session, app)
+    user_logged_out.connect(_regenerate_session, app)
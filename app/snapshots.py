@@ -0,0 +1,308 @@
+"""Columnar snapshots of deliveries and returns for offline analysis.
+
+``manage.py snapshot`` writes the delivery, delivery_item, return and
+return_item tables as Parquet (or Feather) files, one partition per month
+of the header's ``created_at``:
+
+    instance/snapshots/delivery/month=2024-05/part.parquet
+    instance/snapshots/delivery_item/month=2024-05/part.parquet
+
+A month is written again only when its headers changed: new rows, edits
+(which bump ``updated_at``) or deletes. Each run compares the row count,
+id sum and newest ``updated_at`` of every month with ``manifest.json``,
+so a nightly run usually rewrites just the current month. Rows are
+streamed to the files in chunks and never loaded all at once.
+
+Months moved to the monthly archive files (see ``app.archive``) stay in
+the snapshot: their rows are read through ``attached()`` alongside the
+hot ones, so archiving changes neither the signatures nor the files.
+
+``load()`` reads only the requested columns and months back into pandas,
+without touching the production database.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from sqlalchemy import String, cast, func, select, types
+
+from app import archive
+from app.analytics import fetch_columns
+from app.models import Delivery, DeliveryItem, Return, ReturnItem
+
+FORMATS = {'parquet': '.parquet', 'feather': '.feather'}
+
+CHUNK_SIZE = 2000
+
+MANIFEST = 'manifest.json'
+
+# dataset -> (header model, date used when created_at is missing, items)
+SOURCES = {
+    'delivery': (Delivery, 'delivery_date', (DeliveryItem, 'delivery_id')),
+    'return': (Return, 'return_date', (ReturnItem, 'return_id')),
+}
+
+
+def _arrow_type(column):
+    """Arrow type for a table column"""
+    sql_type = column.type
+    if isinstance(sql_type, types.Integer):
+        return pa.int64()
+    if isinstance(sql_type, types.DateTime):
+        return pa.timestamp('us')
+    if isinstance(sql_type, types.Date):
+        return pa.date32()
+    if isinstance(sql_type, types.Float):
+        return pa.float64()
+    if isinstance(sql_type, types.Numeric):
+        return pa.decimal128(sql_type.precision or 18, sql_type.scale or 0)
+    if isinstance(sql_type, types.Boolean):
+        return pa.bool_()
+    return pa.string()
+
+
+def _schema(table):
+    return pa.schema([pa.field(column.name, _arrow_type(column)) for column in table.columns])
+
+
+class _PartitionWriter:
+    """Write record batches to one partition file, replacing it atomically"""
+
+    def __init__(self, path, schema, file_format):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.schema = schema
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if file_format == 'parquet':
+            self._writer = pq.ParquetWriter(self.tmp_path, schema, compression='zstd')
+        else:
+            # Feather v2 is the Arrow IPC file format
+            self._writer = pa.ipc.new_file(
+                self.tmp_path, schema,
+                options=pa.ipc.IpcWriteOptions(compression='zstd'),
+            )
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema,
+        )
+        if isinstance(self._writer, pq.ParquetWriter):
+            self._writer.write_batch(batch)
+        else:
+            self._writer.write(batch)
+
+    def close(self):
+        self._writer.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def _header_months(connection, table, date_name):
+    """Ids, created_at months and last change times of one header table"""
+    header_id, stamp, updated = fetch_columns(
+        connection,
+        select(
+            table.c.id,
+            cast(func.coalesce(table.c.created_at, table.c[date_name]), String),
+            cast(func.coalesce(table.c.updated_at, table.c.created_at, table.c[date_name]), String),
+        ),
+        ['int64', 'U32', 'U32'],
+    )
+    # Truncating the ISO timestamp to seven characters leaves 'YYYY-MM'
+    return header_id, stamp.astype('U7'), updated
+
+
+def _month_signatures(connection, dataset, archive_dir=None):
+    """
+    Group a header table, archived months included, by created_at month
+
+    Returns:
+        dict: month -> (signature dict, {source: sorted header ids}),
+            where the source is None for the main database, otherwise
+            the archive month holding the rows
+    """
+    model, date_name, _ = SOURCES[dataset]
+    sources = [None]
+    parts = [_header_months(connection, model.__table__, date_name)]
+    for archived in archive.archived_months(archive_dir) if archive_dir else []:
+        with archive.attached(connection, archive_dir, [archived]) as views:
+            parts.append(_header_months(connection, views[model.__tablename__], date_name))
+        sources.append(archived)
+
+    header_id, month, updated = (np.concatenate(columns) for columns in zip(*parts))
+    source = np.repeat(np.arange(len(parts)), [len(part[0]) for part in parts])
+    order = np.lexsort((updated, month))
+    month, updated, header_id, source = month[order], updated[order], header_id[order], source[order]
+    months, starts = np.unique(month, return_index=True)
+    ends = np.append(starts[1:], len(month))
+
+    groups = {}
+    for name, start, end in zip(months, starts, ends):
+        ids = header_id[start:end]
+        origin = source[start:end]
+        groups[str(name)] = (
+            {
+                'rows': int(end - start),
+                'id_sum': int(ids.sum()),
+                'updated': str(updated[end - 1]),
+            },
+            {sources[index]: np.sort(ids[origin == index]) for index in np.unique(origin)},
+        )
+    return groups
+
+
+def _write_rows(connection, writers, ids):
+    """Stream the headers and items of some header ids to the writers"""
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = [int(value) for value in ids[start:start + CHUNK_SIZE]]
+        for table, key, writer in writers:
+            writer.write_rows(connection.execute(
+                select(table).where(key.in_(chunk)).order_by(table.c.id)
+            ).all())
+
+
+def _write_month(connection, directory, dataset, month, ids_by_source, file_format,
+                 archive_dir=None):
+    """Stream one month of headers and their items to partition files"""
+    model, _, (item_model, fk) = SOURCES[dataset]
+    header = model.__table__
+    item = item_model.__table__
+    extension = FORMATS[file_format]
+    writers = {
+        header.name: _PartitionWriter(_partition_path(directory, header.name, month, extension),
+                                      _schema(header), file_format),
+        item.name: _PartitionWriter(_partition_path(directory, item.name, month, extension),
+                                    _schema(item), file_format),
+    }
+    for source, ids in sorted(ids_by_source.items(), key=lambda entry: entry[0] or ''):
+        if source is None:
+            _write_rows(connection, [
+                (header, header.c.id, writers[header.name]),
+                (item, item.c[fk], writers[item.name]),
+            ], ids)
+            continue
+        with archive.attached(connection, archive_dir, [source]) as views:
+            archived_header, archived_item = views[header.name], views[item.name]
+            _write_rows(connection, [
+                (archived_header, archived_header.c.id, writers[header.name]),
+                (archived_item, archived_item.c[fk], writers[item.name]),
+            ], ids)
+    for writer in writers.values():
+        writer.close()
+
+
+def _partition_path(directory, table_name, month, extension):
+    return os.path.join(directory, table_name, f'month={month}', f'part{extension}')
+
+
+def _read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def write_snapshot(connection, directory, file_format='parquet', archive_dir=None):
+    """
+    Bring the snapshot directory up to date
+
+    Args:
+        connection: SQLAlchemy connection with no statement in progress
+        directory (str): Snapshot root, e.g. instance/snapshots
+        file_format (str): 'parquet' or 'feather'
+        archive_dir (str): Archive directory whose months are included too
+
+    Returns:
+        dict: 'written', 'unchanged' and 'removed' lists of (dataset, month)
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown snapshot format: {file_format}")
+
+    os.makedirs(directory, exist_ok=True)
+    manifest = _read_manifest(directory)
+    if manifest.get('format') != file_format:
+        # A different format means every partition is written again
+        manifest = {'format': file_format, 'partitions': {}}
+
+    result = {'written': [], 'unchanged': [], 'removed': []}
+    for dataset, (model, _, (item_model, _)) in SOURCES.items():
+        known = manifest['partitions'].setdefault(dataset, {})
+        groups = _month_signatures(connection, dataset, archive_dir)
+
+        for month, (signature, ids_by_source) in sorted(groups.items()):
+            if known.get(month) == signature:
+                result['unchanged'].append((dataset, month))
+                continue
+            _write_month(connection, directory, dataset, month, ids_by_source, file_format,
+                         archive_dir)
+            known[month] = signature
+            # Record progress so an interrupted run resumes where it stopped
+            _write_manifest(directory, manifest)
+            result['written'].append((dataset, month))
+
+        for month in sorted(set(known) - set(groups)):
+            for table in (model.__table__, item_model.__table__):
+                shutil.rmtree(os.path.join(directory, table.name, f'month={month}'),
+                              ignore_errors=True)
+            del known[month]
+            result['removed'].append((dataset, month))
+
+    _write_manifest(directory, manifest)
+    return result
+
+
+def load(directory, table_name, columns=None, start=None, end=None):
+    """
+    Read a snapshot table into a DataFrame
+
+    Only the partitions between start and end and the requested columns
+    are read from disk.
+
+    Args:
+        directory (str): Snapshot root
+        table_name (str): 'delivery', 'delivery_item', 'return' or 'return_item'
+        columns (list): Column names, all by default
+        start (str): First month, 'YYYY-MM'
+        end (str): Last month, 'YYYY-MM'
+
+    Returns:
+        DataFrame: Rows of the selected months
+    """
+    file_format = _read_manifest(directory).get('format', 'parquet')
+    extension = FORMATS[file_format]
+    root = os.path.join(directory, table_name)
+    months = sorted(
+        name.split('=', 1)[1]
+        for name in (os.listdir(root) if os.path.isdir(root) else [])
+        if name.startswith('month=')
+    )
+
+    tables = []
+    for month in months:
+        if (start and month < start) or (end and month > end):
+            continue
+        path = _partition_path(directory, table_name, month, extension)
+        if file_format == 'parquet':
+            tables.append(pq.read_table(path, columns=columns))
+        else:
+            tables.append(feather.read_table(path, columns=columns))
+
+    if not tables:
+        return pa.table({name: [] for name in columns or []}).to_pandas()
+    return pa.concat_tables(tables).to_pandas()
@@ -0,0 +1,301 @@
+"""Periodic delivery/return statements emailed to supermarket contacts."""
+import csv
+import logging
+import time as time_module
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from io import BytesIO, StringIO
+
+from flask import render_template
+from flask_mail import Message
+from sqlalchemy import func
+
+from app.extensions import db
+from app.mail_dispatch import mail_dispatcher
+from app.models import (
+    Delivery,
+    DeliveryItem,
+    Product,
+    Return,
+    ReturnItem,
+    Subchain,
+    Supermarket,
+)
+from app.money import Money
+from app.scheduling import read_state, write_state
+
+try:
+    import xlsxwriter
+except ImportError:  # XLSX attachments are skipped without XlsxWriter
+    xlsxwriter = None
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_COLUMNS = ['Type', 'Date', 'Subchain', 'Product', 'Quantity', 'Amount (₮)']
+
+
+def _aggregate_lines(header, item, item_fk, date_column, start, end):
+    """Sum quantities and amounts per supermarket, subchain, day and product"""
+    return (
+        db.session.query(
+            header.supermarket_id,
+            header.subchain_id,
+            date_column,
+            Product.name,
+            func.sum(item.quantity),
+            func.sum(item.quantity * item.price_cents),
+        )
+        .select_from(header)
+        .join(item, item_fk == header.id)
+        .join(Product, Product.id == item.product_id)
+        .filter(date_column >= start, date_column <= end)
+        .group_by(header.supermarket_id, header.subchain_id, date_column, Product.name)
+        .all()
+    )
+
+
+def build_statements(start, end):
+    """
+    Compute statements for every supermarket and subchain with activity
+
+    Each statement covers one recipient group: a supermarket contact gets
+    all of its subchains, a subchain contact only its own lines.
+
+    Args:
+        start (date): First day of the period
+        end (date): Last day of the period, inclusive
+
+    Returns:
+        list: Dicts with 'title', 'recipients', 'lines' and totals
+    """
+    lines_by_supermarket = defaultdict(list)
+    sources = [
+        ('Delivery', Delivery, DeliveryItem, DeliveryItem.delivery_id, Delivery.delivery_date),
+        ('Return', Return, ReturnItem, ReturnItem.return_id, Return.return_date),
+    ]
+    for label, header, item, item_fk, date_column in sources:
+        rows = _aggregate_lines(header, item, item_fk, date_column, start, end)
+        for supermarket_id, subchain_id, day, product, quantity, cents in rows:
+            lines_by_supermarket[supermarket_id].append(
+                (label, day, subchain_id, product, quantity, Money(cents))
+            )
+
+    if not lines_by_supermarket:
+        return []
+
+    supermarkets = {
+        s.id: s
+        for s in Supermarket.query.filter(Supermarket.id.in_(lines_by_supermarket))
+    }
+    subchains = {
+        s.id: s
+        for s in Subchain.query.filter(Subchain.supermarket_id.in_(lines_by_supermarket))
+    }
+
+    statements = []
+    for supermarket_id, raw_lines in lines_by_supermarket.items():
+        supermarket = supermarkets[supermarket_id]
+        raw_lines.sort(key=lambda line: (line[1], line[0], line[3]))
+        lines = [
+            (label, day, subchains[sc_id].name if sc_id in subchains else 'N/A',
+             product, quantity, amount)
+            for label, day, sc_id, product, quantity, amount in raw_lines
+        ]
+
+        if supermarket.email:
+            statements.append(_statement(supermarket.name, [supermarket.email], lines))
+
+        for subchain_id in sorted({line[2] for line in raw_lines if line[2]}):
+            subchain = subchains.get(subchain_id)
+            if not subchain or not subchain.email or subchain.email == supermarket.email:
+                continue
+            statements.append(_statement(
+                f"{supermarket.name} / {subchain.name}",
+                [subchain.email],
+                [line for line, raw in zip(lines, raw_lines) if raw[2] == subchain_id],
+            ))
+
+    return statements
+
+
+def _statement(title, recipients, lines):
+    """Bundle statement lines with their totals"""
+    delivered = sum((line[5] for line in lines if line[0] == 'Delivery'), 0)
+    returned = sum((line[5] for line in lines if line[0] == 'Return'), 0)
+    return {
+        'title': title,
+        'recipients': recipients,
+        'lines': lines,
+        'delivered_total': delivered,
+        'returned_total': returned,
+        'net_total': delivered - returned,
+    }
+
+
+def render_csv(statement):
+    """Render statement lines as CSV bytes readable by Excel"""
+    si = StringIO()
+    writer = csv.writer(si)
+    writer.writerow(STATEMENT_COLUMNS)
+    for label, day, subchain, product, quantity, amount in statement['lines']:
+        writer.writerow([label, day.strftime('%Y-%m-%d'), subchain, product,
+                         quantity, f"{amount:.2f}"])
+    return si.getvalue().encode('utf-8-sig')
+
+
+def render_xlsx(statement):
+    """Render statement lines as an XLSX workbook, or None without XlsxWriter"""
+    if xlsxwriter is None:
+        return None
+
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    sheet = workbook.add_worksheet('Statement')
+    money = workbook.add_format({'num_format': '#,##0.00'})
+    day_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+
+    sheet.write_row(0, 0, STATEMENT_COLUMNS)
+    for row, (label, day, subchain, product, quantity, amount) in enumerate(
+        statement['lines'], start=1
+    ):
+        sheet.write(row, 0, label)
+        sheet.write_datetime(row, 1, datetime.combine(day, time()), day_format)
+        sheet.write(row, 2, subchain)
+        sheet.write(row, 3, product)
+        sheet.write_number(row, 4, quantity)
+        sheet.write_number(row, 5, float(amount), money)
+    workbook.close()
+    return output.getvalue()
+
+
+def send_statements(start, end):
+    """
+    Queue one statement email per recipient group for the period
+
+    Args:
+        start (date): First day of the period
+        end (date): Last day of the period, inclusive
+
+    Returns:
+        int: Number of emails queued
+    """
+    statements = build_statements(start, end)
+    suffix = f"{start:%Y%m%d}-{end:%Y%m%d}"
+
+    for statement in statements:
+        msg = Message(
+            subject=f"Statement {start:%Y-%m-%d} – {end:%Y-%m-%d}: {statement['title']}",
+            recipients=statement['recipients'],
+            body=render_template('email/statement.txt', statement=statement,
+                                 start=start, end=end),
+            html=render_template('email/statement.html', statement=statement,
+                                 start=start, end=end),
+        )
+        msg.attach(f"statement-{suffix}.csv", 'text/csv', render_csv(statement))
+        xlsx = render_xlsx(statement)
+        if xlsx is not None:
+            msg.attach(
+                f"statement-{suffix}.xlsx",
+                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                xlsx,
+            )
+        mail_dispatcher.enqueue(msg, commit=False)
+
+    # One commit hands the whole run to the mail workers at once
+    db.session.commit()
+    mail_dispatcher.wake()
+    return len(statements)
+
+
+def previous_week(today):
+    """
+    Get the last full Monday-Sunday week before a day
+
+    Returns:
+        tuple: (start, end) dates
+    """
+    end = today - timedelta(days=today.weekday() + 1)
+    return end - timedelta(days=6), end
+
+
+def due_weeks(now, last_sent, weekday, hour):
+    """
+    Weeks whose statements are due and were not sent yet, oldest first
+
+    A week is due from its following `weekday` at `hour`. Without a
+    previous run only the latest due week is sent.
+
+    Args:
+        now (datetime): Current local time
+        last_sent (date): Start of the last week sent, or None
+        weekday (int): Day after the week the statements go out, 0 = Monday
+        hour (int): Hour from which they go out
+
+    Returns:
+        list: (start, end) date tuples
+    """
+    start, end = previous_week(now.date())
+    if now < datetime.combine(end + timedelta(days=1 + weekday), time(hour)):
+        start, end = start - timedelta(days=7), end - timedelta(days=7)
+
+    first = start if last_sent is None else last_sent + timedelta(days=7)
+    weeks = []
+    while first <= start:
+        weeks.append((first, first + timedelta(days=6)))
+        first += timedelta(days=7)
+    return weeks
+
+
+def send_due_statements(app, now=None):
+    """
+    Queue the statements of every due week not sent yet
+
+    Weeks are sent oldest first, and each is recorded in
+    STATEMENT_STATE_FILE as soon as it is queued. A run that was down
+    for a while catches up, and a failure retries from the failed week.
+
+    Args:
+        app: Flask application instance
+        now (datetime): Current local time, for tests
+
+    Returns:
+        list: (start, end) of the weeks queued
+    """
+    config = app.config
+    state_file = config['STATEMENT_STATE_FILE']
+    last_sent = read_state(state_file)
+    weeks = due_weeks(
+        now or datetime.now(),
+        date.fromisoformat(last_sent) if last_sent else None,
+        config['STATEMENT_WEEKDAY'],
+        config['STATEMENT_HOUR'],
+    )
+
+    sent = []
+    with app.app_context():
+        for start, end in weeks:
+            try:
+                count = send_statements(start, end)
+                logger.info(f"Queued {count} statements for {start} - {end}")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Statement run failed: {str(e)}", exc_info=True)
+                break
+            write_state(state_file, start.isoformat())
+            sent.append((start, end))
+    return sent
+
+
+def run_scheduler(app):
+    """
+    Send weekly statements forever, once per week at the configured time
+
+    The last period sent is recorded in STATEMENT_STATE_FILE so restarts
+    neither skip nor repeat a week.
+
+    Args:
+        app: Flask application instance
+    """
+    while True:
+        send_due_statements(app)
+        time_module.sleep(app.config.get('STATEMENT_CHECK_INTERVAL', 60))
@@ -0,0 +1,334 @@
+document.addEventListener("DOMContentLoaded", function () {
+  const supermarketSelect = document.getElementById("supermarket_id");
+  const subchainSelect = document.getElementById("subchain_id");
+  const productsContainer = document.getElementById("products-container");
+  const addProductBtn = document.getElementById("add-product-btn");
+  const totalAmountInput = document.getElementById("total_amount");
+  const form = productsContainer.closest("form");
+
+  const SEARCH_DELAY = 150; // ms to wait after the last keystroke
+
+  updateAllProductSelects();
+
+  // Handle supermarket change
+  supermarketSelect.addEventListener("change", function () {
+    const supermarketId = this.value;
+    updateSubchains(supermarketId);
+    loadSuggestions(supermarketId, 0);
+  });
+
+  subchainSelect.addEventListener("change", function () {
+    loadSuggestions(supermarketSelect.value, this.value);
+  });
+
+  // Prefill lines with the suggested quantities for the chosen location
+  function loadSuggestions(supermarketId, subchainId) {
+    if (!form || !form.dataset.suggestUrl || !supermarketId || supermarketId === "0") {
+      return;
+    }
+    if (hasEnteredLines()) {
+      return;
+    }
+    const params = new URLSearchParams({
+      supermarket_id: supermarketId,
+      subchain_id: subchainId || 0,
+    });
+    fetch(`${form.dataset.suggestUrl}?${params}`)
+      .then((response) => response.json())
+      .then((data) => {
+        // The driver may have started typing while we waited
+        if (hasEnteredLines()) {
+          return;
+        }
+        document.querySelectorAll(".product-row").forEach((row) => row.remove());
+        data.forEach((suggestion, index) => {
+          const row = createProductRow(index);
+          const option = new Option(
+            `${suggestion.name} (₮${suggestion.price})`,
+            suggestion.product_id
+          );
+          option.dataset.price = suggestion.price;
+          row.querySelector(".product-select").appendChild(option);
+          row.querySelector(".product-select").value = suggestion.product_id;
+          row.querySelector(".quantity-input").value = suggestion.quantity;
+          row.querySelector(".price-input").value = suggestion.price;
+          row.dataset.suggested = "1";
+          productsContainer.appendChild(row);
+          updateRowTotal(row);
+        });
+        updateTotalAmount();
+      });
+  }
+
+  // Lines the driver filled in themselves are never replaced
+  function hasEnteredLines() {
+    return Array.from(document.querySelectorAll(".product-row")).some(
+      (row) =>
+        !row.dataset.suggested &&
+        (row.querySelector(".product-select").value ||
+          row.querySelector(".quantity-input").value)
+    );
+  }
+
+  // Update subchains dropdown
+  function updateSubchains(supermarketId) {
+    subchainSelect.innerHTML = '<option value="0">Select Subchain</option>';
+    if (supermarketId && supermarketId !== "0") {
+      fetch(`/delivery/get_subchains/${supermarketId}`)
+        .then((response) => response.json())
+        .then((data) => {
+          data.forEach((subchain) => {
+            const option = document.createElement("option");
+            option.value = subchain.id;
+            option.textContent = subchain.name;
+            subchainSelect.appendChild(option);
+          });
+        });
+    }
+  }
+
+  // Add product row
+  addProductBtn.addEventListener("click", function () {
+    const index = document.querySelectorAll(".product-row").length;
+    const row = createProductRow(index);
+    productsContainer.appendChild(row);
+    updateTotalAmount();
+  });
+
+  // Create product row
+  function createProductRow(index) {
+    const div = document.createElement("div");
+    div.className = "product-row row mb-3";
+    div.innerHTML = `
+      <div class="col-md-3">
+        <label class="form-label">Product</label>
+        <select name="products-${index}-product_id" class="form-control product-select" required>
+          <option value="">Select Product</option>
+        </select>
+      </div>
+      <div class="col-md-2">
+        <label class="form-label">Quantity</label>
+        <input type="number" name="products-${index}-quantity" class="form-control quantity-input" required min="1">
+      </div>
+      <div class="col-md-2">
+        <label class="form-label">Price</label>
+        <input type="number" name="products-${index}-price" class="form-control price-input" required step="0.01" min="0.01">
+      </div>
+      <div class="col-md-2">
+        <label class="form-label">Total</label>
+        <input type="number" name="products-${index}-total" class="form-control total-input" readonly>
+      </div>
+      <div class="col-md-2">
+        <button type="button" class="btn btn-danger remove-product mt-4">
+          <i class="fas fa-trash"></i> Remove
+        </button>
+      </div>
+    `;
+
+    setupRowEventListeners(div);
+    return div;
+  }
+
+  // Setup event listeners for a row
+  function setupRowEventListeners(row) {
+    const productSelect = row.querySelector(".product-select");
+    const quantityInput = row.querySelector(".quantity-input");
+    const priceInput = row.querySelector(".price-input");
+    const totalInput = row.querySelector(".total-input");
+    const removeBtn = row.querySelector(".remove-product");
+
+    setupProductSearch(row, productSelect);
+
+    productSelect.addEventListener("change", function () {
+      delete row.dataset.suggested;
+      const option = this.options[this.selectedIndex];
+      if (option.dataset.price) {
+        priceInput.value = option.dataset.price;
+        updateRowTotal(row);
+      }
+    });
+
+    quantityInput.addEventListener("input", function () {
+      delete row.dataset.suggested;
+      updateRowTotal(row);
+    });
+
+    priceInput.addEventListener("input", function () {
+      updateRowTotal(row);
+    });
+
+    removeBtn.addEventListener("click", function () {
+      row.remove();
+      updateTotalAmount();
+    });
+  }
+
+  // Typeahead: a search box above the select fills it with matching products
+  function setupProductSearch(row, productSelect) {
+    let searchInput = row.querySelector(".product-search");
+    if (!searchInput) {
+      searchInput = document.createElement("input");
+      searchInput.type = "search";
+      searchInput.className = "form-control product-search mb-1";
+      searchInput.placeholder = "Search products...";
+      searchInput.autocomplete = "off";
+      productSelect.parentNode.insertBefore(searchInput, productSelect);
+    }
+
+    let timer = null;
+    let latest = 0;
+    searchInput.addEventListener("input", function () {
+      clearTimeout(timer);
+      const query = this.value.trim();
+      if (!query) {
+        return;
+      }
+      timer = setTimeout(function () {
+        const requestId = ++latest;
+        fetch(`/product/search?q=${encodeURIComponent(query)}`)
+          .then((response) => response.json())
+          .then((data) => {
+            // Ignore answers to queries the user has already typed past
+            if (requestId === latest) {
+              fillProductSelect(productSelect, data);
+            }
+          });
+      }, SEARCH_DELAY);
+    });
+  }
+
+  function fillProductSelect(productSelect, matches) {
+    productSelect.innerHTML = "";
+    if (!matches.length) {
+      productSelect.appendChild(new Option("No matching products", ""));
+      return;
+    }
+    matches.forEach((p) => {
+      const option = new Option(`${p.name} (₮${p.price})`, p.id);
+      option.dataset.price = p.price;
+      productSelect.appendChild(option);
+    });
+    productSelect.dispatchEvent(new Event("change"));
+  }
+
+  // Update row total
+  function updateRowTotal(row) {
+    const quantity =
+      parseFloat(row.querySelector(".quantity-input").value) || 0;
+    const price = parseFloat(row.querySelector(".price-input").value) || 0;
+    const total = quantity * price;
+    row.querySelector(".total-input").value = total.toFixed(2);
+    updateTotalAmount();
+  }
+
+  // Update total amount
+  function updateTotalAmount() {
+    const totals = Array.from(document.querySelectorAll(".total-input")).map(
+      (input) => parseFloat(input.value) || 0
+    );
+    const total = totals.reduce((sum, value) => sum + value, 0);
+    totalAmountInput.value = total.toFixed(2);
+  }
+
+  // Update all existing product selects
+  function updateAllProductSelects() {
+    document.querySelectorAll(".product-row").forEach((row) => {
+      setupRowEventListeners(row);
+    });
+  }
+  // Submit every line in one JSON request when the form offers an API
+  if (form && form.dataset.submitUrl) {
+    form.addEventListener("submit", function (event) {
+      event.preventDefault();
+      submitAsJson(form);
+    });
+  }
+
+  function submitAsJson(form) {
+    const rows = Array.from(form.querySelectorAll(".product-row"));
+    const payload = {
+      delivery_date: form.querySelector("[name=delivery_date]").value,
+      supermarket_id: supermarketSelect.value,
+      subchain_id: subchainSelect.value,
+      items: rows.map((row) => ({
+        product_id: row.querySelector(".product-select").value,
+        quantity: row.querySelector(".quantity-input").value,
+        price: row.querySelector(".price-input").value,
+      })),
+    };
+
+    fetch(form.dataset.submitUrl, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        "X-CSRFToken": form.querySelector("[name=csrf_token]").value,
+      },
+      body: JSON.stringify(payload),
+    })
+      .then((response) =>
+        response.json().then((data) => ({ ok: response.ok, data: data }))
+      )
+      .then(({ ok, data }) => {
+        if (ok) {
+          window.location = data.redirect;
+        } else {
+          showErrors(form, rows, data.errors || {});
+        }
+      })
+      .catch(() => showErrors(form, rows, { _all: "Could not reach the server" }));
+  }
+
+  // Show field errors next to the inputs they belong to
+  function showErrors(form, rows, errors) {
+    form.querySelectorAll(".is-invalid").forEach((el) => el.classList.remove("is-invalid"));
+    let summary = form.querySelector(".form-errors");
+    if (!summary) {
+      summary = document.createElement("div");
+      summary.className = "form-errors alert alert-danger";
+      form.prepend(summary);
+    }
+
+    const messages = [];
+    Object.entries(errors).forEach(([field, message]) => {
+      if (field === "items") {
+        return;
+      }
+      const input = form.querySelector(`[name=${field}]`);
+      if (input) {
+        input.classList.add("is-invalid");
+      }
+      messages.push(message);
+    });
+
+    const itemErrors = errors.items || {};
+    if (itemErrors._all) {
+      messages.push(itemErrors._all);
+    }
+    Object.entries(itemErrors).forEach(([index, fields]) => {
+      const row = rows[Number(index)];
+      if (!row) {
+        return;
+      }
+      Object.entries(fields).forEach(([field, message]) => {
+        const selector = {
+          product_id: ".product-select",
+          quantity: ".quantity-input",
+          price: ".price-input",
+        }[field];
+        const input = selector && row.querySelector(selector);
+        if (input) {
+          input.classList.add("is-invalid");
+        }
+        messages.push(`Line ${Number(index) + 1}: ${message}`);
+      });
+    });
+
+    summary.textContent = "";
+    messages.forEach((message) => {
+      const line = document.createElement("div");
+      line.textContent = message;
+      summary.appendChild(line);
+    });
+    summary.scrollIntoView({ behavior: "smooth" });
+  }
+});
@@ -0,0 +1,290 @@
+"""Consignment stock ledger: delivered minus returned per location and product.
+
+A location is a supermarket plus an optional subchain, because deliveries
+and returns do not always name a subchain. The ledger is adjusted in the
+same flush that writes the delivery or return. The flush can add, change
+or delete items, or move a delivery to another subchain, so the stock
+page never has to scan the item tables.
+
+``manage.py rebuild_stock_ledger`` and ``verify_stock_ledger`` recompute
+the ledger from history in chunks.
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app import archive
+from app.extensions import db
+from app.models import (
+    Delivery,
+    DeliveryItem,
+    Product,
+    Return,
+    ReturnItem,
+    StockLedger,
+    Subchain,
+    Supermarket,
+)
+
+# item model -> (parent attribute, parent foreign key, ledger column)
+ITEM_SOURCES = {
+    DeliveryItem: ('delivery', 'delivery_id', 'delivered'),
+    ReturnItem: ('return_obj', 'return_id', 'returned'),
+}
+
+ITEM_PARENTS = {DeliveryItem: Delivery, ReturnItem: Return}
+
+HEADER_SOURCES = {
+    Delivery: (Delivery, DeliveryItem, 'delivery_id', 'delivered'),
+    Return: (Return, ReturnItem, 'return_id', 'returned'),
+}
+
+LOCATION_ATTRS = ('supermarket_id', 'subchain_id')
+
+
+def _old(obj, attr):
+    """Value of an attribute before the current flush"""
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return None
+
+
+def _location_changed(header):
+    return any(inspect(header).attrs[attr].history.has_changes() for attr in LOCATION_ATTRS)
+
+
+def _parent(session, item, parent_attr, fk):
+    parent = getattr(item, parent_attr)
+    if parent is None and _old(item, fk):
+        parent = session.get(ITEM_PARENTS[type(item)], _old(item, fk))
+    return parent
+
+
+def _collect_deltas(session, new, dirty, deleted):
+    """Work out how the flushed changes move stock, per location and product"""
+    items = {}
+    for obj in list(new) + list(dirty) + list(deleted):
+        if type(obj) in ITEM_SOURCES:
+            items[id(obj)] = obj
+        elif type(obj) in HEADER_SOURCES and obj in dirty and _location_changed(obj):
+            # Moving a delivery or return moves all of its items
+            for item in obj.items:
+                items[id(item)] = item
+
+    deltas = defaultdict(lambda: [0, 0])
+    for item in items.values():
+        parent_attr, fk, column = ITEM_SOURCES[type(item)]
+        position = 0 if column == 'delivered' else 1
+        parent = _parent(session, item, parent_attr, fk)
+        if parent is None:
+            continue
+
+        if item not in new:
+            key = (
+                _old(parent, 'supermarket_id'),
+                _old(parent, 'subchain_id'),
+                _old(item, 'product_id'),
+            )
+            deltas[key][position] -= _old(item, 'quantity') or 0
+
+        if item not in deleted and parent not in deleted:
+            key = (parent.supermarket_id, parent.subchain_id, item.product_id)
+            deltas[key][position] += item.quantity or 0
+
+    return {key: delta for key, delta in deltas.items() if delta != [0, 0]}
+
+
+def apply_deltas(connection, deltas):
+    """
+    Add quantity changes to the ledger rows, creating rows as needed
+
+    Args:
+        connection: SQLAlchemy connection inside the current transaction
+        deltas (dict): (supermarket_id, subchain_id, product_id) ->
+            [delivered change, returned change]
+    """
+    table = StockLedger.__table__
+    now = datetime.utcnow()
+    for (supermarket_id, subchain_id, product_id), (delivered, returned) in deltas.items():
+        where = (
+            (table.c.supermarket_id == supermarket_id)
+            & (func.coalesce(table.c.subchain_id, 0) == (subchain_id or 0))
+            & (table.c.product_id == product_id)
+        )
+        result = connection.execute(
+            table.update()
+            .where(where)
+            .values(
+                delivered=table.c.delivered + delivered,
+                returned=table.c.returned + returned,
+                updated_at=now,
+            )
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(
+                supermarket_id=supermarket_id,
+                subchain_id=subchain_id,
+                product_id=product_id,
+                delivered=delivered,
+                returned=returned,
+                updated_at=now,
+            ))
+        else:
+            connection.execute(
+                table.delete().where(where & (table.c.delivered == 0) & (table.c.returned == 0))
+            )
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_ledger(session, flush_context):
+    """Apply the stock movements of this flush to the ledger"""
+    new, dirty, deleted = session.new, session.dirty, session.deleted
+    with session.no_autoflush:
+        deltas = _collect_deltas(session, new, dirty, deleted)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def _sum_items(connection, header, item, fk, position, totals, chunk_size):
+    """Add the item quantities of one header table to the totals"""
+    last_id = 0
+    while True:
+        bounds = connection.execute(
+            select(header.c.id).where(header.c.id > last_id)
+            .order_by(header.c.id).limit(chunk_size)
+        ).scalars().all()
+        if not bounds:
+            break
+        rows = connection.execute(
+            select(header.c.supermarket_id, header.c.subchain_id,
+                   item.c.product_id, func.sum(item.c.quantity))
+            .select_from(item.join(header, header.c.id == item.c[fk]))
+            .where(header.c.id > last_id, header.c.id <= bounds[-1])
+            .group_by(header.c.supermarket_id, header.c.subchain_id, item.c.product_id)
+        )
+        for supermarket_id, subchain_id, product_id, quantity in rows:
+            totals[(supermarket_id, subchain_id, product_id)][position] += quantity
+        last_id = bounds[-1]
+
+
+def compute_from_history(connection, chunk_size=5000, archive_dir=None):
+    """
+    Recompute the ledger from all delivery and return items
+
+    Items are summed one chunk of parent ids at a time, so the database
+    never has to group the whole history in a single statement.
+
+    Args:
+        connection: SQLAlchemy connection
+        chunk_size (int): Deliveries or returns per chunk
+        archive_dir (str): Archive directory whose months are included too
+
+    Returns:
+        dict: (supermarket_id, subchain_id, product_id) -> [delivered, returned]
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for position, (header_model, item_model, fk, _) in enumerate(HEADER_SOURCES.values()):
+        _sum_items(connection, header_model.__table__, item_model.__table__, fk,
+                   position, totals, chunk_size)
+
+    if archive_dir:
+        for months in archive.month_batches(archive.archived_months(archive_dir)):
+            with archive.attached(connection, archive_dir, months) as views:
+                for position, (header_model, item_model, fk, _) in enumerate(
+                    HEADER_SOURCES.values()
+                ):
+                    _sum_items(connection, views[header_model.__tablename__],
+                               views[item_model.__tablename__], fk,
+                               position, totals, chunk_size)
+    return {key: value for key, value in totals.items() if value != [0, 0]}
+
+
+def _ledger_rows(connection):
+    table = StockLedger.__table__
+    return {
+        (row.supermarket_id, row.subchain_id, row.product_id): [row.delivered, row.returned]
+        for row in connection.execute(select(table))
+        if row.delivered or row.returned
+    }
+
+
+def verify_ledger(connection, chunk_size=5000, archive_dir=None):
+    """
+    Compare the ledger with a fresh computation from history
+
+    Archived months count as history when archive_dir is given.
+
+    Returns:
+        list: (key, ledger value, expected value) for every mismatch
+    """
+    expected = compute_from_history(connection, chunk_size, archive_dir)
+    actual = _ledger_rows(connection)
+    return [
+        (key, actual.get(key), expected.get(key))
+        for key in sorted(set(expected) | set(actual), key=lambda k: tuple(v or 0 for v in k))
+        if actual.get(key) != expected.get(key)
+    ]
+
+
+def rebuild_ledger(connection, chunk_size=5000, archive_dir=None):
+    """
+    Replace the ledger with a fresh computation from history
+
+    Args:
+        connection: SQLAlchemy connection; the caller commits
+        chunk_size (int): Deliveries or returns per chunk
+        archive_dir (str): Archive directory whose months are included too
+
+    Returns:
+        int: Number of ledger rows written
+    """
+    totals = compute_from_history(connection, chunk_size, archive_dir)
+    table = StockLedger.__table__
+    now = datetime.utcnow()
+    connection.execute(table.delete())
+    rows = [
+        {'supermarket_id': supermarket_id, 'subchain_id': subchain_id,
+         'product_id': product_id, 'delivered': delivered, 'returned': returned,
+         'updated_at': now}
+        for (supermarket_id, subchain_id, product_id), (delivered, returned) in totals.items()
+    ]
+    if rows:
+        connection.execute(table.insert(), rows)
+    return len(rows)
+
+
+def stock_levels(supermarket_id=None, subchain_id=None):
+    """
+    Get ledger rows with location and product names in one query
+
+    Args:
+        supermarket_id (int): Optional supermarket filter
+        subchain_id (int): Optional subchain filter
+
+    Returns:
+        list: Rows with supermarket, subchain, product, delivered, returned, on_hand
+    """
+    query = (
+        db.session.query(
+            Supermarket.name.label('supermarket'),
+            Subchain.name.label('subchain'),
+            Product.name.label('product'),
+            StockLedger.delivered,
+            StockLedger.returned,
+            (StockLedger.delivered - StockLedger.returned).label('on_hand'),
+        )
+        .select_from(StockLedger)
+        .join(Supermarket, Supermarket.id == StockLedger.supermarket_id)
+        .outerjoin(Subchain, Subchain.id == StockLedger.subchain_id)
+        .join(Product, Product.id == StockLedger.product_id)
+    )
+    if supermarket_id:
+        query = query.filter(StockLedger.supermarket_id == supermarket_id)
+    if subchain_id:
+        query = query.filter(StockLedger.subchain_id == subchain_id)
+    return query.order_by(Supermarket.name, Subchain.name, Product.name).all()
@@ -0,0 +1,67 @@
+"""Jinja bytecode cache and template precompilation."""
+import os
+
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+
+
+def get_template_cache_dir(app):
+    """
+    Get the directory holding compiled template bytecode
+
+    Args:
+        app: Flask application instance
+
+    Returns:
+        str: Absolute path of the cache directory
+    """
+    return app.config.get('TEMPLATE_CACHE_DIR') or os.path.join(
+        app.instance_path, 'jinja_cache'
+    )
+
+
+def init_template_cache(app):
+    """
+    Store compiled templates on the filesystem so that every worker
+    and every restart reuses them instead of compiling lazily.
+
+    Must be called before the first template is rendered, because
+    Flask creates the Jinja environment only once.
+
+    Args:
+        app: Flask application instance
+    """
+    if not app.config.get('TEMPLATE_CACHE_ENABLED', True):
+        return
+
+    cache_dir = get_template_cache_dir(app)
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_options = dict(
+        app.jinja_options,
+        bytecode_cache=FileSystemBytecodeCache(cache_dir, '%s.jinja.cache'),
+    )
+
+
+def precompile_templates(app):
+    """
+    Compile every template known to the application into the bytecode cache
+
+    Args:
+        app: Flask application instance
+
+    Returns:
+        tuple: (compiled, failed) lists of template names
+    """
+    compiled = []
+    failed = []
+
+    with app.app_context():
+        env = app.jinja_env
+        for name in env.list_templates():
+            try:
+                env.get_template(name)
+                compiled.append(name)
+            except TemplateSyntaxError as e:
+                app.logger.warning(f"Could not compile template {name}: {str(e)}")
+                failed.append(name)
+
+    return compiled, failed
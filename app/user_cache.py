@@ -0,0 +1,109 @@
+"""Per-process TTL cache of logged-in user snapshots for Flask-Login."""
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from flask_login import UserMixin
+
+
+class UserSnapshot(UserMixin):
+    """
+    Detached copy of the user fields pages and decorators read
+
+    Any other attribute is read from the real User row, so code that needs
+    the ORM object still works. Snapshots are shared between threads, so
+    the row is never stored on them; the session identity map keeps it
+    to one query per request.
+    """
+
+    FIELDS = ('id', 'username', 'email')
+
+    def __init__(self, user, loader):
+        for field in self.FIELDS:
+            setattr(self, field, getattr(user, field))
+        self._loader = loader
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._loader(self.id), name)
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.username}>'
+
+
+class UserCache:
+    """
+    Bounded cache of user snapshots that expire after USER_CACHE_TTL seconds
+
+    Entries are dropped explicitly when a user row changes or the user
+    logs out, but only in this process. Other processes compare the
+    cached version with the user row's version column once an entry is
+    older than USER_CACHE_CHECK_INTERVAL seconds, so a password change
+    or deletion reaches every worker within that interval.
+    """
+
+    def __init__(self, app=None, ttl=60, max_size=10000, check_interval=5):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read cache settings from the app config"""
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        self.max_size = app.config.get('USER_CACHE_SIZE', self.max_size)
+        self.check_interval = app.config.get('USER_CACHE_CHECK_INTERVAL', self.check_interval)
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id, loader, version_loader):
+        """
+        Get a user snapshot, loading the user on a miss
+
+        Args:
+            user_id (int): User primary key
+            loader: Callable taking a user id and returning a User or None
+            version_loader: Callable taking a user id and returning the
+                row's current version, or None if the user does not exist
+
+        Returns:
+            UserSnapshot|None: Snapshot, or None if the user does not exist
+        """
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > now:
+            expires, checked_at, version, snapshot = entry
+            if now - checked_at < self.check_interval:
+                return snapshot
+            if version_loader(user_id) == version:
+                with self._lock:
+                    if user_id in self._entries:
+                        self._entries[user_id] = (expires, now, version, snapshot)
+                return snapshot
+
+        user = loader(user_id)
+        if user is None or not self.ttl:
+            self.invalidate(user_id)
+            return user
+
+        snapshot = UserSnapshot(user, loader)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, now, user.version, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        """Forget a user, e.g. after a password change or logout"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        """Forget every user"""
+        with self._lock:
+            self._entries.clear()
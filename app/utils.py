@@ -1,4 +0,0 @@
-@app.template_filter('currency')
-def currency_filter(value):
-    """Format value as Mongolian currency."""
-    return f"₮{value:,.2f}" 
\ No newline at end of file
@@ -0,0 +1,6 @@
+"""Shared helpers for routes and templates."""
+
+
+def currency_filter(value):
+    """Format value as Mongolian currency."""
+    return f"₮{value:,.2f}"
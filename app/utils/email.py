@@ -1,23 +1,14 @@
-from flask import current_app, render_template
+from flask import render_template
 from flask_mail import Message
-from threading import Thread
-from app import mail
-
-
-def send_async_email(app, msg):
-    """Send email asynchronously"""
-    with app.app_context():
-        mail.send(msg)
+from app.mail_dispatch import mail_dispatcher
 
 
 def send_email(subject, recipients, text_body, html_body):
-    """Send email wrapper"""
+    """Queue email for delivery by the mail dispatcher"""
     msg = Message(
         subject=subject, recipients=recipients, body=text_body, html=html_body
     )
-    Thread(
-        target=send_async_email, args=(current_app._get_current_object(), msg)
-    ).start()
+    mail_dispatcher.enqueue(msg)
 
 
 def send_password_reset_email(user):
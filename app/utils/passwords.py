@@ -0,0 +1,143 @@
+"""Password hashing with configurable cost, run in a bounded process pool."""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from threading import BoundedSemaphore, Lock
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+_executor = None
+_slots = None
+_executor_lock = Lock()
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hashes are already waiting for the pool"""
+
+
+def _get_executor(workers, max_pending):
+    """Get or lazily create the shared process pool"""
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            # Forking a threaded server copies locks other threads hold;
+            # spawned workers start from a clean interpreter instead
+            _executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+            )
+            _slots = BoundedSemaphore(max_pending)
+        return _executor, _slots
+
+
+def _reset_executor():
+    """Drop a broken pool so the next call starts a fresh one"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+
+
+def _run(func, *args):
+    """
+    Run a hashing function in the process pool
+
+    With PASSWORD_HASH_WORKERS = 0 the function runs in the calling thread.
+
+    Raises:
+        PasswordHasherBusy: If no pool slot frees up within the queue timeout
+    """
+    config = current_app.config
+    workers = config.get('PASSWORD_HASH_WORKERS', 0)
+    if not workers:
+        return func(*args)
+
+    executor, slots = _get_executor(workers, config.get('PASSWORD_HASH_MAX_PENDING', 16))
+    if not slots.acquire(timeout=config.get('PASSWORD_HASH_QUEUE_TIMEOUT', 5)):
+        raise PasswordHasherBusy()
+
+    try:
+        return executor.submit(func, *args).result()
+    except BrokenProcessPool:
+        current_app.logger.error("Password hashing pool broke, restarting it")
+        _reset_executor()
+        return func(*args)
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    """
+    Hash a password with the configured method and cost
+
+    Args:
+        password (str): Plain text password
+
+    Returns:
+        str: Password hash
+    """
+    config = current_app.config
+    return _run(
+        generate_password_hash,
+        password,
+        config['PASSWORD_HASH_METHOD'],
+        config.get('PASSWORD_SALT_LENGTH', 16),
+    )
+
+
+def verify_password(password_hash, password):
+    """
+    Check a password against a hash
+
+    Args:
+        password_hash (str): Stored hash
+        password (str): Plain text password
+
+    Returns:
+        bool: True if the password matches
+    """
+    return _run(check_password_hash, password_hash, password)
+
+
+@lru_cache(maxsize=8)
+def _canonical_method(method):
+    """Expand a method such as 'scrypt' to the full 'scrypt:32768:8:1' werkzeug stores"""
+    return generate_password_hash('', method, 1).split('$', 1)[0]
+
+
+def _strength(method):
+    """
+    Order hash methods by how costly they are to attack
+
+    scrypt ranks above pbkdf2; within one algorithm the work factor decides.
+    Methods this module does not know rank below both.
+    """
+    name, *params = method.split(':')
+    try:
+        if name == 'scrypt':
+            n, r, p = (int(value) for value in params)
+            return 2, n * r * p
+        if name == 'pbkdf2':
+            return 1, int(params[1])
+    except (ValueError, IndexError):
+        pass
+    return 0, 0
+
+
+def needs_rehash(password_hash):
+    """
+    Check whether the configured method is stronger than a hash's own
+
+    A weaker configured method never replaces a stronger stored hash.
+
+    Args:
+        password_hash (str): Stored hash
+
+    Returns:
+        bool: True if the hash should be replaced on the next successful login
+    """
+    method = password_hash.split('$', 1)[0]
+    configured = _canonical_method(current_app.config['PASSWORD_HASH_METHOD'])
+    return _strength(method) < _strength(configured)
@@ -1,4 +1,4 @@
-from flask import current_app
+from flask import current_app, request
 from flask_login import current_user
 from functools import wraps
 from time import time
@@ -127,7 +127,7 @@ def create_rate_limit_response(remaining, reset_time, limit):
     return response_text, headers
 
 
-def rate_limit(key_prefix, limit=5, period=300):
+def rate_limit(key_prefix, limit=5, period=300, methods=None):
     """
     Rate limiting decorator
 
@@ -135,6 +135,8 @@ def rate_limit(key_prefix, limit=5, period=300):
         key_prefix (str): Prefix for rate limit key (e.g., 'login', 'register')
         limit (int): Number of allowed requests
         period (int): Time period in seconds
+        methods (tuple): Only requests with these HTTP methods count and
+            can be refused, e.g. ('POST',) for form submissions; all by default
 
     Returns:
         function: Decorated function with rate limiting
@@ -144,6 +146,8 @@ def rate_limit(key_prefix, limit=5, period=300):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
+            if methods is not None and request.method not in methods:
+                return f(*args, **kwargs)
             try:
                 identifier = (
                     str(current_user.id)
@@ -172,13 +176,14 @@ def rate_limit(key_prefix, limit=5, period=300):
 
                     return response
 
-                return f(*args, **kwargs)
-
             except Exception as e:
+                # Fail open on limiter errors; errors raised by the view
+                # itself propagate, so the view never runs twice
                 current_app.logger.error(
                     f"Rate limit decorator error: {str(e)}", exc_info=True
                 )
-                return f(*args, **kwargs)  # Fail open on error
+
+            return f(*args, **kwargs)
 
         return decorated_function
 
@@ -0,0 +1,90 @@
+"""Measure response compression on the listing pages.
+
+Builds a throwaway SQLite database, fetches each page plain, with gzip
+and with brotli (when installed), and prints the body sizes. It then
+times the compressors on the largest body, whole and in streamed chunks:
+
+    python benchmarks/compression.py --deliveries 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+# Also puts the repository root on sys.path and sets the test environment
+from prices import seed
+
+from app import create_app  # noqa: E402
+from app.compression import _BrotliStream, _GzipStream, brotli  # noqa: E402
+from app.extensions import db, fragment_cache  # noqa: E402
+from config import Config  # noqa: E402
+
+PAGES = ['/delivery/', '/return/', '/delivery/download']
+
+CHUNK = 16 * 1024
+
+
+def _best(runs, func):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def _chunked(compressor_class, setting, body):
+    def run():
+        compressor = compressor_class(setting)
+        for start in range(0, len(body), CHUNK):
+            compressor.compress(body[start:start + CHUNK])
+        compressor.finish()
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--deliveries', type=int, default=2000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    encodings = ['gzip'] + (['br'] if brotli is not None else [])
+    with tempfile.TemporaryDirectory() as directory:
+        settings = {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            'ARCHIVE_DIR': os.path.join(directory, 'archive'),
+            'WTF_CSRF_ENABLED': False,
+            'PASSWORD_HASH_WORKERS': 0,
+        }
+        app = create_app(type('BenchConfig', (Config,), settings))
+        with app.app_context():
+            db.create_all()
+            seed(args.deliveries)
+            client = app.test_client()
+            client.post('/auth/login', data={'username': 'bench', 'password': 'bench'})
+
+            print(f"{args.deliveries} deliveries")
+            largest = b''
+            for url in PAGES:
+                sizes = []
+                for encoding in ['identity'] + encodings:
+                    fragment_cache.clear()
+                    body = client.get(url, headers={'Accept-Encoding': encoding}).get_data()
+                    sizes.append(f"{encoding} {len(body) / 1024:,.0f} KB")
+                    if encoding == 'identity' and len(body) > len(largest):
+                        largest = body
+                print(f"  {url:<20} " + ', '.join(sizes))
+
+    print(f"Compressor CPU on {len(largest) / 1024:,.0f} KB, best of {args.runs}")
+    cases = [('gzip level 6', _GzipStream, 6)]
+    if brotli is not None:
+        cases.append(('brotli quality 4', _BrotliStream, 4))
+    for name, compressor_class, setting in cases:
+        whole = _best(args.runs, lambda: compressor_class(setting).compress_once(largest))
+        chunked = _best(args.runs, _chunked(compressor_class, setting, largest))
+        print(f"  {name:<18} whole {whole * 1000:6.1f} ms, "
+              f"{CHUNK // 1024} KiB chunks {chunked * 1000:6.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Time the pages and jobs that total prices.
+
+Builds a throwaway SQLite database with deliveries, items and returns,
+then times each case a few times and prints the best run. Run it from
+the repository root on two checkouts to compare them:
+
+    python benchmarks/prices.py --deliveries 5000
+
+Only models, routes and helpers present both before and after the
+integer cents change are used, so the script runs on either tree.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('SESSION_BACKEND', 'cookie')
+os.environ.setdefault('TEMPLATE_CACHE_ENABLED', '0')
+os.environ.setdefault('MAIL_DISPATCH_ASYNC', '0')
+
+from app import create_app  # noqa: E402
+from app.extensions import db, fragment_cache  # noqa: E402
+from app.models import (  # noqa: E402
+    Delivery,
+    DeliveryItem,
+    Product,
+    Return,
+    ReturnItem,
+    Supermarket,
+    User,
+)
+from app.statements import build_statements  # noqa: E402
+from config import Config  # noqa: E402
+
+FIRST_DAY = date(2026, 1, 1)
+
+
+def seed(deliveries, lines=5, products=200, supermarkets=20):
+    rng = random.Random(1)
+    db.session.add_all(Supermarket(name=f'Supermarket {n}') for n in range(supermarkets))
+    db.session.add_all(
+        Product(name=f'Product {n}', price=f'{rng.randint(100, 99999) / 100:.2f}', weight=1.0)
+        for n in range(products)
+    )
+    db.session.commit()
+
+    for number in range(deliveries):
+        day = FIRST_DAY + timedelta(days=number % 300)
+        supermarket_id = number % supermarkets + 1
+        delivery = Delivery(delivery_date=day, supermarket_id=supermarket_id)
+        delivery.items = [
+            DeliveryItem(product_id=rng.randint(1, products), quantity=rng.randint(1, 50),
+                         price=f'{rng.randint(100, 99999) / 100:.2f}')
+            for _ in range(lines)
+        ]
+        db.session.add(delivery)
+        if number % 4 == 0:
+            return_ = Return(delivery_date=day, return_date=day + timedelta(days=3),
+                             supermarket_id=supermarket_id)
+            return_.items = [
+                ReturnItem(product_id=item.product_id, quantity=1, price=item.price)
+                for item in delivery.items[:2]
+            ]
+            db.session.add(return_)
+        if number % 500 == 499:
+            db.session.commit()
+    user = User(username='bench', email='bench@example.mn')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.commit()
+
+
+def best_of(runs, func):
+    timings = []
+    for _ in range(runs):
+        db.session.expire_all()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--deliveries', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        settings = {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            'ARCHIVE_DIR': os.path.join(directory, 'archive'),
+            'WTF_CSRF_ENABLED': False,
+            'PASSWORD_HASH_WORKERS': 0,
+        }
+        app = create_app(type('BenchConfig', (Config,), settings))
+        with app.app_context():
+            db.create_all()
+            seed(args.deliveries)
+            client = app.test_client()
+            client.post('/auth/login', data={'username': 'bench', 'password': 'bench'})
+
+            def page(url, cold=True):
+                def fetch():
+                    if cold:
+                        fragment_cache.clear()
+                    response = client.get(url)
+                    response.get_data()
+                    assert response.status_code == 200, url
+                return fetch
+
+            cases = [
+                ('report page, cold fragments', page('/report/generate')),
+                ('report CSV', page('/report/download')),
+                ('return listing, cold fragments', page('/return/')),
+                ('report page, warm fragments', page('/report/generate', cold=False)),
+                ('Python total of all deliveries',
+                 lambda: sum(delivery.total_value for delivery in Delivery.query)),
+                ('weekly statements',
+                 lambda: build_statements(FIRST_DAY, FIRST_DAY + timedelta(days=6))),
+            ]
+            print(f"{args.deliveries} deliveries, best of {args.runs}")
+            for name, func in cases:
+                print(f"  {name:<34} {best_of(args.runs, func):7.2f} s")
+
+
+if __name__ == '__main__':
+    main()
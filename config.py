@@ -13,17 +13,118 @@ class Config:
     # Flask configuration
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-key-please-change-in-production'
 
+    # Session configuration: 'sqlite', 'filesystem', 'redis' or 'cookie'
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite')
+    SESSION_SQLITE_PATH = os.path.join(basedir, 'instance', 'sessions.db')
+    SESSION_FILE_DIR = os.path.join(basedir, 'instance', 'sessions')
+    SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+
     # SQLAlchemy configuration
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Password hashing configuration; weaker existing hashes are upgraded on login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = 16
+    PASSWORD_HASH_QUEUE_TIMEOUT = 5  # seconds
+
+    # Logged-in user snapshots, saving a query per request (0 disables)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    USER_CACHE_SIZE = 10000
+    # Seconds before a cached user is checked against the row's version
+    USER_CACHE_CHECK_INTERVAL = 5
+
     # Mail configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'localhost')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 25))
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', False)
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
+    MAIL_DISPATCH_ASYNC = os.environ.get('MAIL_DISPATCH_ASYNC', '1') == '1'
+    MAIL_WORKERS = int(os.environ.get('MAIL_WORKERS', 2))
+    MAIL_BATCH_SIZE = 20
+    MAIL_MAX_RETRIES = 5
+    MAIL_RETRY_BASE_DELAY = 30  # seconds, doubled on every attempt
+    MAIL_RETRY_MAX_DELAY = 3600
+    MAIL_POLL_INTERVAL = 15
+    MAIL_CLAIM_TIMEOUT = 600
+
+    # Template configuration
+    TEMPLATE_CACHE_ENABLED = os.environ.get('TEMPLATE_CACHE_ENABLED', '1') == '1'
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR') or \
+        os.path.join(basedir, 'instance', 'jinja_cache')
+    STREAM_BUFFER_SIZE = 200
+    LISTING_YIELD_PER = 500
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 50000))
+
+    # Response compression configuration
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', '1') == '1'
+    COMPRESS_MIN_SIZE = 1024  # bytes; smaller bodies are sent as is
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4
+    COMPRESS_MIMETYPES = [
+        'text/html',
+        'text/css',
+        'text/csv',
+        'text/plain',
+        'application/javascript',
+        'application/json',
+        'application/x-ndjson',
+    ]
+
+    # Largest delivery accepted by the JSON submission endpoint
+    DELIVERY_MAX_ITEMS = 1000
+    PRODUCT_SEARCH_LIMIT = 20
+    # Seconds between checks for product changes made by other processes
+    PRODUCT_SEARCH_CHECK_INTERVAL = 2
+
+    # New deliveries and returns applied to the cached return-rate
+    # aggregates before a full rebuild is cheaper
+    ANALYTICS_MAX_INCREMENTAL_EVENTS = 2000
+    # Rebuild after edits in a background thread, serving the old figures meanwhile
+    ANALYTICS_ASYNC_REBUILD = True
+
+    # Payload of one delivery truck in kg, used by the daily manifests
+    TRUCK_CAPACITY_KG = float(os.environ.get('TRUCK_CAPACITY_KG', 1500))
+    # Largest capacity a manifest request may ask for; others get TRUCK_CAPACITY_KG
+    TRUCK_CAPACITY_MAX_KG = 40000
+
+    # Suggested order quantities, refreshed daily at DEMAND_REFRESH_HOUR
+    DEMAND_SMOOTHING_ALPHA = 0.3
+    DEMAND_HISTORY_DAYS = 180
+    DEMAND_REFRESH_HOUR = 2
+    DEMAND_STATE_FILE = os.path.join(basedir, 'instance', 'demand_last_refresh')
+
+    # Monthly columnar snapshots written by manage.py snapshot ('parquet' or 'feather')
+    SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR') or os.path.join(basedir, 'instance', 'snapshots')
+    SNAPSHOT_FORMAT = 'parquet'
+
+    # Months older than the last ARCHIVE_KEEP_MONTHS move to monthly archive files
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or os.path.join(basedir, 'instance', 'archive')
+    ARCHIVE_KEEP_MONTHS = 12
+
+    # Nightly maintenance of the SQLite files (ANALYZE, incremental vacuum,
+    # WAL checkpoint, quick_check); each file gets MAINTENANCE_TIME_BUDGET seconds
+    MAINTENANCE_HOUR = 3
+    MAINTENANCE_TIME_BUDGET = 60
+    MAINTENANCE_BUSY_TIMEOUT = 1  # seconds to wait for a lock before giving up
+    MAINTENANCE_ANALYSIS_LIMIT = 1000  # rows sampled per index by ANALYZE
+    MAINTENANCE_VACUUM_PAGES = 1000  # free pages released per transaction
+    MAINTENANCE_EXTRA_DATABASES = []
+    MAINTENANCE_STATE_FILE = os.path.join(basedir, 'instance', 'maintenance_last_run')
+
+    # Change feed configuration
+    OUTBOX_MAX_WAIT = 25
+    OUTBOX_EXPORT_DIR = os.path.join(basedir, 'instance', 'outbox')
+
+    # Statement email configuration
+    STATEMENT_WEEKDAY = 0  # Monday
+    STATEMENT_HOUR = 6
+    STATEMENT_STATE_FILE = os.path.join(basedir, 'instance', 'statements_last_period')
 
     # Additional configuration variables can be added here
     DEBUG = os.environ.get('FLASK_DEBUG', '0') == '1'
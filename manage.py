@@ -1,13 +1,213 @@
 # manage.py
-from flask_script import Manager
-from flask_migrate import MigrateCommand
+from datetime import date
+
+import click
+from flask.cli import FlaskGroup
+
 from app import create_app, db
+from app.template_cache import precompile_templates as compile_all_templates
+from app.outbox import export_ndjson
+from app.mail_dispatch import mail_dispatcher
+from app.statements import previous_week, run_scheduler, send_statements as queue_statements
+from app.assets import build_assets as build_asset_bundles
+from app.search_index import rebuild_index
+from app.stock_ledger import rebuild_ledger, verify_ledger
+from app.return_matching import match_all
+from app.demand import refresh_estimates, run_scheduler as run_demand_refresh
+from app.snapshots import write_snapshot
+from app.archive import archive_cold_months
+from app.query_plans import check_plans
+from app.db_maintenance import maintain_databases as run_maintenance, run_scheduler as run_maintenance_loop
 
 app = create_app()
-manager = Manager(app)
 
-# Add the Flask-Migrate commands to the manager
-manager.add_command('db', MigrateCommand)
+# `python manage.py <command>`; every command runs inside an app context.
+# Flask-Migrate adds its `db` group to the same CLI.
+cli = FlaskGroup(create_app=lambda: app)
+
+
+@cli.command('precompile_templates')
+def precompile_templates():
+    """Compile all templates into the Jinja bytecode cache."""
+    compiled, failed = compile_all_templates(app)
+    print(f"Compiled {len(compiled)} templates")
+    for name in failed:
+        print(f"Failed: {name}")
+
+
+@cli.command('export_outbox')
+@click.option('--directory', help='Defaults to OUTBOX_EXPORT_DIR.')
+@click.option('--batch-size', default=1000, show_default=True)
+def export_outbox(directory, batch_size):
+    """Write new change feed events as NDJSON batch files."""
+    directory = directory or app.config['OUTBOX_EXPORT_DIR']
+    written = export_ndjson(directory, batch_size)
+    print(f"Wrote {len(written)} batch files to {directory}")
+
+
+@cli.command('send_queued_mail')
+def send_queued_mail():
+    """Send every due message in the mail queue and exit."""
+    processed = mail_dispatcher.drain()
+    print(f"Processed {processed} queued emails")
+
+
+@cli.command('run_mail_workers')
+def run_mail_workers():
+    """Run forever, sending queued mail as it becomes due."""
+    mail_dispatcher.run(app)
+
+
+@cli.command('send_statements')
+@click.option('--start', help='First day, YYYY-MM-DD.')
+@click.option('--end', help='Last day, YYYY-MM-DD.')
+def send_statements(start, end):
+    """Queue statement emails for a period (default: last full week)."""
+    default_start, default_end = previous_week(date.today())
+    start = date.fromisoformat(start) if start else default_start
+    end = date.fromisoformat(end) if end else default_end
+    count = queue_statements(start, end)
+    print(f"Queued {count} statements for {start} - {end}")
+
+
+@cli.command('run_statement_scheduler')
+def run_statement_scheduler():
+    """Run forever, queueing weekly statements at the configured time."""
+    run_scheduler(app)
+
+
+@cli.command('build_assets')
+def build_assets():
+    """Bundle, minify, fingerprint and precompress static assets."""
+    manifest = build_asset_bundles(app)
+    for name, hashed_name in sorted(manifest.items()):
+        print(f"{name} -> {hashed_name}")
+
+
+@cli.command('rebuild_search_index')
+def rebuild_search_index():
+    """Create the delivery/return search index and index all rows."""
+    counts = rebuild_index(db.session.connection())
+    db.session.commit()
+    print(f"Indexed {counts['delivery']} deliveries and {counts['return']} returns")
+
+
+@cli.command('rebuild_stock_ledger')
+@click.option('--chunk-size', default=5000, show_default=True)
+def rebuild_stock_ledger(chunk_size):
+    """Recompute the stock ledger from delivery and return history."""
+    count = rebuild_ledger(db.session.connection(), chunk_size, app.config['ARCHIVE_DIR'])
+    db.session.commit()
+    print(f"Wrote {count} stock ledger rows")
+
+
+@cli.command('verify_stock_ledger')
+@click.option('--chunk-size', default=5000, show_default=True)
+def verify_stock_ledger(chunk_size):
+    """Compare the stock ledger with delivery and return history."""
+    mismatches = verify_ledger(db.session.connection(), chunk_size, app.config['ARCHIVE_DIR'])
+    for key, actual, expected in mismatches:
+        print(f"{key}: ledger {actual}, history {expected}")
+    print(f"{len(mismatches)} mismatches")
+    if mismatches:
+        raise SystemExit(1)
+
+
+@cli.command('match_returns')
+@click.option('--batch-size', default=500, show_default=True)
+def match_returns(batch_size):
+    """Match every return item against deliveries again."""
+    items, allocations = match_all(db.session.connection(), batch_size)
+    db.session.commit()
+    print(f"Matched {items} return items with {allocations} allocations")
+
+
+@cli.command('refresh_demand_estimates')
+def refresh_demand_estimates():
+    """Recompute the suggested order quantities from recent history."""
+    count = refresh_estimates(
+        db.session.connection(),
+        alpha=app.config['DEMAND_SMOOTHING_ALPHA'],
+        history_days=app.config['DEMAND_HISTORY_DAYS'],
+    )
+    db.session.commit()
+    print(f"Stored {count} demand estimates")
+
+
+@cli.command('run_demand_scheduler')
+def run_demand_scheduler():
+    """Run forever, refreshing the demand estimates every night."""
+    run_demand_refresh(app)
+
+
+@cli.command('snapshot')
+@click.option('--directory', help='Defaults to SNAPSHOT_DIR.')
+@click.option('--format', 'file_format', type=click.Choice(['parquet', 'feather']),
+              help='Defaults to SNAPSHOT_FORMAT.')
+def snapshot(directory, file_format):
+    """Write new and changed months of deliveries and returns to columnar files."""
+    result = write_snapshot(
+        db.session.connection(),
+        directory or app.config['SNAPSHOT_DIR'],
+        file_format or app.config['SNAPSHOT_FORMAT'],
+        app.config['ARCHIVE_DIR'],
+    )
+    for dataset, month in result['written']:
+        print(f"Wrote {dataset} {month}")
+    for dataset, month in result['removed']:
+        print(f"Removed {dataset} {month}")
+    print(f"{len(result['written'])} partitions written, {len(result['unchanged'])} unchanged")
+
+
+@cli.command('archive_cold_data')
+@click.option('--keep-months', type=int, help='Defaults to ARCHIVE_KEEP_MONTHS.')
+def archive_cold_data(keep_months):
+    """Move deliveries and returns of old months into compressed monthly archives."""
+    results = archive_cold_months(
+        db.engine,
+        app.config['ARCHIVE_DIR'],
+        keep_months or app.config['ARCHIVE_KEEP_MONTHS'],
+        keep_days=app.config['DEMAND_HISTORY_DAYS'],
+    )
+    for month, counts in results:
+        print(f"Archived {month}: {counts['delivery']} deliveries, {counts['return']} returns")
+    print(f"{len(results)} months archived")
+
+
+@cli.command('check_query_plans')
+def check_query_plans():
+    """Fail when a hot query plan reads a whole table instead of an index."""
+    results = check_plans(db.session.connection())
+    failed = 0
+    for name, details, problems in results:
+        print(f"{'FAIL' if problems else 'OK'}   {name}")
+        for detail in details:
+            print(f"       {detail}")
+        failed += bool(problems)
+    print(f"{failed} of {len(results)} query plans scan a table")
+    if failed:
+        raise SystemExit(1)
+
+
+@cli.command('maintain_databases')
+@click.option('--full-vacuum', is_flag=True,
+              help='Switch the files to incremental auto-vacuum with a full VACUUM first.')
+def maintain_databases(full_vacuum):
+    """Check, analyze, vacuum and checkpoint the SQLite database files."""
+    reports = run_maintenance(app, full_vacuum=full_vacuum)
+    for report in reports:
+        print(report['path'])
+        for name, seconds, result in report['steps']:
+            print(f"  {name}: {result} ({seconds:.2f} s)")
+        (size_before, wal_before), (size_after, wal_after) = report['before'], report['after']
+        print(f"  size: {size_before} -> {size_after} bytes, WAL {wal_before} -> {wal_after} bytes")
+
+
+@cli.command('run_maintenance_scheduler')
+def run_maintenance_scheduler():
+    """Run forever, maintaining the database files every night."""
+    run_maintenance_loop(app)
+
 
 if __name__ == '__main__':
-    manager.run()
+    cli()
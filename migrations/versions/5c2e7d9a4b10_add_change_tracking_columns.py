@@ -0,0 +1,41 @@
+"""Add change tracking columns
+
+Revision ID: 5c2e7d9a4b10
+Revises: 1da6a2fe16ab
+Create Date: 2026-10-19 10:12:41.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2e7d9a4b10'
+down_revision = '1da6a2fe16ab'
+branch_labels = None
+depends_on = None
+
+
+TRACKED_TABLES = ['supermarket', 'subchain', 'product', 'delivery', 'return']
+
+
+def upgrade():
+    for table in TRACKED_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+            batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+            batch_op.create_index(batch_op.f(f'ix_{table}_updated_at'), ['updated_at'], unique=False)
+
+    # Existing rows count as changed when they were created
+    for table in ['delivery', 'return']:
+        op.execute(f'UPDATE "{table}" SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)')
+    for table in ['supermarket', 'subchain', 'product']:
+        op.execute(f'UPDATE "{table}" SET updated_at = CURRENT_TIMESTAMP')
+
+
+def downgrade():
+    for table in reversed(TRACKED_TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{table}_updated_at'))
+            batch_op.drop_column('version')
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,27 @@
+"""Add user version
+
+Revision ID: 9b5e1d7c3a48
+Revises: c3f6a9e2d471
+Create Date: 2026-10-19 23:12:40.507193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b5e1d7c3a48'
+down_revision = 'c3f6a9e2d471'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Cached logged-in users are checked against it across processes
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,43 @@
+"""Add demand estimate table
+
+Revision ID: a7c3e9d51f20
+Revises: f2a9c6e1b873
+Create Date: 2026-10-19 20:12:38.904215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9d51f20'
+down_revision = 'f2a9c6e1b873'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('demand_estimate',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('supermarket_id', sa.Integer(), nullable=False),
+    sa.Column('subchain_id', sa.Integer(), nullable=True),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('level', sa.Float(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+    sa.ForeignKeyConstraint(['subchain_id'], ['subchain.id'], ),
+    sa.ForeignKeyConstraint(['supermarket_id'], ['supermarket.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('demand_estimate', schema=None) as batch_op:
+        batch_op.create_index('ix_demand_estimate_location_product', ['supermarket_id', 'subchain_id', 'product_id'], unique=True)
+
+    # Estimates are filled by ``manage.py refresh_demand_estimates``
+
+
+def downgrade():
+    with op.batch_alter_table('demand_estimate', schema=None) as batch_op:
+        batch_op.drop_index('ix_demand_estimate_location_product')
+
+    op.drop_table('demand_estimate')
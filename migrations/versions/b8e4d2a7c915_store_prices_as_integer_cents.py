@@ -0,0 +1,57 @@
+"""Store prices as integer cents
+
+Revision ID: b8e4d2a7c915
+Revises: a7c3e9d51f20
+Create Date: 2026-10-19 21:03:17.552904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e4d2a7c915'
+down_revision = 'a7c3e9d51f20'
+branch_labels = None
+depends_on = None
+
+
+PRICED_TABLES = ['product', 'delivery_item', 'return_item']
+
+
+def _priced(name):
+    """Lightweight table with both price columns, quoted by the dialect"""
+    return sa.table(
+        name,
+        sa.column('price', sa.Numeric(precision=10, scale=2)),
+        sa.column('price_cents', sa.Integer()),
+    )
+
+
+def upgrade():
+    for table in PRICED_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('price_cents', sa.Integer(), nullable=True))
+
+        # SQLite kept Numeric(10, 2) as REAL, so round instead of truncating 12.349999...
+        priced = _priced(table)
+        op.execute(sa.update(priced).values(
+            price_cents=sa.cast(sa.func.round(priced.c.price * 100), sa.Integer())
+        ))
+
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('price_cents', existing_type=sa.Integer(), nullable=False)
+            batch_op.drop_column('price')
+
+
+def downgrade():
+    for table in reversed(PRICED_TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('price', sa.Numeric(precision=10, scale=2), nullable=True))
+
+        priced = _priced(table)
+        op.execute(sa.update(priced).values(price=priced.c.price_cents / 100.0))
+
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('price', existing_type=sa.Numeric(precision=10, scale=2), nullable=False)
+            batch_op.drop_column('price_cents')
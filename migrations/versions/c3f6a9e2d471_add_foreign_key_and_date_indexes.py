@@ -0,0 +1,64 @@
+"""Add foreign key and date indexes
+
+Revision ID: c3f6a9e2d471
+Revises: b8e4d2a7c915
+Create Date: 2026-10-19 22:41:05.318266
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f6a9e2d471'
+down_revision = 'b8e4d2a7c915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('subchain', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_subchain_supermarket_id'), ['supermarket_id'], unique=False)
+
+    # delivery.supermarket_id and return.supermarket_id lead ix_*_match_key already
+    with op.batch_alter_table('delivery', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_delivery_delivery_date'), ['delivery_date'], unique=False)
+        batch_op.create_index(batch_op.f('ix_delivery_subchain_id'), ['subchain_id'], unique=False)
+
+    with op.batch_alter_table('delivery_item', schema=None) as batch_op:
+        batch_op.create_index('ix_delivery_item_delivery_product', ['delivery_id', 'product_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_delivery_item_product_id'), ['product_id'], unique=False)
+
+    with op.batch_alter_table('return', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_return_delivery_date'), ['delivery_date'], unique=False)
+        batch_op.create_index(batch_op.f('ix_return_return_date'), ['return_date'], unique=False)
+        batch_op.create_index(batch_op.f('ix_return_subchain_id'), ['subchain_id'], unique=False)
+
+    with op.batch_alter_table('return_item', schema=None) as batch_op:
+        batch_op.create_index('ix_return_item_return_product', ['return_id', 'product_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_return_item_product_id'), ['product_id'], unique=False)
+
+    # Give the planner statistics for the new indexes right away
+    op.execute('ANALYZE')
+
+
+def downgrade():
+    with op.batch_alter_table('return_item', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_return_item_product_id'))
+        batch_op.drop_index('ix_return_item_return_product')
+
+    with op.batch_alter_table('return', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_return_subchain_id'))
+        batch_op.drop_index(batch_op.f('ix_return_return_date'))
+        batch_op.drop_index(batch_op.f('ix_return_delivery_date'))
+
+    with op.batch_alter_table('delivery_item', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_delivery_item_product_id'))
+        batch_op.drop_index('ix_delivery_item_delivery_product')
+
+    with op.batch_alter_table('delivery', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_delivery_subchain_id'))
+        batch_op.drop_index(batch_op.f('ix_delivery_delivery_date'))
+
+    with op.batch_alter_table('subchain', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_subchain_supermarket_id'))
@@ -0,0 +1,35 @@
+"""Add search document full-text index
+
+Revision ID: d4e8a2f6c913
+Revises: c7a1f3e8b254
+Create Date: 2026-10-19 15:58:20.441902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e8a2f6c913'
+down_revision = 'c7a1f3e8b254'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite FTS5 table; fill it with `python manage.py rebuild_search_index`.
+    # Other databases have no FTS5, and search stays empty there.
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_document USING fts5("
+        "kind UNINDEXED, doc_id UNINDEXED, doc_date UNINDEXED, "
+        "title UNINDEXED, amount UNINDEXED, body, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TABLE IF EXISTS search_document")
@@ -0,0 +1,63 @@
+"""Add stock ledger table
+
+Revision ID: e5b17c4d9a60
+Revises: d4e8a2f6c913
+Create Date: 2026-10-19 16:32:07.583114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b17c4d9a60'
+down_revision = 'd4e8a2f6c913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stock_ledger',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('supermarket_id', sa.Integer(), nullable=False),
+    sa.Column('subchain_id', sa.Integer(), nullable=True),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('delivered', sa.Integer(), nullable=False),
+    sa.Column('returned', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+    sa.ForeignKeyConstraint(['subchain_id'], ['subchain.id'], ),
+    sa.ForeignKeyConstraint(['supermarket_id'], ['supermarket.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stock_ledger', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stock_ledger_subchain_id'), ['subchain_id'], unique=False)
+    # NULLs never collide in a unique index, so rows without a subchain are keyed by 0
+    op.create_index('ix_stock_ledger_location_product', 'stock_ledger',
+                    ['supermarket_id', sa.text('coalesce(subchain_id, 0)'), 'product_id'], unique=True)
+
+    # Seed the ledger from existing history
+    op.execute("""
+        INSERT INTO stock_ledger
+            (supermarket_id, subchain_id, product_id, delivered, returned, updated_at)
+        SELECT supermarket_id, subchain_id, product_id,
+               SUM(delivered), SUM(returned), CURRENT_TIMESTAMP
+        FROM (
+            SELECT d.supermarket_id, d.subchain_id, i.product_id,
+                   i.quantity AS delivered, 0 AS returned
+            FROM delivery_item i JOIN delivery d ON d.id = i.delivery_id
+            UNION ALL
+            SELECT r.supermarket_id, r.subchain_id, i.product_id,
+                   0 AS delivered, i.quantity AS returned
+            FROM return_item i JOIN "return" r ON r.id = i.return_id
+        )
+        GROUP BY supermarket_id, subchain_id, product_id
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_stock_ledger_location_product', table_name='stock_ledger')
+    with op.batch_alter_table('stock_ledger', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_stock_ledger_subchain_id'))
+
+    op.drop_table('stock_ledger')
@@ -0,0 +1,52 @@
+"""Add return match table and match key indexes
+
+Revision ID: f2a9c6e1b873
+Revises: e5b17c4d9a60
+Create Date: 2026-10-19 18:04:51.216437
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a9c6e1b873'
+down_revision = 'e5b17c4d9a60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('delivery', schema=None) as batch_op:
+        batch_op.create_index('ix_delivery_match_key', ['supermarket_id', 'delivery_date', 'subchain_id'], unique=False)
+
+    with op.batch_alter_table('return', schema=None) as batch_op:
+        batch_op.create_index('ix_return_match_key', ['supermarket_id', 'delivery_date', 'subchain_id'], unique=False)
+
+    op.create_table('return_match',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('return_item_id', sa.Integer(), nullable=False),
+    sa.Column('delivery_item_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['delivery_item_id'], ['delivery_item.id'], ),
+    sa.ForeignKeyConstraint(['return_item_id'], ['return_item.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('return_match', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_return_match_delivery_item_id'), ['delivery_item_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_return_match_return_item_id'), ['return_item_id'], unique=False)
+
+    # Existing returns are matched with ``manage.py match_returns``
+
+
+def downgrade():
+    with op.batch_alter_table('return_match', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_return_match_return_item_id'))
+        batch_op.drop_index(batch_op.f('ix_return_match_delivery_item_id'))
+
+    op.drop_table('return_match')
+    with op.batch_alter_table('return', schema=None) as batch_op:
+        batch_op.drop_index('ix_return_match_key')
+
+    with op.batch_alter_table('delivery', schema=None) as batch_op:
+        batch_op.drop_index('ix_delivery_match_key')
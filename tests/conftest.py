@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+# The app package builds a default app at import; keep it off the real files
+os.environ.setdefault('SESSION_BACKEND', 'cookie')
+os.environ.setdefault('TEMPLATE_CACHE_ENABLED', '0')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+from config import Config  # noqa: E402
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build an app on temporary files; keyword arguments override config"""
+    apps = []
+
+    def factory(**overrides):
+        settings = {
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+            'ARCHIVE_DIR': str(tmp_path / 'archive'),
+            'SNAPSHOT_DIR': str(tmp_path / 'snapshots'),
+            'SESSION_BACKEND': 'cookie',
+            'SESSION_SQLITE_PATH': str(tmp_path / 'sessions.db'),
+            'TEMPLATE_CACHE_ENABLED': False,
+            'MAIL_DISPATCH_ASYNC': False,
+            'ANALYTICS_ASYNC_REBUILD': False,
+            'WTF_CSRF_ENABLED': False,
+        }
+        settings.update(overrides)
+        app = create_app(type('TestConfig', (Config,), settings))
+        context = app.app_context()
+        context.push()
+        db.create_all()
+        apps.append(context)
+        return app
+
+    yield factory
+    for context in reversed(apps):
+        db.session.remove()
+        context.pop()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
@@ -0,0 +1,163 @@
+import time
+from datetime import date
+from threading import Event
+
+from sqlalchemy.orm import Session
+
+from app import analytics as analytics_module
+from app.analytics import ReturnAnalytics, aggregate
+from app.extensions import db
+from app.models import (
+    Delivery,
+    DeliveryItem,
+    Product,
+    Return,
+    ReturnItem,
+    Subchain,
+    Supermarket,
+    User,
+)
+
+
+def _seed():
+    supermarket = Supermarket(name='Nomin')
+    product = Product(name='Milk', price=1000, weight=1.0)
+    db.session.add_all([supermarket, product])
+    db.session.flush()
+    subchain = Subchain(name='Nomin 1', supermarket_id=supermarket.id)
+    db.session.add(subchain)
+    db.session.flush()
+    delivery = Delivery(
+        delivery_date=date(2026, 9, 3), supermarket_id=supermarket.id, subchain_id=subchain.id
+    )
+    delivery.items.append(DeliveryItem(product_id=product.id, quantity=10, price=product.price))
+    db.session.add(delivery)
+    db.session.commit()
+    return supermarket.id, subchain.id, product.id
+
+
+def _deliver(session, ids, quantity, day=date(2026, 9, 10)):
+    supermarket_id, subchain_id, product_id = ids
+    delivery = Delivery(delivery_date=day, supermarket_id=supermarket_id, subchain_id=subchain_id)
+    delivery.items.append(DeliveryItem(product_id=product_id, quantity=quantity, price=1000))
+    session.add(delivery)
+    session.commit()
+
+
+def _return(session, ids, quantity, delivered=date(2026, 9, 3), returned=date(2026, 9, 8)):
+    supermarket_id, subchain_id, product_id = ids
+    return_ = Return(delivery_date=delivered, return_date=returned,
+                     supermarket_id=supermarket_id, subchain_id=subchain_id)
+    return_.items.append(ReturnItem(product_id=product_id, quantity=quantity, price=1000))
+    session.add(return_)
+    session.commit()
+
+
+def _wait_until_fresh(analytics):
+    for _ in range(100):
+        if not analytics.stale:
+            break
+        time.sleep(0.05)
+
+
+def test_first_build_runs_in_background(make_app):
+    app = make_app(ANALYTICS_ASYNC_REBUILD=True)
+    _seed()
+    analytics = ReturnAnalytics(app)
+    started, release = Event(), Event()
+    build = analytics._build
+
+    def slow_build(connection):
+        started.set()
+        release.wait(10)
+        return build(connection)
+
+    analytics._build = slow_build
+    first = analytics.query()
+    assert first['matched'] == 0
+    assert first['stale']
+    assert started.wait(10)
+    # Requests keep getting answers while the build runs
+    assert analytics.query()['matched'] == 0
+
+    release.set()
+    _wait_until_fresh(analytics)
+    result = analytics.query()
+    assert result['matched'] == 1
+    assert not result['stale']
+
+
+def test_rates_lag_and_value_at_risk(app):
+    ids = _seed()
+    _return(db.session, ids, 3)
+    _return(db.session, ids, 1, returned=date(2026, 9, 13))
+    result = ReturnAnalytics(app).query()
+    assert result['matched'] == 1
+    row = result['rows'][0]
+    assert (row['delivered'], row['returned']) == (10, 4)
+    assert row['return_rate'] == 0.4
+    # (3 items * 5 days + 1 item * 10 days) / 4 items
+    assert row['avg_lag_days'] == 6.25
+    assert row['value_at_risk'] == 4000.0
+    assert row['delivered_value'] == 10000.0
+    assert result['totals']['value_at_risk'] == 4000.0
+
+
+def test_new_rows_are_folded_into_the_cached_frame(app, monkeypatch):
+    ids = _seed()
+    analytics = ReturnAnalytics(app)
+    analytics.query()
+
+    def no_build(connection):
+        raise AssertionError('full build')
+
+    monkeypatch.setattr(analytics, '_build', no_build)
+    _deliver(db.session, ids, 5)
+    _deliver(db.session, ids, 2, day=date(2026, 10, 1))
+    _return(db.session, ids, 3)
+
+    expected = aggregate(db.session.connection()).sort_index()
+    assert analytics.frame().sort_index().equals(expected)
+    row = analytics.query(month_to='2026-09')['rows'][0]
+    assert (row['delivered'], row['returned']) == (15, 3)
+
+
+def test_rows_written_during_a_build_are_counted_once(make_app, monkeypatch):
+    app = make_app(ANALYTICS_ASYNC_REBUILD=True)
+    ids = _seed()
+    analytics = ReturnAnalytics(app)
+    builds = []
+    full_aggregate = analytics_module.aggregate
+
+    def racing_aggregate(connection, *args, **kwargs):
+        if args:
+            return full_aggregate(connection, *args, **kwargs)
+        builds.append(1)
+        if len(builds) == 1:
+            # Committed after the build read its event id
+            with Session(db.engine) as other:
+                _deliver(other, ids, 5)
+        return full_aggregate(connection, *args, **kwargs)
+
+    monkeypatch.setattr(analytics_module, 'aggregate', racing_aggregate)
+    analytics.query()
+    _wait_until_fresh(analytics)
+
+    result = analytics.query()
+    assert result['totals']['delivered'] == 15
+    assert not result['stale']
+    assert builds == [1]
+
+
+def test_api_limit_below_one_is_clamped(app):
+    _seed()
+    user = User(username='dorj', email='dorj@example.mn')
+    user.set_password('correct horse')
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'dorj', 'password': 'correct horse'})
+
+    response = client.get('/report/return_rates/api?limit=-5')
+    assert response.status_code == 200
+    assert len(response.get_json()['rows']) == 1
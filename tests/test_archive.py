@@ -0,0 +1,254 @@
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app import archive
+from app.analytics import aggregate
+from app.archive import archive_cold_months, archived_months
+from app.demand import refresh_estimates
+from app.extensions import db
+from app.models import (
+    DemandEstimate,
+    Delivery,
+    DeliveryItem,
+    Product,
+    Return,
+    ReturnItem,
+    ReturnMatch,
+    Subchain,
+    Supermarket,
+)
+from app.return_matching import match_all, shortfalls
+from app.snapshots import load, write_snapshot
+from app.stock_ledger import verify_ledger
+
+
+def _seed(months):
+    supermarket = Supermarket(name='Nomin')
+    db.session.add(supermarket)
+    db.session.flush()
+    subchain = Subchain(name='Nomin 1', supermarket_id=supermarket.id)
+    products = [Product(name=f'Product {i}', price=1000 + i, weight=1.5) for i in range(3)]
+    db.session.add_all([subchain, *products])
+    db.session.flush()
+
+    for month in months:
+        for day in (3, 17):
+            delivered_on = date(month.year, month.month, day)
+            stamp = datetime.combine(delivered_on, datetime.min.time())
+            delivery = Delivery(
+                delivery_date=delivered_on, supermarket_id=supermarket.id,
+                subchain_id=subchain.id, created_at=stamp,
+            )
+            for product in products:
+                delivery.items.append(
+                    DeliveryItem(product_id=product.id, quantity=10, price=product.price)
+                )
+            returned = Return(
+                delivery_date=delivered_on, return_date=delivered_on,
+                supermarket_id=supermarket.id, subchain_id=subchain.id, created_at=stamp,
+            )
+            returned.items.append(
+                ReturnItem(product_id=products[0].id, quantity=2, price=products[0].price)
+            )
+            db.session.add_all([delivery, returned])
+    db.session.commit()
+
+
+def _snapshot_rows(directory):
+    return {
+        table: sorted(load(directory, table)['id'].tolist())
+        for table in ('delivery', 'delivery_item', 'return', 'return_item')
+    }
+
+
+def test_snapshot_keeps_archived_months(app):
+    months = [date(2025, number, 1) for number in range(1, 7)] + [date(2026, 9, 1)]
+    _seed(months)
+    snapshot_dir = app.config['SNAPSHOT_DIR']
+    archive_dir = app.config['ARCHIVE_DIR']
+
+    first = write_snapshot(db.session.connection(), snapshot_dir, archive_dir=archive_dir)
+    db.session.commit()
+    before = _snapshot_rows(snapshot_dir)
+    assert len(before['delivery']) == 14
+
+    results = archive_cold_months(db.engine, archive_dir, 3, today=date(2026, 10, 1))
+    assert [month for month, _ in results] == [f'2025-0{number}' for number in range(1, 7)]
+    assert archived_months(archive_dir) == [month for month, _ in results]
+    assert db.session.query(Delivery).count() < 14
+
+    second = write_snapshot(db.session.connection(), snapshot_dir, archive_dir=archive_dir)
+    db.session.commit()
+    assert second['removed'] == []
+    assert second['written'] == []
+    assert len(second['unchanged']) == len(first['written'])
+    assert _snapshot_rows(snapshot_dir) == before
+
+
+def test_snapshot_rewrites_archived_month_in_full(app):
+    _seed([date(2025, 1, 1), date(2026, 9, 1)])
+    snapshot_dir = app.config['SNAPSHOT_DIR']
+    archive_dir = app.config['ARCHIVE_DIR']
+    archive_cold_months(db.engine, archive_dir, 3, today=date(2026, 10, 1))
+
+    # A fresh snapshot after archiving holds the same rows as the database did
+    write_snapshot(db.session.connection(), snapshot_dir, archive_dir=archive_dir)
+    db.session.commit()
+    rows = _snapshot_rows(snapshot_dir)
+    assert len(rows['delivery']) == 4
+    assert len(rows['delivery_item']) == 12
+    assert len(rows['return']) == 4
+
+
+def _add_return(delivered_on, returned_on, product, quantity):
+    supermarket = Supermarket.query.first()
+    returned = Return(
+        delivery_date=delivered_on, return_date=returned_on,
+        supermarket_id=supermarket.id, subchain_id=supermarket.subchains[0].id,
+    )
+    returned.items.append(ReturnItem(product_id=product.id, quantity=quantity, price=product.price))
+    db.session.add(returned)
+
+
+def _matching_state():
+    matches = sorted(
+        (match.return_item_id, match.delivery_item_id, match.quantity)
+        for match in ReturnMatch.query
+    )
+    missing = sorted(
+        (row.return_id, row.product, row.returned, row.matched, row.status)
+        for row in shortfalls()
+    )
+    return matches, missing
+
+
+def _demand(today):
+    refresh_estimates(db.session.connection(), today, history_days=30)
+    return sorted(
+        (row.supermarket_id, row.subchain_id, row.product_id, row.quantity)
+        for row in DemandEstimate.query
+    )
+
+
+def test_archiving_keeps_matches_and_figures(app):
+    _seed([date(2025, 1, 1), date(2025, 2, 1), date(2026, 9, 1)])
+    products = Product.query.order_by(Product.id).all()
+    # Returned a month later, in a closed month: archived with its delivery
+    _add_return(date(2025, 1, 3), date(2025, 2, 20), products[1], 4)
+    # Returned recently: its whole delivery day stays hot
+    _add_return(date(2025, 2, 17), date(2026, 9, 20), products[2], 3)
+    # More than was delivered, so it shows up as a shortfall
+    _add_return(date(2025, 1, 17), date(2025, 1, 20), products[1], 50)
+    db.session.commit()
+
+    today = date(2026, 10, 1)
+    matching = _matching_state()
+    figures = aggregate(db.session.connection(), archive_dir=app.config['ARCHIVE_DIR'])
+    demand = _demand(today)
+    db.session.commit()
+
+    results = archive_cold_months(db.engine, app.config['ARCHIVE_DIR'], 3, today=today)
+    assert [month for month, _ in results] == ['2025-01', '2025-02']
+    db.session.expire_all()
+
+    # The recent return still draws on its (hot) delivery
+    kept = Delivery.query.filter_by(delivery_date=date(2025, 2, 17)).one()
+    kept_items = {item.id for item in kept.items}
+    assert any(match.delivery_item_id in kept_items for match in ReturnMatch.query)
+    # No allocation points at an archived item
+    assert all(
+        db.session.get(DeliveryItem, match.delivery_item_id)
+        and db.session.get(ReturnItem, match.return_item_id)
+        for match in ReturnMatch.query
+    )
+
+    hot_matching = _matching_state()
+    match_all(db.session.connection())
+    db.session.commit()
+    assert _matching_state() == hot_matching
+    assert set(hot_matching[0]) <= set(matching[0])
+    assert set(hot_matching[1]) <= set(matching[1])
+
+    archived_figures = aggregate(db.session.connection(), archive_dir=app.config['ARCHIVE_DIR'])
+    assert archived_figures.sort_index().equals(figures.sort_index())
+    assert _demand(today) == demand
+    db.session.commit()
+    assert verify_ledger(db.session.connection(), archive_dir=app.config['ARCHIVE_DIR']) == []
+
+
+def test_archiving_keeps_demand_window(app):
+    _seed([date(2026, 5, 1), date(2026, 9, 1)])
+    today = date(2026, 10, 1)
+    results = archive_cold_months(
+        db.engine, app.config['ARCHIVE_DIR'], 3, today=today, keep_days=180
+    )
+    assert results == []
+    assert Delivery.query.filter(Delivery.delivery_date < today - timedelta(days=90)).count() == 2
+
+
+def test_archiving_blocks_writes_until_rows_are_deleted(app, monkeypatch):
+    _seed([date(2025, 1, 1), date(2026, 9, 1)])
+    product = Product.query.first()
+    archived_delivery = Delivery.query.filter_by(delivery_date=date(2025, 1, 3)).one()
+    path = db.engine.url.database
+    delete_archived = archive.delete_archived
+    attempts = []
+
+    def write_between(connection, ids):
+        # Every month is written, the hot rows are not deleted yet
+        writer = sqlite3.connect(path, timeout=0.1)
+        try:
+            with pytest.raises(sqlite3.OperationalError, match='locked'):
+                writer.execute(
+                    'INSERT INTO delivery_item (delivery_id, product_id, quantity, price_cents) '
+                    'VALUES (?, ?, 1, 1000)', (archived_delivery.id, product.id),
+                )
+            with pytest.raises(sqlite3.OperationalError, match='locked'):
+                writer.execute(
+                    'INSERT INTO "return" (delivery_date, return_date, supermarket_id, version) '
+                    'VALUES (?, ?, ?, 1)',
+                    ('2025-01-03', '2026-09-25', archived_delivery.supermarket_id),
+                )
+            attempts.append(ids)
+        finally:
+            writer.close()
+        delete_archived(connection, ids)
+
+    monkeypatch.setattr(archive, 'delete_archived', write_between)
+    results = archive_cold_months(db.engine, app.config['ARCHIVE_DIR'], 3, today=date(2026, 10, 1))
+    assert attempts and [month for month, _ in results] == ['2025-01']
+    db.session.expire_all()
+
+    # Every row left the main database only through the archive
+    with db.engine.connect() as connection:
+        with archive.attached(connection, app.config['ARCHIVE_DIR'], ['2025-01']) as views:
+            archived_items = connection.execute(
+                select(views['delivery_item'].c.id)
+            ).scalars().all()
+    assert len(archived_items) + DeliveryItem.query.count() == 12
+
+
+def test_late_rows_extend_an_archived_month(app):
+    _seed([date(2025, 1, 1), date(2026, 9, 1)])
+    archive_dir = app.config['ARCHIVE_DIR']
+    archive_cold_months(db.engine, archive_dir, 3, today=date(2026, 10, 1))
+    product = Product.query.first()
+    supermarket = Supermarket.query.first()
+    late = Delivery(delivery_date=date(2025, 1, 9), supermarket_id=supermarket.id)
+    late.items.append(DeliveryItem(product_id=product.id, quantity=1, price=product.price))
+    # Keeps the late delivery from being the newest row
+    db.session.add_all([late, Delivery(delivery_date=date(2026, 9, 20), supermarket_id=supermarket.id)])
+    db.session.commit()
+
+    results = archive_cold_months(db.engine, archive_dir, 3, today=date(2026, 10, 1))
+    assert results == [('2025-01', {'delivery': 1, 'return': 0})]
+    with db.engine.connect() as connection:
+        with archive.attached(connection, archive_dir, ['2025-01']) as views:
+            counts = [
+                connection.execute(select(func.count()).select_from(views[name])).scalar()
+                for name in ('delivery', 'delivery_item', 'return', 'return_item')
+            ]
+    assert counts == [3, 7, 2, 2]
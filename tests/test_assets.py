@@ -0,0 +1,26 @@
+from app.assets import minify_css
+
+
+def test_minify_css_keeps_descendant_pseudo_class():
+    source = '.x :hover {\n  color : red;\n}\n'
+    assert minify_css(source) == '.x :hover{color :red}'
+
+
+def test_minify_css_collapses_declarations():
+    source = '/* nav */\n.nav > a:hover,\n.nav a.active {\n  color: #fff;\n  margin: 0 4px;\n}\n'
+    assert minify_css(source) == '.nav>a:hover,.nav a.active{color:#fff;margin:0 4px}'
+
+
+def test_minify_css_leaves_strings_alone():
+    source = '.a::before {\n  content: "a: b ; }" ;\n}\n.b { font-family: \'Open  Sans\', serif; }\n'
+    assert minify_css(source) == '.a::before{content:"a: b ; }"}.b{font-family:\'Open  Sans\',serif}'
+
+
+def test_minify_css_comment_markers_inside_strings():
+    source = '.a { content: "/* not a comment */"; } /* gone */ .b { content: \'\\\' /*\'; }'
+    assert minify_css(source) == '.a{content:"/* not a comment */"}.b{content:\'\\\' /*\'}'
+
+
+def test_minify_css_drops_comments_between_rules():
+    source = '.a { color: red; }\n/* spacing\n   rules */\n.b {\n  margin : 0 ;\n}\n'
+    assert minify_css(source) == '.a{color:red}.b{margin :0}'
@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import delete
+from werkzeug.security import generate_password_hash
+
+from app.extensions import db, user_cache
+from app.models import User, load_user
+from app.user_cache import UserCache
+from app.utils import passwords
+from app.utils.passwords import hash_password, needs_rehash, verify_password
+from app.utils.rate_limit import rate_limit
+
+
+def _add_user():
+    user = User(username='dorj', email='dorj@example.mn')
+    user.set_password('correct horse')
+    db.session.add(user)
+    db.session.commit()
+
+
+def test_login_page_views_are_not_rate_limited(app):
+    client = app.test_client()
+    for _ in range(15):
+        assert client.get('/auth/login').status_code == 200
+
+
+def test_failed_logins_are_rate_limited(app):
+    _add_user()
+    client = app.test_client()
+    for _ in range(10):
+        response = client.post('/auth/login', data={'username': 'dorj', 'password': 'wrong'},
+                               follow_redirects=True)
+        assert response.status_code == 200
+
+    response = client.post('/auth/login', data={'username': 'dorj', 'password': 'wrong'})
+    assert response.status_code == 429
+    # The form itself can still be shown
+    assert client.get('/auth/login').status_code == 200
+
+
+def test_errors_in_the_view_are_not_retried(app):
+    calls = []
+
+    @rate_limit('flaky', limit=5, period=60)
+    def flaky():
+        calls.append(1)
+        raise RuntimeError('view failed')
+
+    with app.test_request_context(method='POST'):
+        with pytest.raises(RuntimeError):
+            flaky()
+    assert len(calls) == 1
+
+
+def test_only_weaker_hashes_are_replaced(make_app):
+    app = make_app(PASSWORD_HASH_METHOD='pbkdf2:sha256:600000', PASSWORD_HASH_WORKERS=0)
+    assert not needs_rehash(generate_password_hash('pw', 'scrypt'))
+    assert not needs_rehash(generate_password_hash('pw', 'pbkdf2:sha256:600000'))
+    assert needs_rehash(generate_password_hash('pw', 'pbkdf2:sha256:1000'))
+
+    app.config['PASSWORD_HASH_METHOD'] = 'scrypt'
+    assert needs_rehash(generate_password_hash('pw', 'pbkdf2:sha256:600000'))
+    assert needs_rehash(generate_password_hash('pw', 'scrypt:16384:8:1'))
+    assert not needs_rehash(generate_password_hash('pw', 'scrypt'))
+
+
+def test_pool_workers_are_spawned(make_app):
+    make_app(PASSWORD_HASH_WORKERS=1)
+    try:
+        password_hash = hash_password('correct horse')
+        assert verify_password(password_hash, 'correct horse')
+        executor, _ = passwords._get_executor(1, 16)
+        assert executor._mp_context.get_start_method() == 'spawn'
+    finally:
+        passwords._reset_executor()
+
+
+def test_users_deleted_by_another_process_are_not_loaded(make_app):
+    make_app(USER_CACHE_CHECK_INTERVAL=0)
+    user_cache.clear()
+    _add_user()
+    assert load_user('1').username == 'dorj'
+
+    # A Core statement skips the mapper events, like a change made by another worker
+    db.session.execute(delete(User))
+    db.session.commit()
+    assert load_user('1') is None
+
+
+def test_cached_users_are_checked_against_their_version():
+    rows = {1: SimpleNamespace(id=1, username='dorj', email='dorj@example.mn', version=1)}
+    loads, checks = [], []
+
+    def loader(user_id):
+        loads.append(user_id)
+        return rows.get(user_id)
+
+    def version_loader(user_id):
+        checks.append(user_id)
+        return rows[user_id].version if user_id in rows else None
+
+    cache = UserCache(ttl=60, check_interval=60)
+    assert cache.get(1, loader, version_loader).username == 'dorj'
+    rows[1] = SimpleNamespace(id=1, username='bold', email='bold@example.mn', version=2)
+    assert cache.get(1, loader, version_loader).username == 'dorj'
+    assert (loads, checks) == ([1], [])
+
+    cache.check_interval = 0
+    assert cache.get(1, loader, version_loader).username == 'bold'
+    assert cache.get(1, loader, version_loader).username == 'bold'
+    assert (loads, checks) == ([1, 1], [1, 1])
+
+    del rows[1]
+    assert cache.get(1, loader, version_loader) is None
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app.change_tracking import changes_since
+from app.extensions import db
+from app.models import Supermarket
+
+
+def _supermarket(name, seconds_ago):
+    supermarket = Supermarket(name=name)
+    db.session.add(supermarket)
+    db.session.commit()
+    # Core update, so the flush listener does not stamp it again
+    db.session.execute(
+        update(Supermarket).where(Supermarket.id == supermarket.id)
+        .values(updated_at=datetime.utcnow() - timedelta(seconds=seconds_ago))
+    )
+    db.session.commit()
+    return supermarket
+
+
+def test_recent_changes_wait_for_earlier_commits(app):
+    old = _supermarket('Nomin', 120)
+    _supermarket('Emart', 5)
+
+    rows, cursor = changes_since(Supermarket, lag=30)
+    assert rows == [old]
+
+    # Committed late, stamped before the row held back above
+    late = _supermarket('Sansar', 10)
+    rows, cursor = changes_since(Supermarket, cursor, lag=0)
+    assert [row.name for row in rows] == ['Sansar', 'Emart']
+    assert late in rows
+    assert changes_since(Supermarket, cursor, lag=0) == ([], cursor)
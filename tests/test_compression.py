@@ -0,0 +1,42 @@
+import gzip
+
+from app.extensions import db
+from app.models import User
+
+
+def _login(app):
+    user = User(username='dorj', email='dorj@example.mn')
+    user.set_password('correct horse')
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'dorj', 'password': 'correct horse'})
+    return client
+
+
+def test_pages_are_compressed(make_app):
+    client = _login(make_app(COMPRESS_MIN_SIZE=0))
+    response = client.get('/delivery/', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert b'Deliveries' in gzip.decompress(response.get_data())
+
+
+def test_token_pages_with_request_input_are_not_compressed(make_app):
+    client = _login(make_app(COMPRESS_MIN_SIZE=0))
+    response = client.get('/delivery/?q=csrf_token', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert b'Deliveries' in response.get_data()
+
+
+def test_input_without_a_token_is_compressed(make_app):
+    client = _login(make_app(COMPRESS_MIN_SIZE=0))
+    response = client.get('/report/return_rates/api?limit=5', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()).startswith(b'{')
+
+
+def test_small_bodies_are_sent_as_is(app):
+    client = _login(app)
+    response = client.get('/report/return_rates/api', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
@@ -0,0 +1,73 @@
+import sqlite3
+from datetime import datetime
+
+from app.db_maintenance import database_paths, maintain_database, maintain_databases
+from app.scheduling import read_state, run_if_due
+
+
+def _fragmented_file(path, auto_vacuum='INCREMENTAL'):
+    """A database file with free pages left by a bulk delete"""
+    conn = sqlite3.connect(path)
+    conn.execute(f'PRAGMA auto_vacuum={auto_vacuum}')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE row (id INTEGER PRIMARY KEY, body TEXT)')
+    conn.execute('CREATE INDEX ix_row_body ON row (body)')
+    conn.executemany('INSERT INTO row (body) VALUES (?)', [('x' * 200,)] * 2000)
+    conn.commit()
+    conn.execute('DELETE FROM row WHERE id > 200')
+    conn.commit()
+    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    conn.close()
+    return free
+
+
+def test_maintenance_releases_free_pages(app, tmp_path):
+    path = str(tmp_path / 'data.db')
+    assert _fragmented_file(path) > 0
+    report = maintain_database(path, app.config)
+
+    steps = {name: result for name, _, result in report['steps']}
+    assert list(steps) == ['quick_check', 'optimize', 'incremental_vacuum', 'wal_checkpoint']
+    assert steps['quick_check'] == 'ok'
+    assert steps['incremental_vacuum'].endswith(', 0 left')
+    assert steps['wal_checkpoint'] == 'truncated'
+    assert report['after'][0] < report['before'][0]
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT count(*) FROM sqlite_stat1").fetchone()[0] > 0
+
+
+def test_full_vacuum_switches_to_incremental(app, tmp_path):
+    path = str(tmp_path / 'data.db')
+    _fragmented_file(path, auto_vacuum='NONE')
+    report = maintain_database(path, app.config, full_vacuum=True)
+    assert ('vacuum', 'auto_vacuum=incremental') in [(name, result) for name, _, result in report['steps']]
+    with sqlite3.connect(path) as conn:
+        assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+
+def test_spent_budget_skips_the_remaining_steps(make_app, tmp_path):
+    app = make_app(MAINTENANCE_TIME_BUDGET=0)
+    path = str(tmp_path / 'data.db')
+    _fragmented_file(path)
+    report = maintain_database(path, app.config)
+    assert {result for _, _, result in report['steps']} == {'skipped, time budget spent'}
+
+
+def test_scheduler_maintains_every_file_once_a_day(make_app, tmp_path):
+    extra = str(tmp_path / 'extra.db')
+    _fragmented_file(extra)
+    state_file = str(tmp_path / 'maintenance')
+    app = make_app(MAINTENANCE_EXTRA_DATABASES=[extra], MAINTENANCE_STATE_FILE=state_file)
+    with app.app_context():
+        assert extra in database_paths(app)
+
+    reports = []
+
+    def job(today):
+        reports.extend(maintain_databases(app))
+
+    now = datetime(2026, 9, 30, 3, 30)
+    assert run_if_due(app, state_file, 3, job, 'Database maintenance', now)
+    assert not run_if_due(app, state_file, 3, job, 'Database maintenance', now)
+    assert extra in [report['path'] for report in reports]
+    assert read_state(state_file) == '2026-09-30'
@@ -0,0 +1,80 @@
+from datetime import date, datetime, timedelta
+
+from app.demand import refresh_estimates, suggestions
+from app.extensions import db
+from app.models import Delivery, DeliveryItem, Product, Return, ReturnItem, Supermarket
+from app.scheduling import read_state, run_if_due
+
+FIRST_VISIT = date(2026, 9, 1)
+
+
+def _seed():
+    supermarket = Supermarket(name='Nomin')
+    milk = Product(name='Milk', price=10, weight=1.0)
+    bread = Product(name='Bread', price=5, weight=0.5)
+    db.session.add_all([supermarket, milk, bread])
+    db.session.flush()
+    for visit, quantity in enumerate((10, 20, 30)):
+        day = FIRST_VISIT + timedelta(days=visit * 7)
+        delivery = Delivery(delivery_date=day, supermarket_id=supermarket.id)
+        delivery.items.append(DeliveryItem(product_id=milk.id, quantity=quantity, price=10))
+        if visit == 0:
+            delivery.items.append(DeliveryItem(product_id=bread.id, quantity=2, price=5))
+        db.session.add(delivery)
+    return_ = Return(delivery_date=FIRST_VISIT + timedelta(days=14), return_date=date(2026, 9, 20),
+                     supermarket_id=supermarket.id)
+    return_.items.append(ReturnItem(product_id=milk.id, quantity=5, price=10))
+    db.session.add(return_)
+    db.session.commit()
+    return supermarket
+
+
+def test_estimates_weight_recent_visits_most(app):
+    supermarket = _seed()
+    count = refresh_estimates(db.session.connection(), date(2026, 9, 30), alpha=0.5)
+    db.session.commit()
+    assert count == 1
+
+    # Net 10, 20 and 25 units, weighted 0.125, 0.25 and 0.5
+    (row,) = suggestions(supermarket.id)
+    assert row['name'] == 'Milk'
+    assert row['quantity'] == 21
+    # Bread: 2 units at the oldest of three visits rounds down to nothing
+    assert all(row['name'] != 'Bread' for row in suggestions(supermarket.id))
+
+
+def test_scheduler_refreshes_once_a_day(make_app, tmp_path):
+    state_file = str(tmp_path / 'state' / 'demand')
+    app = make_app(DEMAND_STATE_FILE=state_file, DEMAND_REFRESH_HOUR=2)
+    _seed()
+    runs = []
+
+    def job(today):
+        runs.append(today)
+        refresh_estimates(db.session.connection(), today, 0.5, 180)
+        db.session.commit()
+
+    day = datetime(2026, 9, 30)
+    assert not run_if_due(app, state_file, 2, job, 'Demand refresh', day.replace(hour=1))
+    assert run_if_due(app, state_file, 2, job, 'Demand refresh', day.replace(hour=2))
+    assert not run_if_due(app, state_file, 2, job, 'Demand refresh', day.replace(hour=9))
+    assert run_if_due(app, state_file, 2, job, 'Demand refresh', day + timedelta(days=1, hours=3))
+    assert runs == [date(2026, 9, 30), date(2026, 10, 1)]
+    assert read_state(state_file) == '2026-10-01'
+
+
+def test_failed_refresh_is_retried(make_app, tmp_path):
+    state_file = str(tmp_path / 'demand')
+    app = make_app()
+    calls = []
+
+    def job(today):
+        calls.append(today)
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+
+    now = datetime(2026, 9, 30, 4)
+    assert not run_if_due(app, state_file, 2, job, 'Demand refresh', now)
+    assert read_state(state_file) is None
+    assert run_if_due(app, state_file, 2, job, 'Demand refresh', now)
+    assert len(calls) == 2
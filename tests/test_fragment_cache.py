@@ -0,0 +1,79 @@
+from datetime import date
+
+from sqlalchemy import event
+
+from app.extensions import db
+from app.fragment_cache import CatalogGeneration, FragmentCache
+from app.models import Delivery, Product, Supermarket
+
+
+def _render(app, cache, product, version):
+    # A fresh app context per request, as in a real request, so g starts empty
+    with app.app_context(), app.test_request_context():
+        return str(cache.render('delivery', 1, version, caller=lambda: product.name))
+
+
+def test_rename_in_another_worker_reaches_cached_rows(app):
+    product = Product(name='Milk', price=1000, weight=1.0)
+    db.session.add(product)
+    db.session.commit()
+    worker, other_worker = FragmentCache(), FragmentCache()
+
+    # The delivery row itself does not change, only the product it shows
+    assert _render(app, worker, product, 'v1') == 'Milk'
+    assert _render(app, worker, product, 'v1') == 'Milk'
+    assert worker.hits == 1
+
+    product.name = 'Oat milk'
+    db.session.commit()
+    assert _render(app, other_worker, product, 'v1') == 'Oat milk'
+    assert _render(app, worker, product, 'v1') == 'Oat milk'
+
+
+def test_generation_is_read_once_per_request(app):
+    reads = []
+    cache = FragmentCache(generation=lambda: reads.append(1) or len(reads))
+    with app.app_context(), app.test_request_context():
+        for obj_id in range(3):
+            cache.render('delivery', obj_id, 'v1', caller=lambda: 'row')
+    assert len(reads) == 1
+    assert len(cache) == 3
+
+
+def test_unrelated_changes_keep_cached_fragments(app):
+    supermarket = Supermarket(name='Nomin')
+    product = Product(name='Milk', price=1000, weight=1.0)
+    db.session.add_all([supermarket, product])
+    db.session.commit()
+    cache = FragmentCache()
+    _render(app, cache, product, 'v1')
+
+    db.session.add(Delivery(delivery_date=date(2026, 10, 1), supermarket_id=supermarket.id))
+    db.session.commit()
+    assert _render(app, cache, product, 'v1') == 'Milk'
+    assert cache.hits == 1
+
+    supermarket.name = 'Nomin Khan-Uul'
+    db.session.commit()
+    _render(app, cache, product, 'v1')
+    assert cache.hits == 1
+
+
+def test_unchanged_generation_costs_one_primary_key_lookup(app):
+    db.session.add(Product(name='Milk', price=1000, weight=1.0))
+    db.session.commit()
+    generation = CatalogGeneration()
+    first = generation()
+
+    statements = []
+
+    def listener(connection, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        assert generation() == first
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert len(statements) == 1
+    assert 'WHERE' not in statements[0]
@@ -0,0 +1,58 @@
+from decimal import Decimal
+
+from app.extensions import db
+from app.line_items import validate_delivery_payload, validate_items
+from app.models import Product, Supermarket
+
+
+def _product():
+    product = Product(name='Milk', price=1000, weight=1.0)
+    db.session.add(product)
+    db.session.commit()
+    return product
+
+
+def test_valid_lines(app):
+    product = _product()
+    rows, errors = validate_items(
+        [{'product_id': product.id, 'quantity': 3, 'price': '12.5'},
+         {'product_id': str(product.id), 'quantity': 2.0, 'price': 7}],
+        10,
+    )
+    assert errors == {}
+    assert rows == [(product.id, 3, Decimal('12.50')), (product.id, 2, Decimal('7.00'))]
+
+
+def test_prices_that_are_not_numbers_are_refused(app):
+    product = _product()
+    items = [
+        {'product_id': product.id, 'quantity': 1, 'price': price}
+        for price in ('NaN', 'sNaN', float('nan'), 'Infinity', '-inf', '1e999999', 'abc', None, '0')
+    ]
+    rows, errors = validate_items(items, 20)
+    assert sorted(errors) == list(range(len(items)))
+    assert all(set(line_errors) == {'price'} for line_errors in errors.values())
+
+
+def test_quantities_must_be_whole_numbers(app):
+    product = _product()
+    items = [
+        {'product_id': product.id, 'quantity': quantity, 'price': 10}
+        for quantity in (2.5, '2.5', float('inf'), True, 0, 2 ** 63)
+    ]
+    _, errors = validate_items(items, 20)
+    assert sorted(errors) == list(range(len(items)))
+    assert all(set(line_errors) == {'quantity'} for line_errors in errors.values())
+
+
+def test_ids_out_of_range_are_unknown(app):
+    db.session.add(Supermarket(name='Nomin'))
+    db.session.commit()
+    _, errors = validate_delivery_payload({
+        'delivery_date': '2026-10-01',
+        'supermarket_id': 2 ** 64,
+        'subchain_id': 2 ** 70,
+        'items': [{'product_id': 2 ** 63, 'quantity': 1, 'price': 10}],
+    }, 10)
+    assert errors['supermarket_id'] == 'Select a supermarket'
+    assert errors['items'] == {0: {'product_id': 'Select a product'}}
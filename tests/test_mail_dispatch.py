@@ -0,0 +1,53 @@
+import time
+
+from flask_mail import Message
+
+from app.extensions import db
+from app.mail_dispatch import MailDispatcher
+from app.models import QueuedEmail
+
+
+def _wait_for_sent(count):
+    for _ in range(100):
+        db.session.expire_all()
+        if QueuedEmail.query.filter_by(status='sent').count() == count:
+            break
+        time.sleep(0.05)
+    return QueuedEmail.query.filter_by(status='sent').count()
+
+
+def test_creating_the_app_starts_no_workers(make_app):
+    app = make_app(MAIL_DISPATCH_ASYNC=True)
+    dispatcher = MailDispatcher(app)
+    assert dispatcher._threads == []
+
+
+def test_workers_send_without_a_request(make_app):
+    app = make_app(MAIL_POLL_INTERVAL=0.1, MAIL_DEFAULT_SENDER='shop@example.com')
+    dispatcher = MailDispatcher(app)
+    # Left in the queue by the previous run of the app
+    db.session.add(QueuedEmail(subject='Queued before start', recipients='["a@example.com"]', body='Hi'))
+    db.session.commit()
+
+    dispatcher.start(app)
+    try:
+        dispatcher.enqueue(Message('Statement', recipients=['b@example.com'], body='Hi'))
+        assert _wait_for_sent(2) == 2
+    finally:
+        dispatcher.stop(5)
+
+
+def test_workers_survive_a_missing_table(make_app):
+    app = make_app(MAIL_POLL_INTERVAL=0.1, MAIL_DEFAULT_SENDER='shop@example.com')
+    dispatcher = MailDispatcher(app)
+    QueuedEmail.__table__.drop(db.engine)
+
+    dispatcher.start(app)
+    try:
+        time.sleep(0.3)
+        # The table appears once the migrations ran
+        QueuedEmail.__table__.create(db.engine)
+        dispatcher.enqueue(Message('Statement', recipients=['b@example.com'], body='Hi'))
+        assert _wait_for_sent(1) == 1
+    finally:
+        dispatcher.stop(5)
@@ -0,0 +1,28 @@
+import pytest
+
+from app.extensions import db
+from app.models import User
+
+
+def _login(app):
+    user = User(username='dorj', email='dorj@example.mn')
+    user.set_password('correct horse')
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'dorj', 'password': 'correct horse'})
+    return client
+
+
+def test_requested_capacity_is_used(app):
+    client = _login(app)
+    response = client.get('/delivery/manifest?date=2026-10-01&capacity=2000')
+    assert b'of 2000.0 kg' in response.get_data()
+
+
+@pytest.mark.parametrize('capacity', ['nan', 'NaN', 'inf', '-inf', '1e309', '40001', '0', '-5', 'abc'])
+def test_unusable_capacity_falls_back_to_the_truck_default(app, capacity):
+    client = _login(app)
+    response = client.get(f'/delivery/manifest?date=2026-10-01&capacity={capacity}')
+    assert response.status_code == 200
+    assert b'of 1500.0 kg' in response.get_data()
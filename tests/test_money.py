@@ -0,0 +1,36 @@
+from decimal import Decimal
+
+from app.money import Money, to_cents
+
+
+def test_prices_round_half_up_to_cents():
+    assert to_cents('12.345') == 1235
+    assert to_cents(0.1) == 10
+    assert to_cents(Decimal('7')) == 700
+    assert to_cents(3) == 300
+    assert to_cents(Money(42)) == 42
+
+
+def test_compares_with_numbers():
+    assert Money(1250) == Decimal('12.50')
+    assert Money(1200) == 12
+    assert Money(1234) == 12.34
+    assert Money(1234) != 12.345
+    assert Money(1234) < 12.35
+    assert Money(1234) > 12.0
+    assert Money(1234) <= Money(1234)
+    assert Money(0) != 'abc'
+
+
+def test_hash_matches_equal_numbers():
+    assert {Money(1250): 'x'}[Decimal('12.5')] == 'x'
+    assert hash(Money(1250)) == hash(12.5)
+    assert hash(Money(1200)) == hash(12)
+
+
+def test_arithmetic_and_formatting():
+    total = sum([Money(150), Money(275)])
+    assert total == Money(425)
+    assert str(total) == '4.25'
+    assert f'{total * 3:.2f}' == '12.75'
+    assert '%.2f' % float(-total) == '-4.25'
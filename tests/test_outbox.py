@@ -0,0 +1,35 @@
+from app.extensions import db
+from app.models import Product, User
+
+
+def _login(app):
+    user = User(username='dorj', email='dorj@example.mn')
+    user.set_password('correct horse')
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'dorj', 'password': 'correct horse'})
+    return client
+
+
+def test_events_follow_the_cursor(app):
+    client = _login(app)
+    db.session.add_all([Product(name=f'Product {n}', price=10, weight=1.0) for n in range(3)])
+    db.session.commit()
+
+    first = client.get('/outbox/events?limit=2&wait=0').get_json()
+    assert [event['action'] for event in first['events']] == ['created', 'created']
+    rest = client.get(f"/outbox/events?after={first['next_cursor']}&wait=0").get_json()
+    assert len(rest['events']) == 1
+    assert rest['next_cursor'] > first['next_cursor']
+
+
+def test_limit_below_one_is_clamped(app):
+    client = _login(app)
+    db.session.add_all([Product(name=f'Product {n}', price=10, weight=1.0) for n in range(3)])
+    db.session.commit()
+
+    # LIMIT -1 means no limit to SQLite
+    for limit in (-1, 0):
+        found = client.get(f'/outbox/events?limit={limit}&wait=0').get_json()['events']
+        assert len(found) == 1
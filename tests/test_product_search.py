@@ -0,0 +1,66 @@
+from datetime import datetime
+
+from app import product_search
+from app.extensions import db
+from app.models import Product
+from app.product_search import ProductIndex
+
+
+def _products(*names):
+    db.session.add_all(Product(name=name, price=10, weight=1.0) for name in names)
+    db.session.commit()
+
+
+def _names(index, query):
+    return [row['name'] for row in index.search(query)]
+
+
+def test_prefixes_accents_and_typos(app):
+    _products('Café latte', 'Cabbage', 'Oat milk', 'Milk chocolate', 'Butter')
+    index = ProductIndex(app)
+    # Names starting with the query come first
+    assert _names(index, 'mil') == ['Milk chocolate', 'Oat milk']
+    assert _names(index, 'cafe') == ['Café latte']
+    assert _names(index, 'milk choc') == ['Milk chocolate']
+    assert _names(index, 'buttr') == ['Butter']
+    assert _names(index, 'xyz') == []
+
+
+def test_changes_are_checked_at_most_every_interval(make_app, monkeypatch):
+    app = make_app(PRODUCT_SEARCH_CHECK_INTERVAL=60)
+    _products('Milk')
+    index = ProductIndex(app)
+    clock = [1000.0]
+    monkeypatch.setattr(product_search.time, 'monotonic', lambda: clock[0])
+    checks = []
+    signature = index._current_signature
+    monkeypatch.setattr(index, '_current_signature', lambda: checks.append(1) or signature())
+
+    for _ in range(5):
+        assert _names(index, 'mi') == ['Milk']
+    assert len(checks) == 1
+
+    # Written by another process, so no mapper event reaches this one
+    db.session.execute(Product.__table__.insert().values(
+        name='Mint tea', price_cents=500, weight=0.1, version=1, updated_at=datetime.utcnow(),
+    ))
+    db.session.commit()
+    assert _names(index, 'mi') == ['Milk']
+
+    clock[0] += 61
+    assert _names(index, 'mi') == ['Milk', 'Mint tea']
+    assert len(checks) == 2
+
+
+def test_local_edits_show_up_on_the_next_search(make_app):
+    app = make_app(PRODUCT_SEARCH_CHECK_INTERVAL=60)
+    _products('Milk')
+    index = product_search.product_index
+    index.init_app(app)
+    index.expire()
+    assert _names(index, 'mi') == ['Milk']
+
+    product = Product.query.one()
+    product.name = 'Mineral water'
+    db.session.commit()
+    assert _names(index, 'mi') == ['Mineral water']
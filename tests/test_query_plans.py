@@ -0,0 +1,75 @@
+from datetime import date, timedelta
+
+from app.extensions import db
+from app.models import (
+    Delivery,
+    DeliveryItem,
+    Product,
+    Return,
+    ReturnItem,
+    Subchain,
+    Supermarket,
+)
+from app.query_plans import check_plans
+
+
+def _seed_history(days=120):
+    """A few months of deliveries and returns, inserted in bulk"""
+    connection = db.session.connection()
+    connection.execute(Supermarket.__table__.insert(), [
+        {'id': number, 'name': f'Supermarket {number}', 'version': 1} for number in range(1, 6)
+    ])
+    connection.execute(Subchain.__table__.insert(), [
+        {'id': number, 'name': f'Branch {number}', 'supermarket_id': number % 5 + 1, 'version': 1}
+        for number in range(1, 21)
+    ])
+    connection.execute(Product.__table__.insert(), [
+        {'id': number, 'name': f'Product {number}', 'price_cents': 1000 + number, 'weight': 1.0,
+         'version': 1}
+        for number in range(1, 51)
+    ])
+
+    first = date(2024, 1, 1)
+    headers, items = [], []
+    for number in range(1, days * 10 + 1):
+        headers.append({
+            'id': number, 'delivery_date': first + timedelta(days=number % days),
+            'supermarket_id': number % 5 + 1, 'subchain_id': number % 20 + 1, 'version': 1,
+        })
+        items += [
+            {'delivery_id': number, 'product_id': (number + line) % 50 + 1, 'quantity': 10,
+             'price_cents': 1000}
+            for line in range(5)
+        ]
+    connection.execute(Delivery.__table__.insert(), headers)
+    connection.execute(DeliveryItem.__table__.insert(), items)
+    connection.execute(Return.__table__.insert(), [
+        dict(header, return_date=header['delivery_date'] + timedelta(days=3))
+        for header in headers[::4]
+    ])
+    connection.execute(ReturnItem.__table__.insert(), [
+        {'return_id': item['delivery_id'], 'product_id': item['product_id'], 'quantity': 1,
+         'price_cents': 1000}
+        for item in items[::20]
+    ])
+    # The statistics `flask db upgrade` leaves behind
+    connection.exec_driver_sql('ANALYZE')
+    db.session.commit()
+
+
+def _failures(connection):
+    return {name: problems for name, _, problems in check_plans(connection) if problems}
+
+
+def test_hot_queries_use_indexes(app):
+    _seed_history()
+    assert _failures(db.session.connection()) == {}
+
+
+def test_missing_index_is_reported(app):
+    _seed_history()
+    connection = db.session.connection()
+    connection.exec_driver_sql('DROP INDEX ix_delivery_item_delivery_product')
+    connection.exec_driver_sql('ANALYZE')
+    failures = _failures(connection)
+    assert failures['delivery items of a delivery'] == ['SCAN delivery_item']
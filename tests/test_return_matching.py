@@ -0,0 +1,145 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import event, select
+
+from app.extensions import db
+from app.models import (
+    Delivery,
+    DeliveryItem,
+    Product,
+    Return,
+    ReturnItem,
+    ReturnMatch,
+    Supermarket,
+)
+from app.return_matching import match_all
+
+DELIVERED = date(2026, 9, 1)
+
+
+@pytest.fixture
+def enforced_foreign_keys(app):
+    """SQLite only checks foreign keys when asked to, per connection"""
+    def enable(dbapi_connection, record):
+        dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
+    db.session.remove()
+    db.engine.dispose()
+    event.listen(db.engine, 'connect', enable)
+    yield
+    event.remove(db.engine, 'connect', enable)
+    db.session.remove()
+    db.engine.dispose()
+
+
+def _seed():
+    supermarket = Supermarket(name='Nomin')
+    product = Product(name='Milk', price=10, weight=1.0)
+    db.session.add_all([supermarket, product])
+    db.session.commit()
+    return supermarket, product
+
+
+def _deliver(supermarket, product, quantity, day=DELIVERED):
+    delivery = Delivery(delivery_date=day, supermarket_id=supermarket.id)
+    delivery.items.append(DeliveryItem(product_id=product.id, quantity=quantity, price=10))
+    db.session.add(delivery)
+    db.session.commit()
+    return delivery
+
+
+def _return(supermarket, product, quantity, day=DELIVERED):
+    return_ = Return(delivery_date=day, return_date=date(2026, 9, 5), supermarket_id=supermarket.id)
+    return_.items.append(ReturnItem(product_id=product.id, quantity=quantity, price=10))
+    db.session.add(return_)
+    db.session.commit()
+    return return_
+
+
+def _allocations():
+    return sorted(db.session.execute(
+        select(ReturnMatch.return_item_id, ReturnMatch.delivery_item_id, ReturnMatch.quantity)
+    ).all())
+
+
+def _matches_full_rematch():
+    incremental = _allocations()
+    match_all(db.session.connection())
+    return incremental == _allocations()
+
+
+def test_new_returns_take_the_oldest_delivery_first(app):
+    supermarket, product = _seed()
+    first = _deliver(supermarket, product, 4)
+    second = _deliver(supermarket, product, 10)
+    return_ = _return(supermarket, product, 6)
+    assert _allocations() == [
+        (return_.items[0].id, first.items[0].id, 4),
+        (return_.items[0].id, second.items[0].id, 2),
+    ]
+
+
+def test_deleting_a_return_frees_quantity_for_short_returns(app, enforced_foreign_keys):
+    supermarket, product = _seed()
+    delivery = _deliver(supermarket, product, 10)
+    first = _return(supermarket, product, 8)
+    second = _return(supermarket, product, 5)
+    assert _allocations()[-1] == (second.items[0].id, delivery.items[0].id, 2)
+
+    db.session.delete(first)
+    db.session.commit()
+    assert _allocations() == [(second.items[0].id, delivery.items[0].id, 5)]
+    assert _matches_full_rematch()
+
+
+def test_removing_a_return_item_from_its_return(app, enforced_foreign_keys):
+    supermarket, product = _seed()
+    _deliver(supermarket, product, 10)
+    first = _return(supermarket, product, 8)
+    _return(supermarket, product, 5)
+
+    first.items.remove(first.items[0])
+    db.session.commit()
+    assert _matches_full_rematch()
+
+
+def test_deleting_a_delivery_drops_its_matches(app, enforced_foreign_keys):
+    supermarket, product = _seed()
+    delivery = _deliver(supermarket, product, 10)
+    other = _deliver(supermarket, product, 3)
+    return_ = _return(supermarket, product, 12)
+
+    db.session.delete(delivery)
+    db.session.commit()
+    assert _allocations() == [(return_.items[0].id, other.items[0].id, 3)]
+    assert _matches_full_rematch()
+
+
+def test_moving_a_return_to_another_delivery_date(app, enforced_foreign_keys):
+    supermarket, product = _seed()
+    _deliver(supermarket, product, 10)
+    later = _deliver(supermarket, product, 10, day=date(2026, 9, 2))
+    moved = _return(supermarket, product, 8)
+    waiting = _return(supermarket, product, 5)
+
+    moved.delivery_date = later.delivery_date
+    db.session.commit()
+    returned = {return_item_id: quantity for return_item_id, _, quantity in _allocations()}
+    assert returned == {moved.items[0].id: 8, waiting.items[0].id: 5}
+    assert _matches_full_rematch()
+
+
+def test_smaller_delivery_rematches_the_whole_key(app, enforced_foreign_keys):
+    supermarket, product = _seed()
+    delivery = _deliver(supermarket, product, 10)
+    _return(supermarket, product, 4)
+    _return(supermarket, product, 4)
+    _return(supermarket, product, 4)
+
+    delivery.items[0].quantity = 6
+    db.session.commit()
+    assert _matches_full_rematch()
+    delivery.items[0].quantity = 12
+    db.session.commit()
+    assert _matches_full_rematch()
@@ -0,0 +1,46 @@
+from datetime import date
+
+from sqlalchemy import event, text
+
+from app import search_index
+from app.extensions import db
+from app.models import Delivery, DeliveryItem, Product, Supermarket
+from app.search_index import search
+
+
+def _deliver():
+    supermarket = Supermarket(name='Nomin')
+    product = Product(name='Yogurt', price=10, weight=1.0)
+    db.session.add_all([supermarket, product])
+    db.session.flush()
+    delivery = Delivery(delivery_date=date(2024, 3, 5), supermarket_id=supermarket.id)
+    delivery.items.append(DeliveryItem(product_id=product.id, quantity=2, price=10))
+    db.session.add(delivery)
+    db.session.commit()
+    return delivery
+
+
+def test_create_all_creates_the_search_table(app):
+    delivery = _deliver()
+    result = search(db.session.connection(), 'nomin yog march 2024')
+    assert [(row['kind'], row['id']) for row in result['results']] == [('delivery', delivery.id)]
+
+
+def test_missing_table_is_looked_up_once(app):
+    db.session.execute(text(f'DROP TABLE {search_index.TABLE}'))
+    db.session.commit()
+    search_index._ready_engines.pop(db.engine, None)
+    lookups = []
+
+    def count(conn, cursor, statement, *args):
+        if 'sqlite_master' in statement:
+            lookups.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        _deliver()
+        _deliver()
+        assert search(db.session.connection(), 'nomin')['total'] == 0
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert len(lookups) == 1
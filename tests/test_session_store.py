@@ -0,0 +1,79 @@
+import sqlite3
+import time
+
+from app.extensions import db
+from app.models import User
+
+
+def _add_user():
+    user = User(username='dorj', email='dorj@example.mn')
+    user.set_password('correct horse')
+    db.session.add(user)
+    db.session.commit()
+
+
+def _stored(app):
+    with sqlite3.connect(app.config['SESSION_SQLITE_PATH']) as conn:
+        return dict(conn.execute('SELECT sid, expires FROM session').fetchall())
+
+
+def _sid(client, app):
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    return cookie.value.rsplit('.', 1)[0] if cookie else None
+
+
+def test_login_and_logout_replace_the_session_id(make_app):
+    app = make_app(SESSION_BACKEND='sqlite')
+    _add_user()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['planted'] = True
+    planted = _sid(client, app)
+    assert planted in _stored(app)
+
+    client.post('/auth/login', data={'username': 'dorj', 'password': 'correct horse'})
+    signed_in = _sid(client, app)
+    assert signed_in != planted
+    assert planted not in _stored(app)
+    assert signed_in in _stored(app)
+
+    client.get('/auth/logout')
+    signed_out = _sid(client, app)
+    assert signed_out != signed_in
+    assert signed_in not in _stored(app)
+
+
+def _read_session(make_app, permanent, remaining):
+    """Stored expiry before and after a request that only reads the session"""
+    app = make_app(SESSION_BACKEND='sqlite')
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.permanent = permanent
+        session['seen'] = True
+    # Flask-Login stores '_fresh' on the first request
+    client.get('/auth/login')
+    sid = _sid(client, app)
+    lifetime = app.permanent_session_lifetime.total_seconds()
+    expires = int(time.time() + lifetime * remaining)
+    with sqlite3.connect(app.config['SESSION_SQLITE_PATH']) as conn:
+        conn.execute('UPDATE session SET expires = ? WHERE sid = ?', (expires, sid))
+
+    # The login page reads the session through Flask-Login without changing it
+    client.get('/auth/login')
+    return lifetime, expires, _stored(app)[sid]
+
+
+def test_reading_a_session_extends_its_expiry(make_app):
+    lifetime, _, stored = _read_session(make_app, permanent=True, remaining=0.1)
+    assert stored > time.time() + lifetime - 60
+
+
+def test_reading_a_fresh_session_writes_nothing(make_app):
+    # More than half of the lifetime is left
+    _, expires, stored = _read_session(make_app, permanent=True, remaining=0.9)
+    assert stored == expires
+
+
+def test_reading_a_browser_session_writes_nothing(make_app):
+    _, expires, stored = _read_session(make_app, permanent=False, remaining=0.1)
+    assert stored == expires
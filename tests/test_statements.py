@@ -0,0 +1,53 @@
+from datetime import date, datetime
+
+from app import statements
+from app.scheduling import read_state, write_state
+from app.statements import due_weeks, send_due_statements
+
+# A Wednesday; the last full week is Mon 2026-09-21 - Sun 2026-09-27
+NOW = datetime(2026, 9, 30, 12)
+
+
+def test_only_the_latest_week_without_a_previous_run():
+    assert due_weeks(NOW, None, 0, 6) == [(date(2026, 9, 21), date(2026, 9, 27))]
+
+
+def test_week_is_due_from_its_weekday_and_hour():
+    # Due Monday 2026-09-28 at 06:00
+    assert due_weeks(datetime(2026, 9, 28, 5), date(2026, 9, 14), 0, 6) == []
+    assert due_weeks(datetime(2026, 9, 28, 6), date(2026, 9, 14), 0, 6) == [
+        (date(2026, 9, 21), date(2026, 9, 27)),
+    ]
+    # Due Thursday 2026-10-01
+    assert due_weeks(NOW, date(2026, 9, 14), 3, 6) == []
+
+
+def test_missed_weeks_are_caught_up_in_order():
+    assert due_weeks(NOW, date(2026, 8, 31), 0, 6) == [
+        (date(2026, 9, 7), date(2026, 9, 13)),
+        (date(2026, 9, 14), date(2026, 9, 20)),
+        (date(2026, 9, 21), date(2026, 9, 27)),
+    ]
+    assert due_weeks(NOW, date(2026, 9, 21), 0, 6) == []
+
+
+def test_failed_week_is_retried_before_later_ones(make_app, tmp_path, monkeypatch):
+    state_file = str(tmp_path / 'statements')
+    app = make_app(STATEMENT_STATE_FILE=state_file, STATEMENT_WEEKDAY=0, STATEMENT_HOUR=6)
+    write_state(state_file, '2026-09-07')
+    queued = []
+
+    def send(start, end):
+        if start == date(2026, 9, 21) and not queued.count((start, end)):
+            queued.append((start, end))
+            raise RuntimeError('mail queue unavailable')
+        queued.append((start, end))
+        return 1
+
+    monkeypatch.setattr(statements, 'send_statements', send)
+    assert send_due_statements(app, NOW) == [(date(2026, 9, 14), date(2026, 9, 20))]
+    assert read_state(state_file) == '2026-09-14'
+
+    assert send_due_statements(app, NOW) == [(date(2026, 9, 21), date(2026, 9, 27))]
+    assert read_state(state_file) == '2026-09-21'
+    assert send_due_statements(app, NOW) == []
@@ -0,0 +1,58 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import exc, select
+
+from app.extensions import db
+from app.models import Delivery, DeliveryItem, Product, StockLedger, Subchain, Supermarket
+
+
+def _seed():
+    supermarket = Supermarket(name='Nomin')
+    product = Product(name='Milk', price=10, weight=1.0)
+    db.session.add_all([supermarket, product])
+    db.session.commit()
+    return supermarket, product
+
+
+def _deliver(supermarket, product, quantity, subchain=None):
+    delivery = Delivery(delivery_date=date(2026, 9, 1), supermarket_id=supermarket.id,
+                        subchain_id=subchain.id if subchain else None)
+    delivery.items.append(DeliveryItem(product_id=product.id, quantity=quantity, price=10))
+    db.session.add(delivery)
+    db.session.commit()
+    return delivery
+
+
+def _ledger():
+    return sorted(db.session.execute(
+        select(StockLedger.subchain_id, StockLedger.product_id, StockLedger.delivered)
+    ).all(), key=lambda row: (row[0] or 0, row[1]))
+
+
+def test_deliveries_without_a_subchain_share_one_row(app):
+    supermarket, product = _seed()
+    _deliver(supermarket, product, 4)
+    _deliver(supermarket, product, 6)
+    assert _ledger() == [(None, product.id, 10)]
+
+
+def test_subchains_have_rows_of_their_own(app):
+    supermarket, product = _seed()
+    subchain = Subchain(name='Khan-Uul', supermarket_id=supermarket.id)
+    db.session.add(subchain)
+    db.session.commit()
+    _deliver(supermarket, product, 4)
+    _deliver(supermarket, product, 6, subchain)
+    _deliver(supermarket, product, 1, subchain)
+    assert _ledger() == [(None, product.id, 4), (subchain.id, product.id, 7)]
+
+
+def test_duplicate_rows_without_a_subchain_are_refused(app):
+    supermarket, product = _seed()
+    row = {'supermarket_id': supermarket.id, 'subchain_id': None, 'product_id': product.id,
+           'delivered': 1, 'returned': 0, 'updated_at': datetime(2026, 9, 1)}
+    db.session.execute(StockLedger.__table__.insert(), [row])
+    with pytest.raises(exc.IntegrityError):
+        db.session.execute(StockLedger.__table__.insert(), [row])
+    db.session.rollback()
@@ -0,0 +1,79 @@
+from datetime import date
+
+from flask import template_rendered
+from sqlalchemy import event
+
+from app.extensions import db, fragment_cache
+from app.models import Delivery, DeliveryItem, Product, Subchain, Supermarket, User
+
+
+def _login(app):
+    user = User(username='dorj', email='dorj@example.mn')
+    user.set_password('correct horse')
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'dorj', 'password': 'correct horse'})
+    return client
+
+
+def _deliveries(count):
+    for number in range(count):
+        supermarket = Supermarket(name=f'Supermarket {number}')
+        product = Product(name=f'Product {number}', price=10, weight=1.0)
+        db.session.add_all([supermarket, product])
+        db.session.flush()
+        subchain = Subchain(name=f'Branch {number}', supermarket_id=supermarket.id)
+        db.session.add(subchain)
+        db.session.flush()
+        delivery = Delivery(delivery_date=date(2026, 9, 1 + number),
+                            supermarket_id=supermarket.id, subchain_id=subchain.id)
+        delivery.items.append(DeliveryItem(product_id=product.id, quantity=1, price=10))
+        db.session.add(delivery)
+    db.session.commit()
+
+
+def _selects(app, client, url):
+    """Statements run while a listing page is rendered from scratch"""
+    fragment_cache.clear()
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        response = client.get(url)
+        body = response.get_data(as_text=True)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return len(statements), body
+
+
+def test_streamed_pages_send_template_signals(app):
+    client = _login(app)
+    rendered = []
+
+    def record(sender, template, context, **extra):
+        rendered.append(template.name)
+
+    with template_rendered.connected_to(record, app):
+        client.get('/delivery/').get_data()
+    assert 'delivery/index.html' in rendered
+
+
+def test_listing_queries_do_not_grow_with_rows(app):
+    client = _login(app)
+    _deliveries(2)
+    few, body = _selects(app, client, '/delivery/')
+    assert 'Product 1' in body and 'Branch 1' in body
+
+    _deliveries(6)
+    many, body = _selects(app, client, '/delivery/')
+    assert 'Product 5' in body
+    # The first page also checks the catalog generation once
+    assert many <= few
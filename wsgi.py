@@ -1,9 +1,14 @@
 from app import create_app
+from app.mail_dispatch import mail_dispatcher
 from werkzeug.serving import run_simple
 from config import Config
 
 application = create_app(Config)
 
+# The web server sends queued mail itself unless MAIL_DISPATCH_ASYNC is off
+if application.config['MAIL_DISPATCH_ASYNC']:
+    mail_dispatcher.start(application)
+
 if __name__ == "__main__":
     import os
     import sys